@@ -1,11 +1,53 @@
 __version__ = "1.0.1"
 __author__ = "Levi John Wolf levi.john.wolf@gmail.com"
 
-from . import explorer
-from .remote import APIConnection as _APIConnection
-from .tools import _load_sitekey, set_sitekey
-from .products import *
+import importlib as _importlib
 
-SITEKEY = _load_sitekey()
+# Submodules and their contents are imported on first access, so that
+# `import cenpy` does not pay for pandas, the GIS stack, or the network.
+_submodules = (
+    "cache",
+    "decode",
+    "deferred",
+    "explorer",
+    "geoparser",
+    "jobs",
+    "moe",
+    "planner",
+    "products",
+    "reference",
+    "remote",
+    "search",
+    "sink",
+    "tiger",
+    "tools",
+    "transport",
+)
+_attributes = {
+    "ACS": ("products", "ACS"),
+    "Decennial2010": ("products", "Decennial2010"),
+    "_APIConnection": ("remote", "APIConnection"),
+    "set_sitekey": ("tools", "set_sitekey"),
+    "_load_sitekey": ("tools", "_load_sitekey"),
+}
+__all__ = sorted(
+    name for name in _submodules + tuple(_attributes) if not name.startswith("_")
+)
 
-# __all__ = ['explorer', 'base']
+
+def __getattr__(name):
+    if name in _submodules:
+        return _importlib.import_module("." + name, __name__)
+    elif name in _attributes:
+        module, attribute = _attributes[name]
+        value = getattr(_importlib.import_module("." + module, __name__), attribute)
+    elif name == "SITEKEY":
+        value = __getattr__("_load_sitekey")()
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return list(__all__)
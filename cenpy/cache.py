@@ -0,0 +1,500 @@
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from six import iteritems as diter
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# all on-disk state kept by cenpy (catalog snapshots, reference tables, etc.)
+# lives underneath this directory, unless overridden by the CENPY_CACHE_DIR
+# environment variable.
+_default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "cenpy")
+
+
+def cache_dir(*parts):
+    """
+    Path to a directory inside of cenpy's on-disk cache, creating it if needed.
+
+    Parameters
+    ----------
+    *parts  :   str
+                subdirectories of the cache directory to join onto the root.
+
+    Returns
+    -------
+    str
+        absolute path of the requested directory. The root is read from
+        the CENPY_CACHE_DIR environment variable, or ~/.cache/cenpy if unset.
+    """
+    root = os.environ.get("CENPY_CACHE_DIR", _default_cache_dir)
+    path = os.path.join(os.path.expanduser(root), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class ResponseCache(object):
+    """A persistent cache of HTTP responses, kept in a SQLite database"""
+
+    def __init__(self, path=None, ttl=None, ttls=None, max_size=2**30):
+        """
+        Cache of successful responses to GET requests, keyed by their url with
+        query parameters sorted and the API key removed. Use it by attaching it
+        to cenpy's transport:
+
+        >>> from cenpy import cache, transport
+        >>> transport.get_transport().cache = cache.ResponseCache()
+
+        Parameters
+        ----------
+        path    :   str
+                    location of the SQLite database. (default: responses.sqlite
+                    in the cenpy cache directory)
+        ttl     :   float or None
+                    seconds for which a response stays fresh, for urls not
+                    matched by any pattern in ttls. If None, responses do not expire.
+                    (default: None)
+        ttls    :   dict
+                    mapping from a regular expression, searched for in the
+                    normalized url, to the seconds for which responses to matching
+                    urls stay fresh (or None, for never). The first matching pattern
+                    wins. Patterns provided here are checked before the defaults,
+                    which keep the listing of APIs for a day and leave dataset
+                    vintages (whose data and metadata do not change) and
+                    TIGERweb geometries to expire with `ttl`.
+        max_size:   int
+                    largest total size of the stored responses, in bytes. When
+                    exceeded, the least recently used responses are evicted.
+                    (default: 1GB)
+        """
+        if path is None:
+            path = os.path.join(cache_dir(), "responses.sqlite")
+        self.path = path
+        self.ttl = ttl
+        self.ttls = [(re.compile(k), v) for k, v in diter(ttls or dict())]
+        self.ttls += [(re.compile(k), v) for k, v in _default_ttls]
+        self.max_size = max_size
+        self.hits = self.misses = self.stores = self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT,"
+                " encoding TEXT, content BLOB, size INTEGER, stored REAL, accessed REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS accessed ON responses (accessed)"
+            )
+        (self._size,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+    def __repr__(self):
+        return "ResponseCache({}, {} entries, {:.1f}MB)".format(
+            self.path, len(self), self._size / 2**20
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def normalize(url, params=None):
+        """
+        The key under which the response to a request is stored: the url, with
+        query parameters (including params) sorted, and the API key removed.
+        """
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        if params is not None:
+            query += [(k, str(v)) for k, v in diter(params)]
+        query = sorted((k, v) for k, v in query if k != "key")
+        return urlunsplit(
+            (parts.scheme, parts.netloc.lower(), parts.path, urlencode(query), "")
+        )
+
+    def ttl_for(self, key):
+        """the number of seconds for which the response stored under key is fresh"""
+        for pattern, ttl in self.ttls:
+            if pattern.search(key):
+                return ttl
+        return self.ttl
+
+    def get(self, url, params=None):
+        """
+        Get the stored response to a GET request, if it is stored and fresh.
+
+        Returns
+        -------
+        requests.Response, or None if there is no fresh stored response.
+        """
+        key = self.normalize(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, status, headers, encoding, content, stored"
+                " FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            ttl = self.ttl_for(key)
+            if row is None or (ttl is not None and now - row[5] > ttl):
+                self.misses += 1
+                return None
+            with self._db:
+                self._db.execute(
+                    "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+                )
+            self.hits += 1
+        import requests as r
+        from requests.structures import CaseInsensitiveDict
+
+        response = r.Response()
+        response.url, response.status_code = row[0], row[1]
+        response.headers = CaseInsensitiveDict(json.loads(row[2]))
+        response.encoding = row[3]
+        # mark the body as already read, so that it can be streamed with
+        # iter_content and closed like a response that came off the wire
+        response._content = row[4]
+        response._content_consumed = True
+        response.raw = io.BytesIO(row[4])
+        response.from_cache = True
+        return response
+
+    def set(self, response, url=None, params=None, content=None):
+        """
+        Store the response to a GET request, evicting the least recently used
+        responses if the cache has grown beyond max_size. The response is
+        stored under its normalized url, so the API key is never written to disk.
+
+        Parameters
+        ----------
+        response:   requests.Response
+                    the response to store
+        url     :   str
+                    the url that was requested, if different from the url of
+                    the response (when the request was redirected, for example)
+        params  :   dict
+                    query parameters sent along with url
+        content :   bytes
+                    the body of the response, if it has already been read from
+                    a stream (default: response.content)
+        """
+        key = self.normalize(response.url if url is None else url, params)
+        if content is None:
+            content = response.content
+        headers = {
+            k: v
+            for k, v in diter(response.headers)
+            if k.lower() not in ("content-encoding", "content-length", "set-cookie")
+        }
+        now = time.time()
+        with self._lock, self._db:
+            previous = self._db.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    key,
+                    response.status_code,
+                    json.dumps(headers),
+                    response.encoding,
+                    content,
+                    len(content),
+                    now,
+                    now,
+                ),
+            )
+            self._size += len(content) - (previous[0] if previous else 0)
+            self.stores += 1
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """drop the least recently used responses until the cache fits in max_size"""
+        rows = self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._size <= self.max_size:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def clear(self):
+        """Remove all stored responses."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+            self._size = 0
+
+    @property
+    def stats(self):
+        """
+        counts of hits, misses, stores and evictions since the cache was opened,
+        and the number and total size (in bytes) of stored responses
+        """
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            stores=self.stores,
+            evictions=self.evictions,
+            entries=len(self),
+            size=self._size,
+        )
+
+
+# the listing of APIs changes as datasets are released, but vintages of a
+# dataset (and their metadata) are fixed once published.
+_default_ttls = [(r"://api\.census\.gov/data\.json", 86400)]
+
+
+# the order in which the codes of nested geographies are joined into a GEOID
+_geography_order = [
+    "us",
+    "region",
+    "division",
+    "state",
+    "county",
+    "county subdivision",
+    "place",
+    "tract",
+    "block group",
+    "block",
+]
+
+
+class ResultStore(object):
+    """A persistent store of the values returned by queries, kept cell by cell"""
+
+    def __init__(self, path=None):
+        """
+        Store of the values in query results, keyed by the dataset, its vintage,
+        the level of geography, the GEOID of each row, and the variable. Queries
+        answered through the store only fetch the cells it does not hold yet, so
+        adding a variable to a query made before only requests that variable.
+        Use it by setting it as the store used by every connection:
+
+        >>> from cenpy import cache
+        >>> cache.set_result_store(cache.ResultStore())
+
+        Parameters
+        ----------
+        path    :   str
+                    location of the SQLite database. (default: results.sqlite
+                    in the cenpy cache directory)
+        """
+        if path is None:
+            path = os.path.join(cache_dir(), "results.sqlite")
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cells ("
+                " dataset TEXT, vintage TEXT, level TEXT, geoid TEXT, variable TEXT,"
+                " value TEXT, PRIMARY KEY (dataset, vintage, level, geoid, variable))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS geographies ("
+                " dataset TEXT, vintage TEXT, level TEXT, geoid TEXT, codes TEXT,"
+                " PRIMARY KEY (dataset, vintage, level, geoid))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS scopes ("
+                " dataset TEXT, vintage TEXT, level TEXT, scope TEXT, position INTEGER,"
+                " geoid TEXT, PRIMARY KEY (dataset, vintage, level, scope, position))"
+            )
+
+    def __repr__(self):
+        return "ResultStore({}, {} cells)".format(self.path, len(self))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cells").fetchone()[0]
+
+    @staticmethod
+    def geoid(codes):
+        """
+        The identifier of a geography: the codes of it and the geographies it is
+        nested in, joined from the largest to the smallest, as in a Census GEOID.
+
+        Parameters
+        ----------
+        codes   :   dict
+                    mapping from the name of each level of geography to its code,
+                    like {"state": "04", "county": "019"}
+        """
+        rank = {name: i for i, name in enumerate(_geography_order)}
+        names = sorted(codes, key=lambda name: (rank.get(name, len(rank)), name))
+        return "".join(str(codes[name]) for name in names)
+
+    @staticmethod
+    def scope(geo_unit, geo_filter=None):
+        """
+        The key under which the geographies matched by a query are stored: its
+        for and in clauses, with the in clause sorted.
+        """
+        within = sorted(diter(geo_filter or dict()))
+        return "&".join(
+            ["for=" + geo_unit] + ["in={}:{}".format(k, v) for k, v in within]
+        )
+
+    def members(self, key, scope):
+        """
+        The GEOIDs of the geographies matched by a query, in the order they were
+        returned, or None if the query has not been stored.
+
+        Parameters
+        ----------
+        key     :   tuple
+                    the dataset, vintage, and level of geography
+        scope   :   str
+                    the scope of the query, from ResultStore.scope
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT geoid FROM scopes WHERE dataset = ? AND vintage = ?"
+                " AND level = ? AND scope = ? ORDER BY position",
+                tuple(key) + (scope,),
+            ).fetchall()
+        return [row[0] for row in rows] if rows else None
+
+    def geographies(self, key, geoids):
+        """
+        The codes of the geographies with the given GEOIDs, as a dictionary
+        from each stored GEOID to its codes, in the order the API returned them.
+        """
+        found = dict()
+        for chunk in _chunks(list(geoids)):
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT geoid, codes FROM geographies WHERE dataset = ?"
+                    " AND vintage = ? AND level = ? AND geoid IN ({})".format(
+                        ",".join("?" * len(chunk))
+                    ),
+                    tuple(key) + tuple(chunk),
+                ).fetchall()
+            found.update((geoid, json.loads(codes)) for geoid, codes in rows)
+        return found
+
+    def cells(self, key, geoids, variables):
+        """
+        The stored values of variables for the geographies with the given GEOIDs.
+
+        Returns
+        -------
+        dict mapping each stored (geoid, variable) pair to its value, which is
+        the string returned by the API, or None if it was null
+        """
+        variables = list(variables)
+        found = dict()
+        for chunk in _chunks(list(geoids), 900 - len(variables)):
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT geoid, variable, value FROM cells WHERE dataset = ?"
+                    " AND vintage = ? AND level = ? AND geoid IN ({})"
+                    " AND variable IN ({})".format(
+                        ",".join("?" * len(chunk)), ",".join("?" * len(variables))
+                    ),
+                    tuple(key) + tuple(chunk) + tuple(variables),
+                ).fetchall()
+            found.update(((geoid, variable), value) for geoid, variable, value in rows)
+        return found
+
+    def put(self, key, header, rows, requested, scope=None):
+        """
+        Store the values in a table returned by the API.
+
+        Parameters
+        ----------
+        key         :   tuple
+                        the dataset, vintage, and level of geography
+        header      :   list of str
+                        names of the columns in the table
+        rows        :   list of lists
+                        the rows of the table, holding the strings returned by the API
+        requested   :   list of str
+                        the columns requested in the query. The other columns
+                        are the codes of each row's geography.
+        scope       :   str
+                        the scope of the query, from ResultStore.scope. If given,
+                        the geographies in the table are stored as its members.
+        """
+        requested = set(requested)
+        geo = [i for i, name in enumerate(header) if name not in requested]
+        values = [i for i, name in enumerate(header) if name in requested]
+        cells, geographies, members = [], [], []
+        for position, row in enumerate(rows):
+            codes = {header[i]: row[i] for i in geo}
+            geoid = self.geoid(codes)
+            geographies.append(tuple(key) + (geoid, json.dumps(codes)))
+            members.append(tuple(key) + (scope, position, geoid))
+            cells.extend(tuple(key) + (geoid, header[i], row[i]) for i in values)
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?, ?)", cells
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO geographies VALUES (?, ?, ?, ?, ?)", geographies
+            )
+            if scope is not None:
+                self._db.execute(
+                    "DELETE FROM scopes WHERE dataset = ? AND vintage = ?"
+                    " AND level = ? AND scope = ?",
+                    tuple(key) + (scope,),
+                )
+                self._db.executemany(
+                    "INSERT INTO scopes VALUES (?, ?, ?, ?, ?, ?)", members
+                )
+
+    def clear(self):
+        """Remove all stored results."""
+        with self._lock, self._db:
+            for table in ("cells", "geographies", "scopes"):
+                self._db.execute("DELETE FROM {}".format(table))
+
+
+def _chunks(values, size=900):
+    """split values into lists short enough to be bound as SQLite parameters"""
+    size = max(size, 1)
+    return [values[i : i + size] for i in range(0, len(values), size)]
+
+
+_result_store = None
+
+
+def get_result_store():
+    """
+    The ResultStore through which every APIConnection answers queries.
+
+    Returns
+    -------
+    the shared ResultStore, or None if query results are not stored (the default)
+    """
+    return _result_store
+
+
+def set_result_store(store):
+    """
+    Replace the ResultStore through which every APIConnection answers queries.
+
+    Parameters
+    ----------
+    store   :   ResultStore or None
+                the store to use from now on, or None to stop storing results.
+
+    Returns
+    -------
+    the ResultStore that was replaced, so that it can be restored later
+    """
+    global _result_store
+    previous = _result_store
+    _result_store = store
+    return previous
@@ -0,0 +1,614 @@
+"""
+Decode tables returned by the Census Data API into typed columns.
+
+The API returns every value as a JSON string. Rather than building a table of
+Python strings and converting it afterwards, each column is decoded once, into
+the most compact dtype that holds it: integers into int32 (or int64 if needed),
+decimals into float64, geography codes into categoricals, and everything else
+into strings.
+
+Responses can also be decoded as they stream in. Rows are parsed from the body
+of the response incrementally and gathered in batches, and each column of a
+batch is packed into a typed array (or a categorical, for geography codes) as
+soon as it is parsed, so neither the full text of the response nor a string
+for each of its values is ever held in memory.
+"""
+
+import codecs
+import json
+import re
+from itertools import islice
+import numpy as np
+import pandas as pd
+
+_int32 = np.iinfo(np.int32)
+
+# how each predicateType listed in a dataset's variables is decoded
+_predicate_kinds = {"int": "int", "long": "int", "float": "float", "double": "float"}
+
+# a whole table of variables, requested as get=group(B01001)
+_group = re.compile(r"^group\((.+)\)$")
+
+
+def requested_columns(header, requested=(), variables=None):
+    """
+    Find the columns of a table that were requested in the query, rather than
+    added to each row by the API to identify its geography.
+
+    Parameters
+    ----------
+    header      :   list of str
+                    names of the columns in the table
+    requested   :   list of str
+                    the columns requested in the query. Entries like
+                    "group(B01001)" request every variable in a group, along
+                    with the GEO_ID and NAME of each row.
+    variables   :   pandas.DataFrame or None
+                    the variables of the dataset, whose group column lists the
+                    variables in each group. If None, or if a column is not listed,
+                    the variables of a group are those named like "B01001_*".
+
+    Returns
+    -------
+    list of the names in header that were requested
+    """
+    groups = set()
+    for name in requested:
+        match = _group.match(name)
+        if match is not None:
+            groups.add(match.group(1))
+    requested = set(requested)
+    if not groups:
+        return [name for name in header if name in requested]
+    members = dict()
+    if variables is not None and "group" in variables.columns:
+        members = variables["group"].to_dict()
+    found = []
+    for name in header:
+        group = members.get(name, name.split("_")[0])
+        if name in requested or group in groups or name in ("GEO_ID", "NAME"):
+            found.append(name)
+    return found
+
+
+def column_kinds(header, requested=(), variables=None):
+    """
+    Decide how to decode each column of a table.
+
+    Parameters
+    ----------
+    header      :   list of str
+                    names of the columns in the table
+    requested   :   list of str
+                    the columns requested in the query, as in requested_columns.
+                    Other columns are the geographies the API adds to each row,
+                    and are decoded as codes.
+    variables   :   pandas.DataFrame or None
+                    the variables of the dataset, whose predicateType describes
+                    the type of each column. If None, or if a column is not listed,
+                    its type is inferred from its values.
+
+    Returns
+    -------
+    list with one entry per column, each "int", "float", "string", "geo",
+    or None, if the type should be inferred.
+    """
+    requested = set(requested_columns(header, requested, variables))
+    types = None
+    if variables is not None and "predicateType" in variables.columns:
+        types = variables["predicateType"]
+    kinds = []
+    for name in header:
+        if name not in requested:
+            kinds.append("geo")
+        elif types is not None and name in types.index:
+            kinds.append(_predicate_kinds.get(types[name], "string"))
+        else:
+            kinds.append(None)
+    return kinds
+
+
+def decode_column(values, kind=None):
+    """
+    Decode a column of values returned by the API.
+
+    Parameters
+    ----------
+    values  :   numpy.ndarray
+                object array of the strings (or None, for nulls) in the column
+    kind    :   str or None
+                how to decode the column: "int", "float", "string", "geo", or None
+                to decode numbers as numbers and leave anything else as strings.
+                Numbers written with leading zeros are codes, and are never inferred
+                to be numbers.
+
+    Returns
+    -------
+    numpy.ndarray or pandas.Categorical of the decoded column
+    """
+    if kind == "geo":
+        return pd.Categorical(values)
+    if kind == "string" or len(values) == 0:
+        return values
+    if kind is None:
+        try:
+            numbers = pd.to_numeric(values)
+        except (ValueError, TypeError):
+            return values
+        if _has_leading_zeros(values):
+            return values
+    else:
+        numbers = pd.to_numeric(values, errors="coerce")
+    return _narrow(numbers, kind)
+
+
+def _narrow(numbers, kind=None):
+    """pack the numbers decoded from a column into the most compact dtype for its kind"""
+    numbers = np.asarray(numbers)
+    if kind == "float":
+        return numbers.astype(np.float64, copy=False)
+    if numbers.dtype.kind == "f":
+        # integers with nulls, or decimals in a column inferred as numbers
+        finite = numbers[~np.isnan(numbers)]
+        if kind is None or finite.size < numbers.size:
+            return numbers
+        if not np.array_equal(finite, np.round(finite)):
+            return numbers
+    if numbers.size and numbers.min() >= _int32.min and numbers.max() <= _int32.max:
+        return numbers.astype(np.int32)
+    return numbers.astype(np.int64)
+
+
+def decode_table(
+    header,
+    rows,
+    requested=(),
+    variables=None,
+    convert=True,
+    output="pandas",
+    dtype_backend=None,
+):
+    """
+    Build a dataframe from the header and rows of a table returned by the API.
+
+    Parameters
+    ----------
+    header      :   list of str
+                    names of the columns
+    rows        :   list of lists
+                    values in each row of the table
+    requested   :   list of str
+                    the columns requested in the query. See column_kinds.
+    variables   :   pandas.DataFrame or None
+                    the variables of the dataset. See column_kinds.
+    convert     :   bool
+                    whether to decode columns into typed columns, or leave all
+                    columns as strings. (default: True)
+    output      :   {"pandas", "arrow"}
+                    whether to build a pandas.DataFrame or a pyarrow.Table.
+                    Arrow tables are built from the decoded columns directly, and
+                    geography codes are dictionary-encoded. (default: "pandas")
+    dtype_backend:  {None, "numpy_nullable", "pyarrow"}
+                    for pandas output, the kind of dtypes to use, as in
+                    pandas.DataFrame.convert_dtypes. If None, numpy dtypes and
+                    categoricals are used. Other backends need pandas 2.0 or
+                    newer. (default: None)
+
+    Returns
+    -------
+    pandas.DataFrame or pyarrow.Table
+    """
+    table = _to_array(header, rows)
+    kinds = column_kinds(header, requested, variables)
+    columns = []
+    for i, kind in enumerate(kinds):
+        column = table[:, i]
+        columns.append(decode_column(column, kind) if convert else column)
+    return _assemble(header, columns, output, dtype_backend)
+
+
+def read_table(
+    chunks,
+    requested=(),
+    variables=None,
+    convert=True,
+    batch_size=10000,
+    output="pandas",
+    dtype_backend=None,
+):
+    """
+    Build a dataframe from a table returned by the API, as it streams in.
+
+    Parameters
+    ----------
+    chunks      :   iterable of str
+                    pieces of the text of the response, like those from iter_text()
+    requested   :   list of str
+                    the columns requested in the query. See column_kinds.
+    variables   :   pandas.DataFrame or None
+                    the variables of the dataset. See column_kinds.
+    convert     :   bool
+                    whether to decode columns into typed columns, or leave all
+                    columns as strings. (default: True)
+    batch_size  :   int
+                    number of rows parsed before they are packed into columns.
+                    (default: 10000)
+    output      :   {"pandas", "arrow"}
+                    See decode_table.
+    dtype_backend:  {None, "numpy_nullable", "pyarrow"}
+                    See decode_table.
+
+    Returns
+    -------
+    pandas.DataFrame or pyarrow.Table, the same as decode_table() on the
+    parsed table
+    """
+    header, buffers = None, None
+    for header, batch in iter_rows(chunks, batch_size=batch_size):
+        if buffers is None:
+            kinds = column_kinds(header, requested, variables)
+            buffers = [_ColumnBuffer(kind, convert) for kind in kinds]
+        table = _to_array(header, batch)
+        for i, buffer in enumerate(buffers):
+            buffer.append(table[:, i])
+    columns = [buffer.finish() for buffer in buffers]
+    return _assemble(header, columns, output, dtype_backend)
+
+
+class _ColumnBuffer(object):
+    """
+    The batches of one column of a table read by read_table, each packed as it
+    arrives. Geography codes are kept as integer codes into categories shared by
+    every batch. Batches of a column whose type is inferred are packed into numbers
+    until a batch turns out not to be numeric, after which they are kept as strings.
+    """
+
+    def __init__(self, kind, convert=True):
+        self.kind = kind if convert else "string"
+        self.batches = []
+        # for geography codes, the integer code of each distinct value seen so far
+        self.categories = dict()
+        # for inferred columns, whether every batch so far has been numeric
+        self.numeric = True
+
+    def append(self, values):
+        if self.kind == "geo":
+            values = self._encode(values)
+        elif self.kind in ("int", "float"):
+            values = np.asarray(pd.to_numeric(values, errors="coerce"))
+        elif self.kind is None and self.numeric:
+            values, self.numeric = _pack(values)
+        if values.dtype == object:
+            # copy strings out of the batch, so the rest of it can be freed
+            values = values.copy()
+        self.batches.append(values)
+
+    def finish(self):
+        """the decoded column, the same as decode_column() on all of its values"""
+        if sum(len(batch) for batch in self.batches) == 0:
+            return decode_column(np.empty(0, dtype=object), self.kind)
+        if self.kind == "geo":
+            return self._decode_categories()
+        if self.kind == "string":
+            return np.concatenate(self.batches)
+        if self.kind is not None:
+            return _narrow(np.concatenate(self.batches), self.kind)
+        if not self.numeric:
+            return np.concatenate(
+                [b if b.dtype == object else _unpack(b) for b in self.batches]
+            )
+        return _narrow(
+            np.concatenate(
+                [
+                    np.asarray(pd.to_numeric(b)) if b.dtype == object else b
+                    for b in self.batches
+                ]
+            )
+        )
+
+    def _encode(self, values):
+        """codes of a batch of geographies, adding values not seen before to the categories"""
+        codes, uniques = pd.factorize(values)
+        categories = self.categories
+        known = np.array(
+            [categories.setdefault(value, len(categories)) for value in uniques],
+            dtype=np.int32,
+        )
+        if not len(known):
+            return codes.astype(np.int32)
+        return np.where(codes < 0, -1, known[codes]).astype(np.int32)
+
+    def _decode_categories(self):
+        """a categorical of the batches, with sorted categories like pd.Categorical"""
+        values = np.array(list(self.categories), dtype=object)
+        order = np.argsort(values, kind="stable")
+        ranks = np.empty(len(order), dtype=np.int32)
+        ranks[order] = np.arange(len(order), dtype=np.int32)
+        codes = np.concatenate(self.batches)
+        if len(order):
+            codes = np.where(codes < 0, -1, ranks[codes])
+        return pd.Categorical.from_codes(codes, categories=pd.Index(values[order]))
+
+
+def _pack(values):
+    """
+    pack a batch of a column whose type is inferred into numbers, if they can be
+    written back as exactly the strings they were decoded from. Returns the batch,
+    and whether its values are numbers, even if they are kept as strings.
+    """
+    try:
+        numbers = np.asarray(pd.to_numeric(values))
+    except (ValueError, TypeError):
+        return values, False
+    if _has_leading_zeros(values):
+        return values, False
+    if numbers.dtype == object or not np.array_equal(_unpack(numbers), values):
+        return values, True
+    return numbers, True
+
+
+def _unpack(numbers):
+    """write numbers packed by _pack back as strings, with nulls as None"""
+    if numbers.dtype.kind != "f":
+        return numbers.astype(str).astype(object)
+    nulls = np.isnan(numbers)
+    finite = numbers[~nulls]
+    if np.array_equal(finite, np.round(finite)) and np.all(np.abs(finite) < 2**63):
+        strings = np.where(nulls, 0, numbers).astype(np.int64).astype(str)
+    else:
+        strings = numbers.astype(str)
+    strings = strings.astype(object)
+    strings[nulls] = None
+    return strings
+
+
+def iter_tables(
+    chunks,
+    requested=(),
+    variables=None,
+    convert=True,
+    batch_size=10000,
+    output="pandas",
+    dtype_backend=None,
+):
+    """
+    Decode a table returned by the API in batches of rows, as it streams in.
+    Arguments are the same as read_table().
+
+    Returns
+    -------
+    generator of pandas.DataFrame (or pyarrow.Table), one for each batch of
+    at most batch_size rows. Columns are decoded separately in each batch,
+    so columns whose type is inferred may differ in type between batches.
+    """
+    for header, batch in iter_rows(chunks, batch_size=batch_size):
+        yield decode_table(
+            header,
+            batch,
+            requested,
+            variables,
+            convert=convert,
+            output=output,
+            dtype_backend=dtype_backend,
+        )
+
+
+def iter_rows(chunks, batch_size=10000):
+    """
+    Parse a JSON array of arrays incrementally, from pieces of its text.
+
+    Parameters
+    ----------
+    chunks      :   iterable of str
+                    pieces of the text of the table
+    batch_size  :   int
+                    number of rows in each batch (default: 10000)
+
+    Returns
+    -------
+    generator of (header, rows) tuples, where header is the first array in the
+    table and rows is a list of at most batch_size of the arrays after it. At
+    least one tuple is generated, even if the table has no rows.
+
+    Raises
+    ------
+    ValueError (a json.JSONDecodeError) if the text is not a JSON array of arrays.
+    """
+    arrays = _iter_arrays(chunks)
+    try:
+        header = next(arrays)
+    except StopIteration:
+        raise json.JSONDecodeError("Expecting a header row", "", 0)
+    batch = list(islice(arrays, batch_size))
+    yield header, batch
+    while len(batch) == batch_size:
+        batch = list(islice(arrays, batch_size))
+        if batch:
+            yield header, batch
+
+
+def iter_text(response, chunk_size=2**16):
+    """
+    The text of a requests.Response, in pieces, decoded incrementally so that
+    multi-byte characters split between pieces are decoded correctly.
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(
+        errors="replace"
+    )
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def _iter_arrays(chunks):
+    """generate each array in a JSON array of arrays, read from pieces of its text"""
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer, position, opened = "", 0, False
+    while True:
+        # skip the whitespace and commas between arrays
+        end = len(buffer)
+        while position < end and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < end and not opened:
+            if buffer[position] != "[":
+                raise json.JSONDecodeError("Expecting '['", buffer, position)
+            opened = True
+            position += 1
+            continue
+        if position < end and buffer[position] == "]":
+            # finish reading the text, so that its source is read to the end
+            for _ in chunks:
+                pass
+            return
+        if position < end:
+            try:
+                array, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the array may be cut off at the end of the buffer
+                pass
+            else:
+                if not isinstance(array, list):
+                    raise json.JSONDecodeError("Expecting an array", buffer, position)
+                yield array
+                continue
+        chunk = next(chunks, None)
+        if chunk is None:
+            if position < end:
+                decoder.raw_decode(buffer, position)
+            raise json.JSONDecodeError("Unterminated table", buffer, position)
+        buffer, position = buffer[position:] + chunk, 0
+
+
+def convert_frame(frame, output="pandas", dtype_backend=None):
+    """
+    Convert a dataframe built by cenpy into the requested output.
+
+    Parameters
+    ----------
+    frame       :   pandas.DataFrame or geopandas.GeoDataFrame
+                    the table to convert
+    output      :   {"pandas", "arrow"}
+                    whether to return a dataframe or a pyarrow.Table. Geometries
+                    are encoded as WKB, with GeoArrow metadata, which needs
+                    geopandas 1.0 or newer. (default: "pandas")
+    dtype_backend:  {None, "numpy_nullable", "pyarrow"}
+                    for pandas output, the kind of dtypes to use, as in
+                    pandas.DataFrame.convert_dtypes, which needs pandas 2.0 or
+                    newer. (default: None)
+
+    Returns
+    -------
+    the converted table
+    """
+    _check_output(output, dtype_backend)
+    if output == "arrow":
+        pa = _import_pyarrow()
+        if getattr(frame, "_geometry_column_name", None) is not None:
+            if not hasattr(frame, "to_arrow"):
+                import geopandas
+
+                raise ImportError(
+                    'output="arrow" needs geopandas 1.0 or newer to encode'
+                    " geometries, but geopandas {} is installed.".format(
+                        geopandas.__version__
+                    )
+                )
+            return pa.table(frame.to_arrow(index=False, geometry_encoding="WKB"))
+        return pa.Table.from_pandas(frame, preserve_index=False)
+    if dtype_backend is None:
+        return frame
+    # geometries have no nullable or Arrow-backed counterpart, so are kept as-is
+    geometry = getattr(frame, "_geometry_column_name", None)
+    frame = frame.copy()
+    for name in frame.columns:
+        if name != geometry:
+            frame[name] = frame[name].convert_dtypes(dtype_backend=dtype_backend)
+    return frame
+
+
+def _assemble(header, columns, output="pandas", dtype_backend=None):
+    """build the requested kind of table from decoded columns"""
+    _check_output(output, dtype_backend)
+    if len(set(header)) < len(header):
+        # a column requested both by name and in a group() is returned twice
+        first = dict()
+        for i, name in enumerate(header):
+            first.setdefault(name, i)
+        keep = sorted(first.values())
+        header, columns = [header[i] for i in keep], [columns[i] for i in keep]
+    if output == "arrow" or dtype_backend == "pyarrow":
+        pa = _import_pyarrow()
+        table = pa.Table.from_arrays([_to_arrow(pa, c) for c in columns], header)
+        if output == "arrow":
+            return table
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    frame = pd.DataFrame(dict(enumerate(columns)), copy=False)
+    frame.columns = header
+    if dtype_backend is not None:
+        frame = frame.convert_dtypes(dtype_backend=dtype_backend)
+    return frame
+
+
+def _to_arrow(pa, column):
+    """convert a decoded column into an arrow array, making NaN and None null"""
+    if isinstance(column, pd.Categorical):
+        return pa.DictionaryArray.from_arrays(
+            pa.array(column.codes, mask=column.codes < 0),
+            pa.array(np.asarray(column.categories, dtype=object), type=pa.string()),
+        )
+    if column.dtype == object:
+        return pa.array(column, type=pa.string(), from_pandas=True)
+    return pa.array(column, from_pandas=True)
+
+
+def _check_output(output, dtype_backend):
+    if output not in ("pandas", "arrow"):
+        raise ValueError('output must be "pandas" or "arrow", not {!r}'.format(output))
+    if dtype_backend not in (None, "numpy_nullable", "pyarrow"):
+        raise ValueError(
+            'dtype_backend must be None, "numpy_nullable", or "pyarrow",'
+            " not {!r}".format(dtype_backend)
+        )
+    if dtype_backend is not None and _major_version(pd.__version__) < 2:
+        raise ImportError(
+            "dtype_backend={!r} needs pandas 2.0 or newer, but pandas {} is"
+            ' installed. Upgrade pandas, or use output="arrow".'.format(
+                dtype_backend, pd.__version__
+            )
+        )
+
+
+def _major_version(version):
+    """the major version in a version string, like 2 for 2.1.0rc1"""
+    return int(re.match(r"\d+", version).group())
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "pyarrow is required for Arrow output, and must be installed in order"
+            ' to use output="arrow" or dtype_backend="pyarrow". It can be installed'
+            " with pip (pip install pyarrow) or from the conda-forge channel."
+        )
+    return pyarrow
+
+
+def _to_array(header, rows):
+    """pack rows into a two-dimensional object array"""
+    table = np.empty((len(rows), len(header)), dtype=object)
+    if rows:
+        table[:] = rows
+    return table
+
+
+def _has_leading_zeros(values):
+    """whether any value is written with a leading zero, like the code '04'"""
+    strings = pd.Series(values, dtype=object).dropna().astype(str)
+    return bool(strings.str.match(r"-?0\d").any())
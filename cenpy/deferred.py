@@ -0,0 +1,201 @@
+"""
+Build queries now, and run them later.
+
+A Query names the variables, geographies, and predicates of a request to a
+dataset without sending it. Queries are only run when collected, and queries
+collected together that ask the same dataset about the same geographies are
+merged into one wide query. The merged query is planned once, split into
+chunks of columns once, and answered once (from the result store or response
+cache, if one is set), and each query is then given its own columns.
+
+>>> population = cxn.select("B01001_001E").where(state="04").at("tract")
+>>> income = cxn.select("B19013_001E").where(state="04").at("tract")
+>>> population, income = deferred.collect([population, income])
+"""
+
+import pandas as pd
+from six import iteritems as diter
+from .decode import convert_frame, requested_columns
+from .planner import Planner, _codes, _same_level
+
+
+class Query(object):
+    """A query of a Census API dataset, run only when it is collected"""
+
+    def __init__(self, cxn, cols=(), level=None, codes="*", where=None):
+        """
+        Queries are usually started with the select method of an APIConnection
+        or a product, then refined with the methods below.
+        Each method returns a new Query, leaving the original unchanged.
+
+        Parameters
+        ----------
+        cxn     :   cenpy.remote.APIConnection
+                    the connection to the dataset to query
+        cols    :   list of str
+                    variables to request
+        level   :   str
+                    level of geography to request, like "tract"
+        codes   :   str or list of str
+                    codes of the geographies at `level` to request (default: "*")
+        where   :   dict
+                    codes of the enclosing geographies to restrict the query to,
+                    and values of any other predicates of the query
+        """
+        self.cxn = cxn
+        self.cols = list(cols)
+        self.level = level
+        self.codes = _codes(codes)
+        self.filters = dict() if where is None else dict(where)
+
+    def __repr__(self):
+        return "Query({}, {}, at={}, where={})".format(
+            self.cxn.identifier, self.cols, self.level, self.filters
+        )
+
+    def _replace(self, **changes):
+        state = dict(
+            cols=self.cols, level=self.level, codes=self.codes, where=self.filters
+        )
+        state.update(changes)
+        return Query(self.cxn, **state)
+
+    def select(self, *cols):
+        """add variables to the query. Each argument is a name or a list of names"""
+        added = []
+        for col in cols:
+            added.extend([col] if isinstance(col, str) else col)
+        return self._replace(
+            cols=self.cols + [col for col in added if col not in self.cols]
+        )
+
+    def where(self, **filters):
+        """
+        restrict the query to the given codes of enclosing geographies, like
+        state="04", or to the given values of other predicates of the dataset.
+        Codes may be strings, lists of codes, or "*".
+        """
+        return self._replace(where=dict(self.filters, **filters))
+
+    def at(self, level, codes="*"):
+        """request the geographies at `level`, or only those with the given codes"""
+        return self._replace(level=level, codes=codes)
+
+    def plan(self):
+        """
+        The queries needed to run this Query on its own, as (cols, geo_unit,
+        geo_filter) specifications for APIConnection.query_many. See Planner.plan
+        """
+        within, _ = self._split()
+        return _plan(self.cxn, self.cols, self.level, self.codes, within)
+
+    def collect(self, concurrency=8, **kwargs):
+        """
+        Run the query. See collect() to run many queries at once.
+
+        Returns
+        -------
+        pandas.DataFrame, or a pyarrow.Table for output="arrow"
+        """
+        return collect([self], concurrency=concurrency, **kwargs)[0]
+
+    def _split(self):
+        """separate the filters on enclosing geographies from other predicates"""
+        levels = [rule["name"] for rule in Planner(self.cxn).levels]
+        within, predicates = dict(), dict()
+        for name, value in diter(self.filters):
+            matched = [level for level in levels if _same_level(level, name)]
+            if matched:
+                within[matched[0]] = _codes(value)
+            else:
+                predicates[name] = value
+        return within, predicates
+
+    def _key(self):
+        """queries with the same key ask the same dataset about the same geographies"""
+        within, predicates = self._split()
+        return (
+            id(self.cxn),
+            self.level,
+            self.codes,
+            tuple(sorted(diter(within))),
+            tuple(sorted((k, str(v)) for k, v in diter(predicates))),
+        )
+
+
+def collect(queries, concurrency=8, **kwargs):
+    """
+    Run many queries at once, merging those that ask the same dataset about the
+    same geographies into one query for all of their variables.
+
+    Parameters
+    ----------
+    queries     :   list of Query
+                    the queries to run
+    concurrency :   int
+                    the maximum number of requests in flight at once. (default: 8)
+    **kwargs    :   additional arguments passed to every query, like
+                    convert_numeric, output, or dtype_backend. See
+                    APIConnection.query
+
+    Returns
+    -------
+    list with the result of each query, in the order of `queries`
+    """
+    output = kwargs.pop("output", "pandas")
+    dtype_backend = kwargs.pop("dtype_backend", None)
+    merged = dict()
+    for query in queries:
+        if query.level is None:
+            raise ValueError(
+                "No level of geography was given for {}. Use Query.at()".format(query)
+            )
+        if not query.cols:
+            raise ValueError("No variables were selected for {}".format(query))
+        merged.setdefault(query._key(), []).append(query)
+
+    # plan each merged query for all the variables of the queries it answers
+    columns, planned = dict(), dict()
+    for key, group in diter(merged):
+        cols = []
+        for query in group:
+            cols.extend(col for col in query.cols if col not in cols)
+        within, predicates = group[0]._split()
+        columns[key] = cols
+        specs = _plan(group[0].cxn, cols, group[0].level, group[0].codes, within)
+        planned.setdefault(id(group[0].cxn), []).extend(
+            (key, dict(cols=c, geo_unit=u, geo_filter=f, **predicates))
+            for c, u, f in specs
+        )
+
+    # run the planned queries for each dataset together
+    results = dict()
+    for entries in planned.values():
+        cxn = merged[entries[0][0]][0].cxn
+        found = cxn.query_many(
+            [spec for _, spec in entries], concurrency=concurrency, **kwargs
+        )
+        for (key, _), result in zip(entries, found):
+            results.setdefault(key, []).append(result)
+
+    # and give each query its own variables, with the geography of each row
+    answers = []
+    for query in queries:
+        key = query._key()
+        frames = results[key]
+        frame = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        header = list(frame.columns)
+        variables = query.cxn._decoding_variables(columns[key])
+        everything = requested_columns(header, columns[key], variables)
+        names = requested_columns(header, query.cols, variables)
+        names += [col for col in header if col not in everything]
+        answers.append(convert_frame(frame[names].copy(), output, dtype_backend))
+    return answers
+
+
+def _plan(cxn, cols, level, codes, within):
+    """specifications of the queries for cols at the geographies of a level"""
+    within = dict(within)
+    if codes != "*":
+        within[level] = codes
+    return Planner(cxn).specs(cols, level, within)
@@ -1,37 +1,199 @@
-import requests as r
 from json import JSONDecodeError
 from six import iteritems as diter
+from warnings import warn
 import pandas as pd
+import json
 import os
 import six
+import time
+from . import reference as _reference
 
 if six.PY3:
     unicode = str
 
 fp = os.path.dirname(os.path.realpath(__file__))
 
-resp = raw_APIs = r.get("https://api.census.gov/data.json")
-try:
-    resp.raise_for_status()
-    raw_APIs = resp.json()["dataset"]
-    APIs = {
-        entry["identifier"]
-        .split("id")[-1]
-        .lstrip("/"): {
-            key: value for key, value in diter(entry) if key != entry["identifier"]
+_catalog_url = "https://api.census.gov/data.json"
+
+
+class Catalog(object):
+    """A lazily-loaded listing of the Census Data APIs, kept as an on-disk snapshot"""
+
+    def __init__(self, url=_catalog_url, path=None, ttl=86400, offline=None):
+        """
+        Listing of the datasets available from the Census Data API. Nothing is
+        fetched until the listing is first used. Then, a snapshot on disk is
+        used if it is younger than `ttl`, and the API endpoint is only
+        contacted if the snapshot is missing or stale.
+
+        Parameters
+        ----------
+        url     :   str
+                    url of the data.json listing of Census Data APIs.
+                    (default: https://api.census.gov/data.json)
+        path    :   str
+                    where to keep the snapshot of the listing. By default, this
+                    is data.json in the cenpy cache directory (see cenpy.cache).
+        ttl     :   int or float
+                    number of seconds for which a snapshot is considered fresh.
+                    (default: 86400, one day)
+        offline :   bool
+                    whether to never contact the API endpoint, resolving only from
+                    the snapshot. If not provided, this is set when the CENPY_OFFLINE
+                    environment variable is set to something other than "0" or "".
+        """
+        self.url = url
+        self._path = path
+        self.ttl = ttl
+        if offline is None:
+            offline = os.environ.get("CENPY_OFFLINE", "") not in ("", "0")
+        self.offline = offline
+        self._raw = None
+        self._apis = None
+
+    def __repr__(self):
+        state = "unloaded" if self._raw is None else "{} datasets".format(len(self))
+        return "Catalog of {} ({})".format(self.url, state)
+
+    def __getitem__(self, identifier):
+        return self.apis[identifier]
+
+    def __contains__(self, identifier):
+        return identifier in self.apis
+
+    def __iter__(self):
+        return iter(self.apis)
+
+    def __len__(self):
+        return len(self.apis)
+
+    @property
+    def path(self):
+        """location of the on-disk snapshot of the listing"""
+        if self._path is None:
+            from .cache import cache_dir
+
+            self._path = os.path.join(cache_dir(), "data.json")
+        return self._path
+
+    @property
+    def raw(self):
+        """the dataset entries of the listing, as provided by the API"""
+        if self._raw is None:
+            self._load()
+        return self._raw
+
+    @property
+    def apis(self):
+        """the dataset entries of the listing, keyed by their shortcode"""
+        if self._apis is None:
+            self._load()
+        return self._apis
+
+    @property
+    def age(self):
+        """number of seconds since the snapshot was written, or None if there is no snapshot"""
+        try:
+            return time.time() - os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def refresh(self):
+        """
+        Fetch the listing from the API endpoint and overwrite the snapshot on disk.
+
+        Returns
+        -------
+        this Catalog, with the freshly-fetched listing loaded
+        """
+        if self.offline:
+            raise RuntimeError(
+                "Cannot refresh the catalog of Census APIs in offline mode."
+                " Set offline=False on this Catalog to contact {}".format(self.url)
+            )
+        import requests as r
+        from . import transport
+
+        resp = transport.get(self.url)
+        try:
+            resp.raise_for_status()
+            raw = resp.json()["dataset"]
+        except r.HTTPError:
+            raise r.HTTPError(
+                "The main Census API Endpoint ({url}) is not available."
+                " Try visiting {url} in a web browser to verify connectivity.".format(
+                    url=self.url
+                ),
+                response=resp,
+            )
+        except (JSONDecodeError, KeyError):
+            raise JSONDecodeError(
+                "The main Census API Endpoint ({url}) returned malformed content."
+                " Try visiting {url} in a web browser to verify connectivity.".format(
+                    url=self.url
+                ),
+                resp.text,
+                0,
+            )
+        self._write_snapshot(raw)
+        self._set(raw)
+        return self
+
+    def _load(self):
+        age = self.age
+        if age is not None and (self.offline or age < self.ttl):
+            return self._read_snapshot()
+        if self.offline:
+            raise FileNotFoundError(
+                "No snapshot of the Census API listing was found at {} and the"
+                " catalog is in offline mode. Run cenpy.explorer.catalog.refresh()"
+                " while connected to build one.".format(self.path)
+            )
+        try:
+            self.refresh()
+        except (OSError, ValueError):
+            # requests' exceptions are OSErrors, and decoding errors are ValueErrors.
+            if age is None:
+                raise
+            warn(
+                "Could not refresh the listing of Census APIs from {}. Using a"
+                " snapshot that is {:.0f} hours old.".format(self.url, age / 3600),
+                stacklevel=3,
+            )
+            self._read_snapshot()
+
+    def _read_snapshot(self):
+        with open(self.path, "r") as f:
+            self._set(json.load(f))
+
+    def _write_snapshot(self, raw):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(raw, f)
+        os.replace(tmp, self.path)
+
+    def _set(self, raw):
+        self._raw = raw
+        self._apis = {
+            entry["identifier"]
+            .split("id")[-1]
+            .lstrip("/"): {
+                key: value for key, value in diter(entry) if key != entry["identifier"]
+            }
+            for entry in raw
         }
-        for entry in raw_APIs
-    }
-except r.HTTPError:
-    raise r.HTTPError(
-        "The main Census API Endpoint (https://api.census.gov/data.json) is not available."
-        " Try visiting https://api.census.gov/data.json in a web browser to verify connectivity."
-    )
-except JSONDecodeError:
-    raise JSONDecodeError(
-        "The main Census API Endpoint (https://api.census.gov/data.json) returned malformed content."
-        " Try visiting https://api.census.gov/data.json in a web browser to verify connectivity."
-    )
+
+
+catalog = Catalog()
+
+
+def __getattr__(name):
+    # APIs and raw_APIs used to be fetched at import, so keep them available
+    if name == "APIs":
+        return catalog.apis
+    elif name == "raw_APIs":
+        return catalog.raw
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 def available(verbose=True):
@@ -39,6 +201,9 @@ def available(verbose=True):
     Returns available identifiers for Census Data APIs. 
     NOTE: we do not support the Economic Indicators Time Series API yet.
 
+    These are resolved from cenpy.explorer.catalog, which keeps a snapshot of
+    the API listing on disk. Use catalog.refresh() to update it.
+
     Parameters
     ----------
     verbose : bool
@@ -51,20 +216,21 @@ def available(verbose=True):
         identifiers (if verbose: and dataset names)
 
     """
+    APIs = catalog.apis
     av_apis = [api for api in APIs.keys() if "eits" not in api]
     av_apis = [
         api for api in av_apis if APIs[api]["distribution"][0]["format"] == "API"
     ]
     if verbose:
-        return _parse_results_table_from_response(raw_APIs).sort_index()
+        return _parse_results_table_from_response(catalog.raw).sort_index()
     else:
         return av_apis
 
 
 def _parse_results_table_from_response(datajson):
     """ parse the raw data.json response into something more useful """
-    raw_table = pd.DataFrame(raw_APIs)
-    shortcodes = [entry["identifier"].split("id")[-1].lstrip("/") for entry in raw_APIs]
+    raw_table = pd.DataFrame(datajson)
+    shortcodes = [entry["identifier"].split("id")[-1].lstrip("/") for entry in datajson]
     raw_table.index = shortcodes
     raw_table = raw_table[[col for col in raw_table.columns if not col.startswith("@")]]
     listcols = raw_table.applymap(lambda x: isinstance(x, list)).any()
@@ -114,9 +280,10 @@ def explain(identifier=None, verbose=False):
             "No identifier provided. Use available() to discover identifiers"
         )
     elif not verbose:
-        return {APIs[identifier]["title"]: APIs[identifier]["description"]}
+        entry = catalog[identifier]
+        return {entry["title"]: entry["description"]}
     else:
-        return APIs[identifier]
+        return catalog[identifier]
 
 
 def fips_table(kind, in_state=""):
@@ -139,6 +306,18 @@ def fips_table(kind, in_state=""):
     pandas.DataFrame
         fips codes and names of the geographies in question
 
+    Notes
+    -----
+    Tables are resolved through cenpy.reference, so each file is only
+    downloaded from the Census Bureau once (on first use) and is read from
+    the cenpy cache directory afterwards. Storing tables needs pyarrow;
+    without it, each table is downloaded once per session.
+
+    Codes are returned as zero-padded strings, and columns with many repeated
+    values as categoricals. cenpy 1.0.1 and earlier returned codes as
+    integers. Use, for example, ``table[2].astype(int)`` to recover
+    integer codes. Only the "FIPS Code" of the state table is still an integer.
+
 
     """
     qurl = u"https://www2.census.gov/geo/docs/reference/codes/files/"
@@ -158,30 +337,31 @@ def fips_table(kind, in_state=""):
 
     in_state = in_state.upper()
 
-    stfips = pd.read_csv(fp + "/stfipstable.csv")
+    states = _reference.states()
 
     if kind == "STATE":
+        stfips = states.frame.rename(
+            columns={
+                "STATE": "State Abbreviation",
+                "STATEFP": "FIPS Code",
+                "STATENAME": "State Name",
+            }
+        )
+        stfips["FIPS Code"] = stfips["FIPS Code"].astype(int)
         return stfips
+    elif kind == "PLACE" and in_state == "":
+        return _reference.places().frame.copy()
     elif kind in tdict.keys():
         if in_state == "":
             qurl += "national_" + tdict[kind]
         else:
-            if in_state in stfips["State Abbreviation"].tolist():
-                fips = stfips[stfips["State Abbreviation"] == in_state][
-                    "FIPS Code"
-                ].values[0]
-            elif in_state in stfips["State Name"].tolist():
-                fips = stfips[stfips["State Name"] == in_state]["FIPS Code"].values[0]
-                in_state = stfips[stfips["State Name"] == in_state][
-                    "State Abbreviation"
-                ].values[0]
-            elif in_state in stfips["FIPS Code"].tolist():
-                fips = in_state
-                in_state = stfips[stfips["FIPS Code" == fips]][
-                    "State Abbreviation"
-                ].values[0]
-            else:
-                raise KeyError("Did not find State Abbreviation or Name")
+            match = states.find(in_state)
+            if match.empty:
+                try:
+                    match = states.lookup(in_state).to_frame().T
+                except KeyError:
+                    raise KeyError("Did not find State Abbreviation or Name")
+            fips, in_state = match.STATEFP.iloc[0], match.STATE.iloc[0]
             if kind == "COUNTY":
                 qurl += (
                     "st"
@@ -209,4 +389,4 @@ def fips_table(kind, in_state=""):
     else:
         sep = ","
         header = None
-    return pd.read_csv(qurl, sep=sep, header=header, encoding="latin1")
+    return _reference.remote_table(qurl, sep=sep, header=header).copy()
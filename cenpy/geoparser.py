@@ -1,5 +1,8 @@
+import json
 import pandas as pd
 import numpy as np
+import re
+from itertools import chain
 from libpysal.cg import is_clockwise as _is_cw
 import warnings
 
@@ -56,6 +59,11 @@ def convert_geometries(df, strict=False):
     first = df.geometry.head(1).tolist()[0]
     from shapely import geometry as g
 
+    if "Polygon" in first["type"]:
+        df.geometry = pd.Series(
+            parse_polygons(df.geometry.tolist(), strict=strict), index=df.index
+        )
+        return df
     try:
         df.geometry = pd.Series([g.__dict__[e["type"]](e) for e in df.geometry])
     except:
@@ -104,6 +112,157 @@ def parse_polygon(raw_feature, strict=False):
         )
 
 
+def parse_polygons(raw_features, strict=False):
+    """
+    Build the polygons of many raw features at once. This gives the same
+    polygons as calling parse_polygon on each feature, but builds them all in
+    one call to shapely from flat arrays of coordinates, which is much faster
+    for many features.
+
+    Parameters
+    ----------
+    raw_features:   list of dict
+                    features whose "coordinates" are lists of rings, ordered as
+                    described in _get_polygon_type
+    strict      :   bool
+                    whether to raise an error for invalid multipolygons whose
+                    rings cannot be fixed, or only warn. See fix_rings
+
+    Returns
+    -------
+    numpy array of shapely Polygons and MultiPolygons, one for each feature
+
+    Notes
+    -----
+    Building polygons from arrays needs shapely 2.0 or newer. With older
+    versions of shapely, each feature is passed to parse_polygon in turn.
+    """
+    import shapely
+
+    if not _shapely2(shapely):
+        return _parse_each(raw_features, strict=strict)
+    rings = [ring for feature in raw_features for ring in feature["coordinates"]]
+    counts = np.array([len(feature["coordinates"]) for feature in raw_features])
+    sizes = np.array([len(ring) for ring in rings], dtype=np.int64)
+    try:
+        dimensions = len(rings[0][0]) if rings and len(rings[0]) else 2
+        values = np.fromiter(chain.from_iterable(chain.from_iterable(rings)), float)
+        if dimensions not in (2, 3) or len(values) != sizes.sum() * dimensions:
+            raise ValueError("every point must have the same two or three dimensions")
+        coords = values.reshape(-1, dimensions)
+        coords, offsets = _close_rings(coords, sizes)
+        exterior = _exterior_rings(coords, offsets, counts)
+        # each polygon holds the rings from its exterior up to the next exterior
+        ring_counts = np.diff(np.flatnonzero(np.append(exterior, True)))
+        polygon_counts = np.zeros(len(counts), dtype=np.int64)
+        polygon_counts[counts > 0] = np.add.reduceat(exterior, _starts(counts))
+        geometries = shapely.from_ragged_array(
+            shapely.GeometryType.MULTIPOLYGON,
+            coords,
+            (offsets, _offsets(ring_counts), _offsets(polygon_counts)),
+        )
+    except (ValueError, shapely.errors.GEOSException):
+        # rings with too few points, or with mixed dimensions, are left to shapely
+        return _parse_each(raw_features, strict=strict)
+    single = polygon_counts == 1
+    geometries[single] = shapely.get_geometry(geometries[single], 0)
+    holed = np.flatnonzero((polygon_counts > 1) & (polygon_counts < counts))
+    for i in holed[~shapely.is_valid(geometries[holed])]:
+        geometries[i] = fix_rings(geometries[i], strict=strict)
+    return geometries
+
+
+def parse_geojson(geometries):
+    """
+    Build the shapely geometries of many GeoJSON geometries at once.
+
+    Parameters
+    ----------
+    geometries  :   list of dict or None
+                    GeoJSON geometries, like the "geometry" of each feature in a
+                    FeatureCollection. Null geometries are kept as None.
+
+    Returns
+    -------
+    numpy array of shapely geometries, one for each GeoJSON geometry
+
+    Notes
+    -----
+    With shapely 2.0 or newer, the geometries are read by shapely in one call.
+    With older versions, each geometry is passed to shapely.geometry.shape in turn.
+    """
+    import shapely
+
+    built = np.empty(len(geometries), dtype=object)
+    present = [i for i, geometry in enumerate(geometries) if geometry]
+    if not _shapely2(shapely):
+        from shapely.geometry import shape
+
+        # assigned one at a time, since shapely 1 multipolygons act like sequences
+        for i in present:
+            built[i] = shape(geometries[i])
+        return built
+    if present:
+        text = [json.dumps(geometries[i]) for i in present]
+        built[present] = shapely.from_geojson(text)
+    return built
+
+
+def _shapely2(shapely):
+    """whether shapely can build geometries from arrays, from version 2.0"""
+    return int(re.match(r"\d+", shapely.__version__).group()) >= 2
+
+
+def _parse_each(raw_features, strict=False):
+    """build the polygons of raw features one at a time, with parse_polygon"""
+    polygons = np.empty(len(raw_features), dtype=object)
+    # assigned one at a time, since shapely 1 multipolygons act like sequences
+    for i, feature in enumerate(raw_features):
+        polygons[i] = parse_polygon(feature, strict=strict)
+    return polygons
+
+
+def _offsets(counts):
+    """offsets into a flat array of parts, given the number of parts in each"""
+    return np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+
+def _starts(counts):
+    """where each group of counts starts, for groups that are not empty"""
+    return _offsets(counts)[:-1][counts > 0]
+
+
+def _close_rings(coords, sizes):
+    """repeat the first point of each ring that does not end with it"""
+    offsets = _offsets(sizes)
+    first, last = coords[offsets[:-1]], coords[offsets[1:] - 1]
+    unclosed = np.flatnonzero((first != last).any(axis=1))
+    if len(unclosed):
+        coords = np.insert(coords, offsets[1:][unclosed], first[unclosed], axis=0)
+        sizes = sizes.copy()
+        sizes[unclosed] += 1
+        offsets = _offsets(sizes)
+    return coords, offsets
+
+
+def _exterior_rings(coords, offsets, counts):
+    """
+    decide which rings start a new polygon. As in _get_polygon_type, the first
+    ring of a feature always does, and the other clockwise rings do when more
+    than one ring of the feature is clockwise. Other rings are holes in the last
+    polygon started before them.
+    """
+    x, y = coords[:, 0], coords[:, 1]
+    cross = np.concatenate([[0], np.cumsum(x[:-1] * y[1:] - y[:-1] * x[1:])])
+    area = cross[offsets[1:] - 1] - cross[offsets[:-1]]
+    clockwise = (area < 0) | (np.diff(offsets) < 4)
+    starts = _starts(counts)
+    first = np.zeros(len(clockwise), dtype=bool)
+    first[starts] = True
+    clockwise_count = np.repeat(np.add.reduceat(clockwise, starts), counts[counts > 0])
+    return first | (clockwise & (clockwise_count > 1))
+
+
 def _get_polygon_type(raw_feature):
     """
     Return an indication of what kind of polygon the raw feature is as well as a representation of the internal/external ring nestings. Polygons (by the OGC) can be:
@@ -210,13 +369,13 @@ def fix_rings(multipolygon, strict=False):
     NOTE: This function has undefined behavior for invalid multipolygons. 
     """
     from shapely import geometry as geom
-    from shapely.ops import cascaded_union
+    from shapely.ops import unary_union
     from shapely.validation import explain_validity
 
     vexplain = explain_validity(multipolygon)
     if "hole lies outside shell" not in vexplain.lower():
         if strict:
-            from shapely.geos import TopologicalError
+            from shapely.errors import TopologicalError
 
             def tell_user(x):
                 raise TopologicalError(x)
@@ -242,6 +401,6 @@ def fix_rings(multipolygon, strict=False):
         owned_interiors = [
             interior for owned, interior in zip(owns, interiors) if owned
         ]
-        polygons[i] = exterior.difference(cascaded_union(owned_interiors))
+        polygons[i] = exterior.difference(unary_union(owned_interiors))
         interiors = [interior for owned, interior in zip(owns, interiors) if not owned]
     return geom.MultiPolygon(polygons)
@@ -0,0 +1,246 @@
+"""
+Run long extractions in pieces that survive failures.
+
+A national pull of blocks makes tens of thousands of queries, and can take
+many hours. An ExtractionJob writes the result of each query (one partition,
+like the blocks of one county) to disk as soon as it arrives, and records it
+in a manifest. If the job fails, or is interrupted, running it again skips the
+partitions already done, so no completed work is lost.
+
+The manifest is kept in two files: manifest.json describes the job and the
+partitions planned in each state, and partitions.jsonl gets one line appended
+for each partition as it is written, so recording a partition does not
+rewrite the whole manifest.
+
+Partitions are written as Parquet files when pyarrow is installed, and as
+CSV files (with geography codes read back as strings) otherwise.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent import futures
+from warnings import warn
+
+import pandas as pd
+from requests import RequestException
+from six import iteritems as diter
+
+from .cache import ResultStore, _geography_order
+from .planner import Planner
+from .reference import _can_store, _write as _write_parquet
+from .remote import ParseException
+
+
+class ExtractionJob(object):
+    """A resumable extraction of columns for every geography at a level"""
+
+    def __init__(self, cxn, level, columns, path, states=None, max_workers=4):
+        """
+        Parameters
+        ----------
+        cxn         :   cenpy.remote.APIConnection
+                        connection to the dataset to extract from
+        level       :   str
+                        level of geography to extract, like "block" or "tract"
+        columns     :   list of str
+                        variables to extract. NAME is always extracted.
+        path        :   str
+                        directory where partitions and the manifest are kept.
+                        Use the same directory to resume a job.
+        states      :   list of str or None
+                        fips codes of the states to extract. (default: every state)
+        max_workers :   int
+                        number of queries to run at once (default: 4)
+        """
+        from .tools import _state_fipscodes
+
+        self.cxn = cxn
+        self.level = level
+        self.columns = ["NAME"] + [col for col in columns if col != "NAME"]
+        self.path = path
+        if states is None:
+            states = _state_fipscodes
+        self.states = [str(state).rjust(2, "0") for state in states]
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.manifest = self._load_manifest()
+
+    def __repr__(self):
+        status = self.status()
+        return "ExtractionJob({}, {}, {} of {} partitions done)".format(
+            self.level, self.path, status["done"], status["planned"]
+        )
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def _load_manifest(self):
+        """read the manifest of a previous run, checking it is for the same job"""
+        job = dict(
+            dataset=self.cxn.identifier,
+            vintage=self.cxn.vintage,
+            level=self.level,
+            columns=self.columns,
+        )
+        if not os.path.exists(self._manifest_path):
+            manifest = dict(job, plans=dict())
+        else:
+            with open(self._manifest_path) as f:
+                manifest = json.load(f)
+            for key, value in diter(job):
+                if manifest.get(key) != value:
+                    raise ValueError(
+                        "The job in {} has {} {}, not {}. Use another directory for"
+                        " this job.".format(self.path, key, manifest.get(key), value)
+                    )
+        manifest["partitions"] = dict()
+        if os.path.exists(self._partitions_path):
+            with open(self._partitions_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short when a run was interrupted
+                    if not entry["file"].endswith((".parquet", ".csv")):
+                        continue  # written by an older cenpy, so extract it again
+                    if os.path.exists(os.path.join(self.path, entry["file"])):
+                        manifest["partitions"][entry.pop("key")] = entry
+        return manifest
+
+    @property
+    def _partitions_path(self):
+        return os.path.join(self.path, "partitions.jsonl")
+
+    def _save_manifest(self):
+        """write the job and its plans, replacing the old file once complete"""
+        document = {k: v for k, v in diter(self.manifest) if k != "partitions"}
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(document, f)
+        os.replace(tmp, self._manifest_path)
+
+    def status(self):
+        """
+        Counts of the states planned, and the partitions planned and done.
+
+        Returns
+        -------
+        dict with the number of states whose partitions have been planned,
+        and the number of partitions planned and done in those states.
+        """
+        planned = [
+            ResultStore.scope(*spec)
+            for specs in self.manifest["plans"].values()
+            for spec in specs
+        ]
+        done = [key for key in planned if key in self.manifest["partitions"]]
+        return dict(
+            states=len(self.manifest["plans"]),
+            planned=len(planned),
+            done=len(done),
+        )
+
+    def run(self):
+        """
+        Extract every partition that is not already done. Partitions are
+        written to disk as they arrive. Failed partitions are left for the
+        next run, and the first failure is raised once every other partition
+        has been attempted.
+
+        Returns
+        -------
+        this job, to chain with read()
+        """
+        failures = []
+        planner = Planner(self.cxn, concurrency=1)
+        with futures.ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            work = dict()
+            for state in self.states:
+                plan = self.manifest["plans"].get(state)
+                if plan is None:
+                    future = pool.submit(planner.plan, self.level, dict(state=state))
+                    work[future] = ("plan", state)
+                else:
+                    self._submit(pool, work, plan)
+            pending = set(work)
+            while pending:
+                done, pending = futures.wait(
+                    pending, return_when=futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    kind, item = work.pop(future)
+                    try:
+                        result = future.result()
+                    except (RequestException, ParseException, OSError) as error:
+                        warn("Failed to {} {}: {}".format(kind, item, error))
+                        failures.append(error)
+                        continue
+                    if kind == "plan":
+                        plan = [
+                            [geo_unit, geo_filter] for geo_unit, geo_filter in result
+                        ]
+                        with self._lock:
+                            self.manifest["plans"][item] = plan
+                            self._save_manifest()
+                        pending.update(self._submit(pool, work, plan))
+                    else:
+                        self._write(item, result)
+        if failures:
+            raise failures[0]
+        return self
+
+    def _submit(self, pool, work, plan):
+        """submit the queries for the partitions in a plan that are not done yet"""
+        submitted = []
+        for geo_unit, geo_filter in plan:
+            key = ResultStore.scope(geo_unit, geo_filter)
+            if key in self.manifest["partitions"]:
+                continue
+            future = pool.submit(self.cxn.query, self.columns, geo_unit, geo_filter)
+            work[future] = ("query", key)
+            submitted.append(future)
+        return submitted
+
+    def _write(self, key, frame):
+        """persist the result of a partition, then record it in the manifest"""
+        name = "part-{}".format(hashlib.sha1(key.encode()).hexdigest()[:16])
+        if _can_store():
+            name += ".parquet"
+            _write_parquet(frame, os.path.join(self.path, name))
+        else:
+            name += ".csv"
+            tmp = os.path.join(self.path, name + ".tmp")
+            frame.to_csv(tmp, index=False)
+            os.replace(tmp, os.path.join(self.path, name))
+        entry = dict(file=name, rows=int(frame.shape[0]), finished=time.time())
+        with self._lock:
+            with open(self._partitions_path, "a") as f:
+                f.write(json.dumps(dict(entry, key=key)) + "\n")
+            self.manifest["partitions"][key] = entry
+
+    def read(self):
+        """
+        Read the partitions done so far into one dataframe, sorted by geography.
+        """
+        from .tools import _sorted
+
+        frames = [
+            _read_partition(os.path.join(self.path, entry["file"]))
+            for entry in self.manifest["partitions"].values()
+        ]
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return _sorted(pd.concat(frames, ignore_index=True))
+
+
+def _read_partition(path):
+    """read a partition written by ExtractionJob._write"""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, engine="pyarrow")
+    codes = {name: str for name in _geography_order + ["NAME"]}
+    return pd.read_csv(path, dtype=codes)
@@ -0,0 +1,352 @@
+"""
+Plan the requests needed to fetch every geography at a level.
+
+The Census Data API describes, for each geographic level of a dataset, which
+enclosing geographies must be given in the `in=` clause of a query (its
+`requires`), and which of those may be given as a wildcard (its `wildcard`).
+The planner uses these to build the fewest queries covering a level: enclosing
+geographies that may be wildcarded are, and only those that may not are listed
+out, using as few discovery queries as possible.
+
+Plans can also be estimated without being run: the number of requests they
+make, and the number of cells and bytes they return, are estimated from the
+rules and from the approximate number of geographies at each level.
+"""
+
+import math
+import pandas as pd
+from six import iteritems as diter
+from . import transport
+
+# approximate number of geographies at each level in the United States and
+# Puerto Rico, as of the 2020 Census. Used only to estimate the size of queries.
+_national_counts = {
+    "us": 1,
+    "region": 4,
+    "division": 9,
+    "state": 52,
+    "county": 3221,
+    "county subdivision": 36421,
+    "place": 32188,
+    "tract": 85528,
+    "block group": 242335,
+    "block": 8180866,
+}
+
+# average size of one value in the JSON tables returned by the API, with its
+# quotes and separator
+_bytes_per_cell = 12
+
+
+class Planner(object):
+    """Plans queries for a level of geography, using the geographies of a connection"""
+
+    def __init__(self, cxn, concurrency=4):
+        """
+        Parameters
+        ----------
+        cxn         :   cenpy.remote.APIConnection
+                        the connection whose geographies are used to plan queries,
+                        and to which discovery queries are sent.
+        concurrency :   int
+                        number of discovery queries to run at once. (default: 4)
+        """
+        self.cxn = cxn
+        self.concurrency = concurrency
+
+    def __repr__(self):
+        return "Planner({})".format(self.cxn.identifier)
+
+    @property
+    def levels(self):
+        """the rules for each level of geography, as a list of dictionaries"""
+        geographies = self.cxn.geographies
+        if not geographies or "fips" not in geographies:
+            return []
+        rules = []
+        for entry in geographies["fips"].to_dict("records"):
+            rules.append(
+                dict(
+                    name=entry["name"],
+                    requires=_as_list(entry.get("requires")),
+                    wildcard=_as_list(entry.get("wildcard")),
+                )
+            )
+        return rules
+
+    def rule(self, level, within=None):
+        """
+        Find the rule for a level of geography, as a dictionary with the name
+        of the level, the geographies it requires, and those that may be wildcards.
+
+        When a level is listed more than once, the rule needing the fewest
+        geographies to be listed out is used. Level names are matched ignoring
+        case and spaces, so "blockgroup" matches "block group".
+        """
+        within = dict() if within is None else within
+        candidates = [rule for rule in self.levels if _same_level(rule["name"], level)]
+        if not candidates:
+            raise KeyError(
+                "The level {} is not available in {}. Available levels are: {}".format(
+                    level,
+                    self.cxn.identifier,
+                    sorted({rule["name"] for rule in self.levels}),
+                )
+            )
+
+        def cost(rule):
+            unknown = set(within).difference(rule["requires"] + [rule["name"]])
+            listed = [
+                r
+                for r in rule["requires"]
+                if r not in within and r not in rule["wildcard"]
+            ]
+            return (len(unknown), len(listed), len(rule["requires"]))
+
+        return min(candidates, key=cost)
+
+    def plan(self, level, within=None):
+        """
+        Plan the queries needed to fetch every geography at a level.
+
+        Parameters
+        ----------
+        level   :   str
+                    name of the level of geography, like "tract" or "block group"
+        within  :   dict
+                    codes of the geographies to restrict the plan to, like
+                    {"state": "04"}. Values may be strings, lists of codes, or "*".
+                    A code for the level itself restricts the plan to those
+                    geographies.
+
+        Returns
+        -------
+        list of (geo_unit, geo_filter) tuples, to be passed to
+        APIConnection.query or APIConnection.query_many.
+        """
+        within = {k: _codes(v) for k, v in diter(dict() if within is None else within)}
+        rule = self.rule(level, within)
+        name = rule["name"]
+        _check_within(rule, within)
+        filters = [dict()]
+        for ancestor in rule["requires"]:
+            if ancestor in within:
+                filters = [dict(f, **{ancestor: within[ancestor]}) for f in filters]
+            elif ancestor in rule["wildcard"]:
+                filters = [dict(f, **{ancestor: "*"}) for f in filters]
+            else:
+                filters = self._list_out(ancestor, filters)
+        geo_unit = "{}:{}".format(name, within.get(name, "*"))
+        return [(geo_unit, f) for f in filters]
+
+    def specs(self, cols, level, within=None):
+        """
+        Build the specifications of the queries needed to fetch cols for every
+        geography at a level, for APIConnection.query_many. See Planner.plan
+        """
+        return [
+            (list(cols), geo_unit, geo_filter)
+            for geo_unit, geo_filter in self.plan(level, within)
+        ]
+
+    def explain(self, cols, level, within=None, apikey="", concurrency=8, latency=1.0):
+        """
+        Estimate the cost of fetching cols for every geography at a level,
+        without running any queries. Only the geographies of the connection are
+        read, from disk when they have been fetched before.
+
+        Parameters
+        ----------
+        cols        :   list of str
+                        the variables to fetch
+        level       :   str
+                        name of the level of geography. See Planner.plan
+        within      :   dict
+                        codes of the geographies to restrict the plan to.
+        apikey      :   str
+                        the API key used, whose rate limit paces the requests
+        concurrency :   int
+                        number of requests in flight at once. (default: 8)
+        latency     :   float
+                        seconds expected for each request. (default: 1.0)
+
+        Returns
+        -------
+        dict, as from cenpy.planner.estimate
+        """
+        queries, discovery, geographies = self._count(level, within)
+        return estimate(
+            self.cxn,
+            cols,
+            queries,
+            geographies,
+            discovery=discovery,
+            apikey=apikey,
+            concurrency=concurrency,
+            latency=latency,
+        )
+
+    def _count(self, level, within=None):
+        """
+        estimate the number of queries in the plan for a level, the number of
+        discovery queries needed to list out enclosing geographies, and the
+        number of geographies returned, without running any queries
+        """
+        within = {k: _codes(v) for k, v in diter(dict() if within is None else within)}
+        rule = self.rule(level, within)
+        _check_within(rule, within)
+        queries, discovery, given = 1, 0, dict()
+        for ancestor in rule["requires"]:
+            if ancestor in within:
+                given[ancestor] = within[ancestor]
+            elif ancestor not in rule["wildcard"]:
+                discovery += queries
+                queries = _count_within(ancestor, given)
+        geographies = _count_within(rule["name"], within)
+        return queries, discovery, geographies
+
+    def _list_out(self, ancestor, filters):
+        """
+        replace each filter with one filter for each of the ancestor geographies
+        within it, filling in any wildcards in the filter along the way
+        """
+        if not filters:
+            return []
+        specs = []
+        for f in filters:
+            fixed = {k: v for k, v in diter(f) if v != "*"}
+            specs.extend(self.specs(["NAME"], ancestor, fixed))
+        found = self.cxn.query_many(specs, concurrency=self.concurrency)
+        keys = list(filters[0]) + [ancestor]
+        listed = []
+        for result in found:
+            rows = result[keys].astype(str).drop_duplicates()
+            listed.extend(dict(zip(keys, row)) for row in rows.itertuples(index=False))
+        return listed
+
+
+def plan(cxn, level, within=None, concurrency=4):
+    """
+    Plan the queries needed to fetch every geography at a level. See Planner.plan
+
+    Returns
+    -------
+    list of (geo_unit, geo_filter) tuples
+    """
+    return Planner(cxn, concurrency=concurrency).plan(level, within)
+
+
+def estimate(
+    cxn, cols, queries, geographies, discovery=0, apikey="", concurrency=8, latency=1.0
+):
+    """
+    Estimate the cost of running queries for cols.
+
+    Parameters
+    ----------
+    cxn         :   cenpy.remote.APIConnection
+                    the connection the queries are sent to
+    cols        :   list of str
+                    the variables requested by each query. Groups are counted
+                    at their full size if the variables of the connection are loaded.
+    queries     :   int
+                    number of queries, each of which is split into chunks of
+                    49 columns if it requests 50 or more.
+    geographies :   int
+                    number of geographies (rows) returned by all of the queries
+    discovery   :   int
+                    number of additional requests made to find the geographies
+                    to query, like the queries listing out enclosing geographies
+    apikey      :   str
+                    the API key used, whose rate limit on cenpy's transport
+                    paces the requests
+    concurrency :   int
+                    number of requests in flight at once. (default: 8)
+    latency     :   float
+                    seconds expected for each request. (default: 1.0)
+
+    Returns
+    -------
+    dict with the number of requests, the number of them that are discovery
+    requests, the number of geographies, cells, and bytes expected in the
+    results, and the seconds expected to make the requests, either paced
+    by the rate limit or limited by concurrency and latency.
+    """
+    cols = list(cols)
+    geographies = int(round(geographies))
+    chunks = math.ceil(len(cols) / 49.0) if len(cols) >= 50 else 1
+    requests = round(queries) * chunks + round(discovery)
+    variables = cxn._metadata.get("variables")
+    width = 0
+    for col in cols:
+        group = col[len("group(") : -1] if col.startswith("group(") else None
+        if group is not None and variables is not None and "group" in variables:
+            width += int((variables["group"] == group).sum()) + 2
+        else:
+            width += 1
+    cells = geographies * width
+    limiter = transport.get_transport().limiter(apikey)
+    paced = 0.0
+    if limiter.rate is not None:
+        paced = max(0, requests - limiter.burst) / float(limiter.rate)
+    seconds = max(paced, math.ceil(requests / float(max(concurrency, 1))) * latency)
+    return dict(
+        requests=int(requests),
+        discovery_requests=int(round(discovery)),
+        geographies=geographies,
+        cells=cells,
+        bytes=cells * _bytes_per_cell,
+        seconds=seconds,
+    )
+
+
+def _check_within(rule, within):
+    """raise a ValueError if within names geographies the level is not nested in"""
+    unknown = set(within).difference(rule["requires"] + [rule["name"]])
+    if unknown:
+        raise ValueError(
+            "The level {} is not within {}. It must be within {}".format(
+                rule["name"], sorted(unknown), rule["requires"]
+            )
+        )
+
+
+def _count_within(level, within):
+    """
+    estimate the number of geographies at a level inside the geographies given
+    by the codes in within, assuming geographies are spread evenly
+    """
+    codes = within.get(level)
+    if codes is not None and codes != "*":
+        return len(codes.split(","))
+    total = _national_counts.get(_level_key(level), 1)
+    for ancestor in sorted(
+        within, key=lambda name: -_national_counts.get(_level_key(name), 0)
+    ):
+        parents = _national_counts.get(_level_key(ancestor))
+        if parents is None or within[ancestor] == "*" or parents > total:
+            continue
+        return max(1.0, total / float(parents)) * len(within[ancestor].split(","))
+    return total
+
+
+def _level_key(name):
+    return " ".join(name.lower().split())
+
+
+def _as_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if value is None or (not isinstance(value, str) and pd.isnull(value)):
+        return []
+    return [value]
+
+
+def _codes(value):
+    if isinstance(value, (list, tuple)):
+        return ",".join(str(v) for v in value)
+    return str(value)
+
+
+def _same_level(name, level):
+    return name.replace(" ", "").lower() == level.replace(" ", "").lower()
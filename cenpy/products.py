@@ -1,5 +1,6 @@
 from .remote import APIConnection
-from .explorer import fips_table as _ft
+from . import reference as _reference
+from .decode import convert_frame, requested_columns
 from shapely import geometry
 from fuzzywuzzy import fuzz
 from warnings import warn
@@ -8,12 +9,6 @@ import pandas
 import numpy
 import copy
 
-_places = _ft("place")
-_places["TARGETFP"] = _places.PLACEFP.apply(lambda x: str(x).rjust(5, "0"))
-_places["TARGETNAME"] = _places.PLACENAME
-_places["STATEFP"] = _places.STATEFP.apply(lambda x: str(x).rjust(2, "0"))
-_places.drop(["PLACEFP", "FUNCSTAT", "COUNTY", "PLACENAME"], inplace=True, axis=1)
-
 __all__ = ["Decennial2010", "ACS"]
 
 _ACS_MISSING = (-999999999, -888888888, -666666666, -555555555, -333333333, -222222222)
@@ -64,15 +59,101 @@ class _Product(object):
             pattern=pattern, by=by, engine=engine, within=self.tables
         )
 
+    def select(self, *patterns):
+        """
+        Start a query of the variables matching any of the patterns, to be run
+        later. Patterns are matched as in filter_variables, and tables matched
+        in full are requested as a group(). See cenpy.deferred.Query
+        """
+        columns = []
+        for pattern in patterns:
+            columns.extend([pattern] if isinstance(pattern, str) else pattern)
+        return self._api.select(self._preprocess_variables(columns))
+
+    def explain_plan(
+        self,
+        variables=None,
+        level="tract",
+        counties=1,
+        geographies=None,
+        concurrency=4,
+        latency=1.0,
+    ):
+        """
+        Estimate the cost of a from_place, from_county, from_msa, from_csa, or
+        from_state query, without running it.
+
+        Which geographies these queries cover is only found by querying TIGERweb,
+        so the estimate is made for a number of counties, and the number of
+        geographies at `level` they hold. The variables are expanded using
+        the variables of the dataset, as they would be for the query.
+
+        Parameters
+        ----------
+        variables   :   list or str
+                        variable or set of variables to extract from the API,
+                        as for from_place.
+        level       :   str
+                        level at which to extract the geographic data. (default: 'tract')
+        counties    :   int
+                        number of counties the place is spread across. (default: 1)
+        geographies :   int or None
+                        number of geographies at `level` in the place. If None,
+                        the average number of geographies in a county is assumed
+                        for each county.
+        concurrency :   int
+                        number of queries run at once. (default: 4)
+        latency     :   float
+                        seconds expected for each request. (default: 1.0)
+
+        Returns
+        -------
+        dict with the number of requests, the number of geographies, cells, and
+        bytes expected, and the seconds expected to make the requests. The two
+        TIGERweb requests that find the geographies are counted as discovery
+        requests, but the size of the geometries they return is not estimated.
+        See cenpy.planner.estimate
+        """
+        from .planner import _count_within, estimate
+
+        if variables is None:
+            variables = []
+        columns = self._preprocess_variables(variables) + ["GEO_ID", "NAME"]
+        if geographies is None:
+            geographies = _count_within(level, dict(county="001")) * counties
+        per_county = numpy.ceil(geographies / float(max(counties, 1)) / 500)
+        return estimate(
+            self._api,
+            columns,
+            counties * max(per_county, 1),
+            geographies,
+            discovery=2,
+            apikey=self._api.apikey,
+            concurrency=concurrency,
+            latency=latency,
+        )
+
     def _preprocess_variables(self, columns):
+        """
+        expand the patterns in columns into the variables they match. Where
+        they match every variable in a table, the table is requested as a group()
+        in one column, rather than by listing each of its variables.
+        """
         if isinstance(columns, str):
             columns = [columns]
-        expanded = [
-            col
-            for this_pattern in columns
-            for col in self.filter_variables(this_pattern, engine="regex").index
+        expanded = self.filter_variables(columns, engine="regex")
+        if "group" not in expanded.columns:
+            return numpy.unique(expanded.index).tolist()
+        sizes = self._api.variables.group.value_counts()
+        matched = expanded.group.value_counts()
+        full = matched.index[
+            (matched.values == sizes.reindex(matched.index).values)
+            & (matched.values > 1)
+            & ~matched.index.isin(["N/A", ""])
         ]
-        return numpy.unique(expanded).tolist()
+        listed = expanded.index[~expanded.group.isin(full)]
+        groups = ["group({})".format(group) for group in sorted(full)]
+        return numpy.unique(listed).tolist() + groups
 
     @property
     def _layer_lookup(self):
@@ -133,6 +214,14 @@ class _Product(object):
         replace_missing     : bool 
                               whether to replace missing values in the data with numpy.nan,
                               according to the standard missing values used by the ACS. (default: True)
+        output              : str
+                              "pandas" to return a (Geo)DataFrame, or "arrow" to return a
+                              pyarrow.Table, with geometries encoded as WKB, which needs
+                              geopandas 1.0 or newer. (default: "pandas")
+        dtype_backend       : str
+                              for pandas output, "numpy_nullable" or "pyarrow" to use
+                              nullable or Arrow-backed dtypes for the data. Needs
+                              pandas 2.0 or newer. (default: None)
         
         Notes
         ------
@@ -155,6 +244,7 @@ class _Product(object):
                 stacklevel=2,
             )
 
+        _places = _reference.places().frame
         if place_type != None:
             if place_type in [
                 "Census Designated Place",
@@ -167,18 +257,16 @@ class _Product(object):
                     "place_type must be on of Census Designated Place, Incorporated Place, County Subdivision"
                 )
         else:
-            searchtarget = _places.assign(TypeOrder=_places["TYPE"].apply(lambda x: {}))
+            searchtarget = _places
 
         if len(name) == 2:
             name, state = name
-            searchtarget = (
-                searchtarget.assign(state=_places.STATE.str.lower())
-                .query('state == "{}"'.format(state.strip().lower()))
-                .TARGETNAME
-            )
+            searchtarget = searchtarget[
+                searchtarget.STATE == state.strip().upper()
+            ].PLACENAME
         elif len(name) == 1:
             name = name[0]
-            searchtarget = searchtarget.TARGETNAME
+            searchtarget = searchtarget.PLACENAME
         else:
             raise Exception()
 
@@ -192,11 +280,11 @@ class _Product(object):
         env_layer = self._api.mapservice.layers[env_name.name]
         if place_type == "County Subdivision":
             placer = "STATE='{}' AND COUSUB='{}'".format(
-                placerow.STATEFP, placerow.TARGETFP
+                placerow.STATEFP, placerow.PLACEFP
             )
         else:
 
-            placer = "STATE='{}' AND PLACE='{}'".format(placerow.STATEFP, placerow.TARGETFP)
+            placer = "STATE='{}' AND PLACE='{}'".format(placerow.STATEFP, placerow.PLACEFP)
         env = env_layer.query(where=placer)
 
         print(
@@ -234,12 +322,13 @@ class _Product(object):
         strict_within=False,
         return_bounds=False,
         replace_missing=True,
+        concurrency=4,
     ):
         """
         This is an internal method to handle querying the Census API and the GeoAPI using
         bounding boxes. This first gets the target records in the given level that fall within
         the provided bounding box using the GeoAPI. Then, it gets the variables for each record
-        from the Census API. 
+        from the Census API, running up to `concurrency` queries at once.
         """
 
         # Regularize the bounding box for the web request
@@ -261,9 +350,9 @@ class _Product(object):
                 involved, env[["geometry"]], how="inner", predicate="within"
             )
 
-        # Construct a "query" translator between the GeoAPI and the Census API
-        # in chunks using a closure around chunked_query.
-        data = []
+        # Construct a "query" translator between the GeoAPI and the Census API,
+        # building one query for each chunk of elements in each group.
+        specs = []
         if level == "county":
             grouper = involved.groupby("STATE")
         else:
@@ -279,7 +368,9 @@ class _Product(object):
                 elements = chunk.TRACT.unique()
             n_elements = len(elements)
 
-            def chunked_query(elements_in_chunk):
+            # Split each group into chunks in order to avoid requesting too much data.
+            n_chunks = int(numpy.ceil(n_elements / 500))
+            for elements_in_chunk in numpy.array_split(elements, n_chunks):
                 geo_filter = dict(state=state)
                 if level == "block":
                     geo_unit = "block:*"
@@ -291,32 +382,23 @@ class _Product(object):
                 elif level == "county":
                     geo_unit = "county:{}".format(",".join(elements_in_chunk))
                 elif level == "state":
-                    geo_filter = None
+                    geo_filter = {}
                     geo_unit = "state:{}".format(",".join(elements_in_chunk))
                 else:
                     raise Exception("Unrecognized level: {}".format(level))
+                specs.append((variables, geo_unit, geo_filter))
 
-                return self._api.query(
-                    variables, geo_unit=geo_unit, geo_filter=geo_filter
-                )
-
-            # Run each of these chunks of the query in order to avoid requesting too much data.
-            n_chunks = numpy.ceil(n_elements / 500)
-            data.append(
-                pandas.concat(
-                    [
-                        chunked_query(tracts_)
-                        for tracts_ in numpy.array_split(elements, n_chunks)
-                    ],
-                    ignore_index=True,
-                    sort=False,
-                )
-            )
-        data = pandas.concat((data), ignore_index=True, sort=False)
+        # and run the chunks concurrently.
+        data = pandas.concat(
+            self._api.query_many(specs, concurrency=concurrency),
+            ignore_index=True,
+            sort=False,
+        )
 
         if replace_missing:
-            for variable in variables:
-                data[variable] = _replace_missing(_coerce(data[variable], float))
+            requested = requested_columns(data.columns, variables, self._api.variables)
+            for variable in requested:
+                data[variable] = _replace_missing(data[variable])
 
         if return_geometry:
             data = geopandas.GeoDataFrame(data)
@@ -460,9 +542,10 @@ class _Product(object):
                 returnGeometry="false", outFields=out_fields, where="AREALAND>0"
             )
             if "Statistical" not in layer_name.target:
-                _states = _ft("state")
-                _states.columns = ["abbreviation", "statefp", "name"]
-                _states["STATE"] = _states.statefp.apply(lambda x: str(x).rjust(2, "0"))
+                _states = _reference.states().frame
+                _states = _states.rename(
+                    columns=dict(STATE="abbreviation", STATEFP="STATE")
+                )
                 cache = cache.merge(
                     _states[["abbreviation", "STATE"]], how="left", on="STATE"
                 )
@@ -499,6 +582,8 @@ class Decennial2010(_Product):
         strict_within=True,
         return_bounds=False,
         geometry_precision=2,
+        output="pandas",
+        dtype_backend=None,
     ):
         if level not in self._layer_lookup.keys():
             raise NotImplementedError(
@@ -534,6 +619,7 @@ class Decennial2010(_Product):
             return_table = pandas.DataFrame(
                 return_table.drop(return_table.geometry.name, axis=1)
             )
+        return_table = convert_frame(return_table, output, dtype_backend)
         if not return_bounds:
             return return_table
         else:
@@ -549,6 +635,8 @@ class Decennial2010(_Product):
         strict_within=True,
         return_bounds=False,
         replace_missing=True,
+        output="pandas",
+        dtype_backend=None,
     ):
         if variables is None:
             variables = []
@@ -575,6 +663,7 @@ class Decennial2010(_Product):
             return_table = pandas.DataFrame(
                 return_table.drop(return_table.geometry.name, axis=1)
             )
+        return_table = convert_frame(return_table, output, dtype_backend)
         if not return_bounds:
             return return_table
         else:
@@ -698,6 +787,8 @@ class ACS(_Product):
         strict_within=True,
         return_bounds=False,
         geometry_precision=2,
+        output="pandas",
+        dtype_backend=None,
     ):
         if level not in self._layer_lookup.keys():
             raise NotImplementedError(
@@ -739,6 +830,7 @@ class ACS(_Product):
             return_table = pandas.DataFrame(
                 return_table.drop(return_table.geometry.name, axis=1)
             )
+        return_table = convert_frame(return_table, output, dtype_backend)
         if not return_bounds:
             return return_table
         else:
@@ -780,6 +872,8 @@ class ACS(_Product):
         strict_within=True,
         return_bounds=False,
         replace_missing=True,
+        output="pandas",
+        dtype_backend=None,
     ):
         if variables is None:
             variables = []
@@ -806,6 +900,7 @@ class ACS(_Product):
             return_table = pandas.DataFrame(
                 return_table.drop(return_table.geometry.name, axis=1)
             )
+        return_table = convert_frame(return_table, output, dtype_backend)
         if not return_bounds:
             return return_table
         else:
@@ -888,6 +983,13 @@ class ACS(_Product):
 #############
 
 
+def __getattr__(name):
+    # the table of places used to be built at import, so keep it available
+    if name == "_places":
+        return _reference.places().frame
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
 def _fuzzy_match(matchtarget, matchlist, return_table=False):
     """
     Conduct a fuzzy match with matchtarget, within the list of possible match candidates in matchlist. 
@@ -952,24 +1054,17 @@ def _fuzzy_match(matchtarget, matchlist, return_table=False):
     return rowmax
 
 
-def _coerce(column, kind):
-    """
-    Converty type of column to kind, or keep column unchanged
-    if that conversion fails.
-    """
-    try:
-        return column.astype(kind)
-    except ValueError:
-        return column
-
-
 def _replace_missing(column, missings=_ACS_MISSING):
     """
-    replace ACS missing values using numpy.nan. 
+    replace ACS missing values using numpy.nan. Columns that are not
+    numeric are returned unchanged.
     """
-    for val in _ACS_MISSING:
-        column.replace(val, numpy.nan, inplace=True)
-    return column
+    if not pandas.api.types.is_numeric_dtype(column):
+        return column
+    missing = column.isin(missings)
+    if not missing.any():
+        return column
+    return column.mask(missing)
 
 
 def _break_ties(matchtarget, table):
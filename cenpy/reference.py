@@ -0,0 +1,290 @@
+"""
+Reference tables of FIPS codes used to resolve names of places and states.
+
+Tables are kept as categorical, zero-padded string columns and are indexed on
+first use, so lookups by code or by name are dictionary lookups. Only the
+state table ships with cenpy. Other tables, including the table of places,
+are downloaded from the Census Bureau the first time they are used, written
+into the cenpy cache directory, and read from there afterwards. (A table
+written into the package by build() is read before the cache, for those
+who redistribute cenpy with its tables built.)
+
+Stored tables are Parquet files, which keep the categorical columns compact
+and are read without running any code from the file. Writing and reading them
+needs pyarrow; without it, tables are downloaded once per session and kept
+in memory. A stored table that cannot be read is rebuilt.
+"""
+import io
+import os
+import warnings
+import pandas as pd
+from six import iteritems as diter
+from .cache import cache_dir
+
+# bump this whenever the layout of a stored table changes, so that stale
+# tables in users' caches are rebuilt rather than read.
+REFERENCE_VERSION = 1
+
+_packagedir = os.path.dirname(os.path.realpath(__file__))
+_tables = dict()
+
+
+class ReferenceTable(object):
+    """A table of geographies indexed by their FIPS codes and names"""
+
+    def __init__(self, frame, codes, names, widths=None):
+        """
+        Parameters
+        ----------
+        frame   :   pandas.DataFrame
+                    table of geographies, with one row per geography
+        codes   :   tuple of str
+                    columns that, together, uniquely identify a row, like
+                    ("STATEFP", "PLACEFP")
+        names   :   tuple of str
+                    columns containing names that should be searchable
+        widths  :   dict
+                    width to which each code column is zero-padded, used to
+                    regularize codes passed as integers to lookup().
+        """
+        self.frame = frame
+        self.codes = tuple(codes)
+        self.names = tuple(names)
+        self.widths = widths if widths is not None else dict()
+        self._code_index = None
+        self._name_index = None
+
+    def __repr__(self):
+        return "ReferenceTable({} rows, indexed by {})".format(
+            len(self), ", ".join(self.codes)
+        )
+
+    def __len__(self):
+        return self.frame.shape[0]
+
+    @property
+    def code_index(self):
+        """mapping from a tuple of codes to the position of their row"""
+        if self._code_index is None:
+            keys = zip(*[self.frame[col].astype(str) for col in self.codes])
+            self._code_index = dict(zip(keys, range(len(self))))
+        return self._code_index
+
+    @property
+    def name_index(self):
+        """mapping from a lower-cased name to the positions of rows with that name"""
+        if self._name_index is None:
+            index = dict()
+            for col in self.names:
+                for i, name in enumerate(self.frame[col].astype(str).str.lower()):
+                    index.setdefault(name, []).append(i)
+            self._name_index = index
+        return self._name_index
+
+    def _pad(self, col, code):
+        return str(code).rjust(self.widths.get(col, 0), "0")
+
+    def lookup(self, *codes):
+        """
+        Get the row identified by codes, in the order of the table's code columns.
+
+        Parameters
+        ----------
+        *codes  :   str or int
+                    codes identifying the row. Integers are zero-padded.
+
+        Returns
+        -------
+        pandas.Series of the row, or raises KeyError if the codes are not found.
+        """
+        key = tuple(self._pad(col, code) for col, code in zip(self.codes, codes))
+        return self.frame.iloc[self.code_index[key]]
+
+    def find(self, name):
+        """
+        Get all rows with a name matching `name`, ignoring case.
+
+        Returns
+        -------
+        pandas.DataFrame of the rows (empty if no rows match)
+        """
+        return self.frame.iloc[self.name_index.get(str(name).strip().lower(), [])]
+
+
+def states():
+    """
+    The table of state FIPS codes shipped with cenpy.
+
+    Returns
+    -------
+    ReferenceTable with columns STATE (the abbreviation), STATEFP, and STATENAME,
+    indexed by STATEFP and searchable by abbreviation or name.
+    """
+    if "state" not in _tables:
+        frame = pd.read_csv(os.path.join(_packagedir, "stfipstable.csv"), dtype=str)
+        frame.columns = ["STATE", "STATEFP", "STATENAME"]
+        frame["STATEFP"] = frame.STATEFP.str.zfill(2)
+        _tables["state"] = ReferenceTable(
+            frame, ("STATEFP",), ("STATE", "STATENAME"), widths=dict(STATEFP=2)
+        )
+    return _tables["state"]
+
+
+def places():
+    """
+    The table of places (incorporated places, census designated places, and
+    county subdivisions) in the US. The table does not ship with cenpy: it is
+    downloaded from the Census Bureau on first use, and read from the cenpy
+    cache directory afterwards.
+
+    Returns
+    -------
+    ReferenceTable with columns STATE, STATEFP, PLACEFP, PLACENAME, TYPE,
+    FUNCSTAT and COUNTY, indexed by (STATEFP, PLACEFP) and searchable by PLACENAME.
+    """
+    if "place" not in _tables:
+        frame = _read_stored("places", _build_places)
+        _tables["place"] = ReferenceTable(
+            frame,
+            ("STATEFP", "PLACEFP"),
+            ("PLACENAME",),
+            widths=dict(STATEFP=2, PLACEFP=5),
+        )
+    return _tables["place"]
+
+
+def remote_table(url, sep=",", header=None):
+    """
+    Read a reference file published by the Census Bureau, keeping a copy
+    in the cenpy cache directory so that it is only downloaded once.
+
+    Parameters
+    ----------
+    url     :   str
+                location of the delimited file to read
+    sep     :   str
+                delimiter used in the file (default: ',')
+    header  :   int or None
+                row containing the column names, passed to pandas.read_csv.
+
+    Returns
+    -------
+    pandas.DataFrame of the file, with all columns read as strings.
+    """
+    name = url.rstrip("/").split("/")[-1].rsplit(".", 1)[0]
+
+    def build():
+        frame = pd.read_csv(
+            _open(url), sep=sep, header=header, encoding="latin1", dtype=str
+        )
+        return _categorize(frame)
+
+    frame = _read_stored(name, build)
+    if header is None:
+        # column names are stored as strings, so restore the positional names
+        frame.columns = pd.RangeIndex(frame.shape[1])
+    return frame
+
+
+def build(path=None):
+    """
+    Write the reference tables that do not ship with cenpy, so that they can
+    be packaged alongside it when redistributing cenpy. Requires pyarrow.
+
+    Parameters
+    ----------
+    path    :   str
+                directory into which the tables are written. (default: the
+                directory containing cenpy)
+
+    Returns
+    -------
+    list of the paths written
+    """
+    if path is None:
+        path = _packagedir
+    written = []
+    for name, builder in diter(dict(places=_build_places)):
+        target = os.path.join(path, _filename(name))
+        _write(builder(), target)
+        written.append(target)
+    return written
+
+
+def _filename(name):
+    return "{}-v{}.parquet".format(name, REFERENCE_VERSION)
+
+
+def _can_store():
+    """check whether pyarrow is available to read and write stored tables"""
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+
+def _read_stored(name, builder):
+    """
+    read a stored reference table, looking first in the package and then in the cache.
+    If neither can be read, build the table with builder() and store it in the cache.
+    """
+    if not _can_store():
+        return builder()
+    cached = os.path.join(cache_dir("reference"), _filename(name))
+    for path in (os.path.join(_packagedir, _filename(name)), cached):
+        if not os.path.exists(path):
+            continue
+        try:
+            return pd.read_parquet(path, engine="pyarrow")
+        except Exception as e:
+            warnings.warn(
+                "Could not read the stored reference table {}, so it will be"
+                " rebuilt: {}".format(path, e)
+            )
+    frame = builder()
+    _write(frame, cached)
+    return frame
+
+
+def _write(frame, path):
+    """write a table to path, through a temporary file so readers never see it half-written"""
+    tmp = path + ".tmp"
+    frame = frame.rename(columns=str)
+    frame.to_parquet(tmp, engine="pyarrow", index=False)
+    os.replace(tmp, path)
+
+
+def _build_places():
+    frame = pd.read_csv(
+        _open(
+            "https://www2.census.gov/geo/docs/reference/codes/files/national_places.txt"
+        ),
+        sep="|",
+        encoding="latin1",
+        dtype=str,
+    )
+    frame["STATEFP"] = frame.STATEFP.str.zfill(2)
+    frame["PLACEFP"] = frame.PLACEFP.str.zfill(5)
+    return _categorize(frame, exclude=("PLACEFP", "PLACENAME"))
+
+
+def _open(url):
+    """fetch a remote file through the cenpy transport, or pass a local path through"""
+    if "://" not in url:
+        return url
+    from . import transport
+
+    resp = transport.get(url)
+    resp.raise_for_status()
+    return io.BytesIO(resp.content)
+
+
+def _categorize(frame, exclude=()):
+    """convert repetitive string columns to categoricals to keep the table compact"""
+    for col in frame.columns:
+        if col in exclude:
+            continue
+        if frame[col].nunique() < (frame.shape[0] // 2):
+            frame[col] = frame[col].astype("category")
+    return frame
@@ -1,10 +1,24 @@
 import pandas as pd
-from json import JSONDecodeError
+from concurrent.futures import ThreadPoolExecutor
 import requests as r
 import numpy as np
 from . import explorer as exp
-from . import tiger as tig
+from . import transport
+from .cache import ResultStore, cache_dir, get_result_store
+from .decode import (
+    decode_table,
+    iter_tables,
+    iter_text,
+    read_table,
+    requested_columns,
+)
+from urllib.parse import urlsplit
+import asyncio
+from collections import deque
+import functools
+import json
 import math
+import os
 from six import iteritems, PY3
 
 if PY3:
@@ -17,6 +31,29 @@ class ParseException(Exception):
         self.response = response
 
 
+# where each kind of metadata is linked from the catalog entry for a dataset
+_metadata_links = dict(
+    variables="variables",
+    geographies="geography",
+    tags="tags",
+    example_entries="examples",
+)
+
+
+def _metadata_property(name, doc):
+    """a property of APIConnection that loads a kind of metadata on first access"""
+
+    def getter(self):
+        if name not in self._metadata:
+            self.load_metadata(name)
+        return self._metadata[name]
+
+    def setter(self, value):
+        self._metadata[name] = value
+
+    return property(getter, setter, doc=doc + ", fetched on first use")
+
+
 class APIConnection:
     """The fundamental building block for US Census Bureau data API Endpoints"""
 
@@ -33,7 +70,7 @@ class APIConnection:
         """
         if "eits" not in api_name and api_name is not None:
             try:
-                curr = exp.APIs[api_name]
+                curr = exp.catalog[api_name]
             except KeyError:
                 raise KeyError(
                     "The requested Census Product shortcode ({}) was not found in the "
@@ -61,34 +98,11 @@ class APIConnection:
 
             if "documentation" in self.__urls__.keys():
                 self.doclink = self.__urls__["documentation"]
-            if "variables" in self.__urls__.keys():
-                v = pd.DataFrame()
-                variables = r.get(self.__urls__["variables"])
-                variables.raise_for_status()
-
-                self.variables = v.from_dict(variables.json()["variables"]).T
-            if "geography" in self.__urls__.keys():
-                res = r.get(self.__urls__["geography"])
-                res.raise_for_status()
-                res = res.json()
-                self.geographies = {
-                    k: pd.DataFrame().from_dict(v) for k, v in iteritems(res)
-                }
-            if "tags" in self.__urls__.keys():
-                try:
-                    tags = r.get(self.__urls__["tags"])
-                    tags.raise_for_status()
-                    self.tags = list(tags.json().values())[0]
-                except r.HTTPError:
-                    pass
-
-            if "examples" in self.__urls__.keys():
-                try:
-                    examples = r.get(self.__urls__["examples"])
-                    examples.raise_for_status()
-                    self.example_entries = examples.json()
-                except r.HTTPError:
-                    pass
+            # metadata is only fetched when it is first used. Vintages of a
+            # dataset never change, so their metadata is kept on disk.
+            self.vintage = curr.get("c_vintage")
+            self._metadata = dict()
+            self._mapservice = None
 
         elif "eits" in api_name:
             raise NotImplementedError("EITS datasets are not supported at this time")
@@ -97,8 +111,78 @@ class APIConnection:
                 "Pick dataset identifier using the cenpy.explorer.available() function"
             )
 
+    variables = _metadata_property(
+        "variables", "table of the variables and predicates available in the dataset"
+    )
+    geographies = _metadata_property(
+        "geographies", "tables of the geographic levels the dataset is published at"
+    )
+    tags = _metadata_property("tags", "list of keywords describing the dataset")
+    example_entries = _metadata_property(
+        "example_entries", "example queries published for the dataset"
+    )
+
+    @property
+    def variable_index(self):
+        """
+        search index over the variables of the dataset, used by varslike.
+        Built on first use, and rebuilt if the variables are replaced.
+        """
+        from .search import VariableIndex
+
+        index = getattr(self, "_variable_index", None)
+        if index is None or index.frame is not self.variables:
+            index = self._variable_index = VariableIndex(self.variables)
+        return index
+
+    def load_metadata(self, *names):
+        """
+        Fetch metadata describing the dataset, if it has not been fetched already.
+        Metadata is otherwise fetched on first use, one document at a time.
+
+        Parameters
+        ----------
+        *names  :   str
+                    which metadata to load, out of "variables", "geographies",
+                    "tags", and "example_entries". If none are given, all are
+                    loaded. Documents not yet loaded are fetched concurrently.
+
+        Returns
+        -------
+        this APIConnection
+        """
+        names = names if names else tuple(_metadata_links)
+        missing = [name for name in names if name not in self._metadata]
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                loaded = list(pool.map(self._fetch_metadata, missing))
+        else:
+            loaded = [self._fetch_metadata(name) for name in missing]
+        for name, value in zip(missing, loaded):
+            self._metadata.setdefault(name, value)
+        return self
+
+    def _fetch_metadata(self, name):
+        """fetch and parse a metadata document, or return None if there is none"""
+        link = self.__urls__.get(_metadata_links[name])
+        if link is None:
+            return None
+        try:
+            document = _read_metadata(link, persist=self.vintage is not None)
+        except r.HTTPError:
+            if name in ("variables", "geographies"):
+                raise
+            return None
+        if name == "variables":
+            return pd.DataFrame.from_dict(document["variables"]).T
+        elif name == "geographies":
+            return {k: pd.DataFrame.from_dict(v) for k, v in iteritems(document)}
+        elif name == "tags":
+            return list(document.values())[0]
+        return document
+
     def __repr__(self):
-        if hasattr(self, "mapservice"):
+        if getattr(self, "_mapservice", None) is not None:
             return str(
                 "Connection to "
                 + self.title
@@ -106,7 +190,7 @@ class APIConnection:
                 + self.identifier
                 + ")"
                 + "\nWith MapServer: "
-                + self.mapservice.title
+                + self._mapservice_title
             )
         else:
             return str("Connection to " + self.title + " (ID: " + self.identifier + ")")
@@ -176,20 +260,285 @@ class APIConnection:
         the end. Sometimes, the USCB might frown on large-column queries,
         so be careful with this. Cenpy is not liable for your key getting
         banned if you query tens of thousands of columns at once.
+
+        Unless convert_numeric=False is passed, each column is decoded into a
+        typed column: the geographies added to each row into categoricals,
+        and the requested columns according to their predicateType, if the
+        variables of the connection have been loaded. Otherwise, columns of
+        numbers are decoded as numbers, and other columns are left as strings.
+        Integers are kept as int32 where they fit.
+
+        A whole table can be requested as a column like "group(B01001)". The
+        response then has every variable in the table, including margins of
+        error and annotations, along with the GEO_ID and NAME of each row.
+
+        Pass output="arrow" to build a pyarrow.Table from the decoded columns
+        instead of a dataframe, or dtype_backend="pyarrow" (or "numpy_nullable")
+        for a dataframe with Arrow-backed (or nullable) dtypes. Both need pyarrow,
+        except for "numpy_nullable", and dtype_backend needs pandas 2.0 or newer.
+        Arrow tables have no index, so `index` is ignored for them.
+
+        If a ResultStore has been set with cenpy.cache.set_result_store (or
+        is passed as `store`), the query is answered from the store, and only
+        the values it does not hold yet are requested from the API. Pass
+        store=False to skip the store. Queries of a group(), or with other
+        search predicates, are not stored.
         """
         assert not (cols is None), "Columns must be provided for query!"
 
         if not geo_unit and "geo_unit" in self.variables.index:
             geo_unit = "us:00"
 
+        store = kwargs.pop("store", None)
+        if store is None:
+            store = get_result_store()
+        elif store is False:
+            store = None
+        if store is not None and _storable(cols, geo_unit, kwargs):
+            return self._stored_query(
+                store, cols, geo_unit, geo_filter, apikey, **kwargs
+            )
+
         if len(cols) >= 50:
-            return self._bigcolq(cols, geo_unit, geo_filter, apikey, **kwargs)
+            return self._bigcolq(
+                cols, geo_unit, geo_filter, apikey, store=False, **kwargs
+            )
 
-        self.last_query = self.cxn
+        # concurrency only applies to the chunks of columns fetched by _bigcolq
+        kwargs.pop("concurrency", None)
+        convert_numeric = kwargs.pop("convert_numeric", True)
+        index = kwargs.pop("index", "")
+        output = kwargs.pop("output", "pandas")
+        dtype_backend = kwargs.pop("dtype_backend", None)
 
-        self.last_query += "get=" + ",".join(col for col in cols)
+        def decode(res):
+            try:
+                return read_table(
+                    iter_text(res),
+                    requested=cols,
+                    variables=self._decoding_variables(cols),
+                    convert=convert_numeric,
+                    output=output,
+                    dtype_backend=dtype_backend,
+                )
+            except ValueError:
+                raise ParseException(
+                    "A Valid http query passed through but failed to parse!"
+                    " For more information, inspect the `response` attribute "
+                    "of this exception.",
+                    response=res,
+                )
+
+        df = self._fetch(cols, geo_unit, geo_filter, apikey, reader=decode, **kwargs)
+        names = df.column_names if output == "arrow" else df.columns
+        assert all([col in names for col in cols if not _is_group(col)])
+        if index != "" and output != "arrow":
+            df.index = df[index]
+        return df
+
+    def explain_plan(self, cols=None, geo_unit="", geo_filter={}, apikey="", **kwargs):
+        """
+        Estimate the cost of a query, without running it.
+
+        Takes the same arguments as APIConnection.query, along with the
+        `concurrency` of the requests and the expected `latency` of each, in
+        seconds (default: 1.0). The number of geographies a query with wildcards
+        returns is estimated from the approximate number of geographies at
+        each level nationally, as if geographies were spread evenly.
+
+        Returns
+        -------
+        dict with the number of requests, the number of geographies, cells, and
+        bytes expected in the result, and the seconds expected to make the
+        requests, paced by the rate limit on cenpy's transport for the API key.
+        See cenpy.planner.estimate
+        """
+        from .planner import _codes, _count_within, estimate
+
+        assert not (cols is None), "Columns must be provided for query!"
+        concurrency = kwargs.pop("concurrency", 8)
+        latency = kwargs.pop("latency", 1.0)
+        level, _, codes = (geo_unit or "us:00").partition(":")
+        within = {k: _codes(v) for k, v in iteritems(geo_filter)}
+        within[level] = codes or "*"
+        return estimate(
+            self,
+            cols,
+            1,
+            _count_within(level, within),
+            apikey=apikey or self.apikey,
+            concurrency=concurrency,
+            latency=latency,
+        )
+
+    def select(self, *cols):
+        """
+        Start a query of the variables in cols, to be run later. See
+        cenpy.deferred.Query
+
+        Example
+        --------
+        To grab the total population of all of the tracts in Arizona:
+
+            >>> cxn.select('B01001_001E').where(state='04').at('tract').collect()
+        """
+        from .deferred import Query
+
+        return Query(self).select(*cols)
+
+    def _stored_query(self, store, cols, geo_unit, geo_filter, apikey, **kwargs):
+        """
+        answer a query from a ResultStore, requesting only the cells the store
+        is missing from the API. For queries that list each geography, only
+        the missing geographies are requested. For queries using wildcards,
+        missing variables are requested for every geography the query matches.
+        """
         convert_numeric = kwargs.pop("convert_numeric", True)
         index = kwargs.pop("index", "")
+        output = kwargs.pop("output", "pandas")
+        dtype_backend = kwargs.pop("dtype_backend", None)
+        cols = list(cols)
+        level, codes = geo_unit.split(":", 1)
+        key = (self.identifier, str(self.vintage), level)
+        listed = codes != "*" and not any(
+            "*" in str(v) or "," in str(v) for v in geo_filter.values()
+        )
+        if listed:
+            scope = None
+            by_geoid = {
+                ResultStore.geoid(dict(geo_filter, **{level: code})): code
+                for code in codes.split(",")
+            }
+            geoids = list(by_geoid)
+        else:
+            scope = ResultStore.scope(geo_unit, geo_filter)
+            geoids = store.members(key, scope)
+
+        if geoids is None:
+            missing = cols
+        else:
+            found = store.cells(key, geoids, cols)
+            missing = [c for c in cols if any((g, c) not in found for g in geoids)]
+        if missing:
+            if listed:
+                fetch = [g for g in geoids if any((g, c) not in found for c in cols)]
+                geo_unit = "{}:{}".format(level, ",".join(by_geoid[g] for g in fetch))
+            raw = self.query(
+                missing,
+                geo_unit,
+                geo_filter,
+                apikey,
+                store=False,
+                convert_numeric=False,
+                **kwargs
+            )
+            values = raw.astype(object).where(raw.notna(), None)
+            store.put(key, list(raw.columns), values.values.tolist(), missing, scope)
+            if geoids is None:
+                geoids = store.members(key, scope)
+
+        # geographies listed in the query but not returned by the API are skipped
+        geographies = store.geographies(key, geoids)
+        geoids = [geoid for geoid in geoids if geoid in geographies]
+        found = store.cells(key, geoids, cols)
+        geo_columns = list(geographies[geoids[0]]) if geoids else [level]
+        header = cols + geo_columns
+        rows = [
+            [found.get((geoid, col)) for col in cols]
+            + list(geographies[geoid].values())
+            for geoid in geoids
+        ]
+        df = decode_table(
+            header,
+            rows,
+            requested=cols,
+            variables=self._metadata.get("variables"),
+            convert=convert_numeric,
+            output=output,
+            dtype_backend=dtype_backend,
+        )
+        if index != "" and output != "arrow":
+            df.index = df[index]
+        return df
+
+    def query_batches(
+        self,
+        cols=None,
+        geo_unit="",
+        geo_filter={},
+        apikey="",
+        batch_size=10000,
+        **kwargs
+    ):
+        """
+        Conduct a query over the USCB api connection, yielding the result in
+        batches of rows as the response streams in.
+
+        Parameters
+        -----------
+        batch_size : int
+                     largest number of rows in each batch (default: 10000)
+
+        The other arguments are the same as for APIConnection.query, except that
+        at most 49 columns may be requested at once.
+
+        Returns
+        --------
+        generator of pandas.DataFrame
+            batches of the results from the API. The columns of each batch are
+            decoded separately, so columns whose type is not known from the
+            variables of the connection may be decoded differently in each batch.
+            Unlike query(), a response that breaks off after batches have been
+            yielded is not requested again, and the error is raised instead.
+        """
+        assert not (cols is None), "Columns must be provided for query!"
+        if len(cols) >= 50:
+            raise ValueError(
+                "At most 49 columns can be streamed in batches, but {} were"
+                " requested. Use query() for larger queries.".format(len(cols))
+            )
+        if not geo_unit and "geo_unit" in self.variables.index:
+            geo_unit = "us:00"
+        convert_numeric = kwargs.pop("convert_numeric", True)
+        index = kwargs.pop("index", "")
+        output = kwargs.pop("output", "pandas")
+        dtype_backend = kwargs.pop("dtype_backend", None)
+        res = self._fetch(cols, geo_unit, geo_filter, apikey, **kwargs)
+        try:
+            for df in iter_tables(
+                iter_text(res),
+                requested=cols,
+                variables=self._decoding_variables(cols),
+                convert=convert_numeric,
+                batch_size=batch_size,
+                output=output,
+                dtype_backend=dtype_backend,
+            ):
+                if index != "" and output != "arrow":
+                    df.index = df[index]
+                yield df
+        finally:
+            res.close()
+
+    def _decoding_variables(self, cols):
+        """
+        the variables used to decode the result of a query. These are loaded for
+        queries of a group(), to find the variables in the group.
+        """
+        if any(_is_group(col) for col in cols):
+            return self.variables
+        return self._metadata.get("variables")
+
+    def _fetch(self, cols, geo_unit, geo_filter, apikey, reader=None, **kwargs):
+        """
+        build the url for a query into last_query, and request it, returning
+        the response with its body still to be streamed. If a reader is given,
+        the result of reader(response) is returned instead, and the query is
+        made again if the body breaks off or fails to parse while it is read.
+        """
+        self.last_query = self.cxn
+
+        self.last_query += "get=" + ",".join(col for col in cols)
 
         if geo_unit:
             self.last_query += "&for=" + geo_unit
@@ -210,61 +559,191 @@ class APIConnection:
                 ["&{k}={v}".format(k=k, v=v) for k, v in iteritems(kwargs)]
             )
 
-        res = r.get(self.last_query)
-        if res.status_code == 204:
-            raise r.HTTPError(
-                " ".join((str(res.status_code), "error: no records matched your query"))
+        if reader is not None:
+            return transport.read(
+                self.last_query,
+                lambda res: reader(_checked(res)),
+                errors=(ParseException,),
+                retry_on=_malformed_table,
+                stream=True,
             )
-        try:
-            json_content = res.json()
-            df = pd.DataFrame().from_records(json_content[1:], columns=json_content[0])
-            assert all([col in df.columns for col in cols])
-            if convert_numeric:
-                df = df.infer_objects()
-            if index != "":
-                df.index = df[index]
-            return df
-        except (ValueError, JSONDecodeError):
-            if res.status_code == 400:
-                raise r.HTTPError(
-                    "400 " + "\n".join(map(lambda x: x.decode(), res.iter_lines()))
-                )
-            else:
-                res.raise_for_status()
-                raise ParseException(
-                    "A Valid http query passed through but failed to parse!"
-                    " For more information, inspect the `response` attribute "
-                    "of this exception.",
-                    response=res,
-                )
+        res = transport.get(self.last_query, retry_on=_malformed_table, stream=True)
+        return _checked(res)
+
+    async def aquery(self, cols=None, geo_unit="", geo_filter={}, apikey="", **kwargs):
+        """
+        Conduct a query over the USCB api connection from within a running asyncio event loop.
+
+        This is the asyncio counterpart of APIConnection.query, and takes the same
+        arguments. The request is run in the event loop's default executor,
+        so that other coroutines can proceed while it is waiting on the network.
+
+        Returns
+        --------
+        pandas.DataFrame
+            results from the API
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            functools.partial(self.query, cols, geo_unit, geo_filter, apikey, **kwargs),
+        )
+
+    async def aquery_many(self, specs, concurrency=8, **kwargs):
+        """
+        Conduct many queries over the USCB api connection concurrently from within
+        a running asyncio event loop.
+
+        Parameters
+        -----------
+        specs : list
+                queries to conduct. Each query is either a tuple of
+                (cols, geo_unit, geo_filter), or a dictionary of arguments
+                to APIConnection.query.
+        concurrency : int
+                      the maximum number of queries in flight at once. (default: 8)
+        **kwargs : additional arguments passed to every query
+
+        Returns
+        --------
+        list of pandas.DataFrame, one for each query in the order of `specs`
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(spec):
+            args, spec_kwargs = _unpack_spec(spec, kwargs)
+            async with semaphore:
+                return await self.aquery(*args, **spec_kwargs)
+
+        return list(await asyncio.gather(*[bounded(spec) for spec in specs]))
 
-    def _bigcolq(self, cols=None, geo_unit="", geo_filter={}, apikey=None, **kwargs):
+    def iquery_many(self, specs, concurrency=8, **kwargs):
+        """
+        Conduct many queries over the USCB api connection concurrently, yielding
+        each result in the order of `specs` as soon as it (and all results before it)
+        are available.
+
+        This uses a pool of threads, so it can be used whether or not an
+        asyncio event loop is running. For the arguments, see APIConnection.query_many.
+        At most 2 * concurrency queries are submitted ahead of the result last
+        yielded, so results that have not been consumed yet do not pile up in
+        memory.
+
+        Returns
+        --------
+        a Generator that yields pandas.DataFrames
+        """
+        if concurrency <= 1:
+            for spec in specs:
+                args, spec_kwargs = _unpack_spec(spec, kwargs)
+                yield self.query(*args, **spec_kwargs)
+            return
+        specs = iter(specs)
+        window = deque()
+
+        def submit(pool):
+            for spec in specs:
+                args, spec_kwargs = _unpack_spec(spec, kwargs)
+                window.append(pool.submit(self.query, *args, **spec_kwargs))
+                return True
+            return False
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            try:
+                while len(window) < 2 * concurrency and submit(pool):
+                    pass
+                while window:
+                    result = window.popleft().result()
+                    submit(pool)
+                    yield result
+            finally:
+                for future in window:
+                    future.cancel()
+
+    def query_many(self, specs, concurrency=8, **kwargs):
+        """
+        Conduct many queries over the USCB api connection concurrently.
+
+        Parameters
+        -----------
+        specs : list
+                queries to conduct. Each query is either a tuple of
+                (cols, geo_unit, geo_filter), or a dictionary of arguments
+                to APIConnection.query.
+        concurrency : int
+                      the maximum number of queries in flight at once. (default: 8)
+        **kwargs : additional arguments passed to every query
+
+        Returns
+        --------
+        list of pandas.DataFrame, one for each query in the order of `specs`
+
+        Example
+        --------
+        To grab the total population of the tracts in two Arizona counties at once:
+
+            >>> cxn.query_many([(['P0010001'], 'tract:*', {'state':'04', 'county':'019'}),
+            ...                 (['P0010001'], 'tract:*', {'state':'04', 'county':'013'})])
+        """
+        return list(self.iquery_many(specs, concurrency=concurrency, **kwargs))
+
+    def _bigcolq(
+        self,
+        cols=None,
+        geo_unit="",
+        geo_filter={},
+        apikey=None,
+        concurrency=8,
+        **kwargs
+    ):
         """
         Helper function to manage large queries
 
         Parameters
         -----------
         cols : large list of columns to be grabbed in a query
+        concurrency : number of chunks of columns to request at once (default: 8)
+
+        Notes
+        ------
+        The columns are requested in chunks of at most 49 columns, concurrently.
+        Each chunk is indexed on the geography columns returned by the API, and
+        the chunks are then aligned on that index in a single concatenation.
         """
         assert not (cols is None), "Columns must be provided for query!"
+        if apikey is None:
+            apikey = ""
         if len(cols) < 50:
-            print("tiny query!")
             return self.query(cols, geo_unit, geo_filter, apikey, **kwargs)
-        else:
-            chunks = np.array_split(cols, math.ceil(len(cols) / 49.0))
-            for chunk in chunks:
-                tdf = self.query(list(chunk), geo_unit, geo_filter, apikey, **kwargs)
-                try:
-                    # join on the shared columns
-                    ids = tuple(tdf.columns[tdf.columns.isin(result.columns)])
-                    result = pd.merge(result, tdf, on=ids)
-                except UnboundLocalError:
-                    result = tdf
-                except KeyError:
-                    print(tdf.columns)
-                    print(result.columns)
-                    print(ids)
-            return result
+        index = kwargs.pop("index", "")
+        chunks = np.array_split(cols, math.ceil(len(cols) / 49.0))
+        results = self.query_many(
+            [(list(chunk), geo_unit, geo_filter, apikey) for chunk in chunks],
+            concurrency=concurrency,
+            **kwargs
+        )
+        # the geography columns are returned with every chunk, so they key the chunks
+        arrow = kwargs.get("output", "pandas") == "arrow"
+        header = list(results[0].column_names if arrow else results[0].columns)
+        requested = requested_columns(
+            header, list(chunks[0]), self._decoding_variables(cols)
+        )
+        keys = [col for col in header if col not in requested]
+        if arrow:
+            result = _join_tables(results, keys)
+            names = [col for col in result.column_names if col not in keys]
+            return result.select(names + keys)
+        if keys:
+            results = [result.set_index(keys) for result in results]
+        result = pd.concat(results, axis=1)
+        # the GEO_ID and NAME of each row come back with each chunk holding a group
+        result = result.loc[:, ~result.columns.duplicated()]
+        if keys:
+            result = result.reset_index()
+        result = result[[col for col in result.columns if col not in keys] + keys]
+        if index != "":
+            result.index = result[index]
+        return result
 
     def varslike(self, pattern=None, by=None, engine="re", within=None):
         """
@@ -272,14 +751,17 @@ class APIConnection:
 
         Parameters
         ----------
-        pattern : str
-                  a search pattern to match
+        pattern : str or list of str
+                  a search pattern to match, or a list of patterns, any of
+                  which may match
         by      : str
                   a column in the APIConnection.variables to conduct the search
                   within
-        engine  : {'re', 'fnmatch', callable}
+        engine  : {'re', 'fnmatch', 'prefix', 'tokens', callable}
                   backend string matching module to use, or a function of the form
-                  match(candidate, pattern). (default: 're')
+                  match(candidate, pattern). 'prefix' matches the start of
+                  the column, and 'tokens' matches columns containing all of the
+                  words in the pattern, in any order and ignoring case. (default: 're')
         within  : pandas.DataFrame 
                   the variables over which to search.
 
@@ -307,28 +789,29 @@ class APIConnection:
         or an fnmatch pattern:
 
             >>> cxn.varslike('*_100M', engine='fnmatch')
+
+        Searches over the variables of the connection use its variable_index,
+        which is kept between searches, so only the variables that could match
+        a pattern are checked.
         """
         if within is None:
             within = self.variables
-        search_in = within.get(by, within.index).fillna("")
-
-        if (engine == "regex") or (engine == "re"):
-            import re
-
-            mask = [
-                (re.search(pattern, candidate) is not None) for candidate in search_in
-            ]
-        elif engine == "fnmatch":
-            import fnmatch
-
-            matches = fnmatch.filter(search_in, pattern)
-            mask = search_in.isin(matches)
-        elif callable(engine):
-            matches = [ix for ix in search_in if engine(ix, pattern)]
-            mask = search_in.isin(matches)
+        if isinstance(pattern, str):
+            patterns = [pattern]
+        else:
+            patterns = list(pattern)
+
+        if callable(engine):
+            search_in = within.get(by, within.index).fillna("")
+            mask = [any(engine(ix, p) for p in patterns) for ix in search_in]
+            return within[mask]
+        if within is self.variables:
+            index = self.variable_index
         else:
-            raise TypeError("Engine option is not supported or not callable.")
-        return within[mask]
+            from .search import VariableIndex
+
+            index = VariableIndex(within)
+        return within.iloc[index.match_many(patterns, by=by, engine=engine)]
 
     def set_mapservice(self, key):
         """
@@ -342,9 +825,135 @@ class APIConnection:
         Returns
         --------
         adds a mapservice attribute to the connection object, returns none.
+        When key is a string, the mapservice is connected on first use.
         """
-        if isinstance(key, tig.TigerConnection):
-            self.mapservice = key
-        elif isinstance(key, str):
-            self.mapservice = tig.TigerConnection(name=key)
+        self.mapservice = key
         return self
+
+    @property
+    def mapservice(self):
+        """the TigerConnection providing geometries for this connection"""
+        from . import tiger as tig
+
+        if isinstance(self._mapservice, str):
+            self._mapservice = tig.TigerConnection(name=self._mapservice)
+        return self._mapservice
+
+    @mapservice.setter
+    def mapservice(self, key):
+        self._mapservice = key
+
+    @property
+    def _mapservice_title(self):
+        """title of the mapservice, without connecting to it"""
+        if isinstance(self._mapservice, str):
+            return self._mapservice
+        return self._mapservice.title
+
+
+def _read_metadata(url, persist=False):
+    """
+    read a metadata document of a dataset. If persist, the document is
+    kept in the cenpy cache directory and only fetched once.
+    """
+    parts = urlsplit(url)
+    path = os.path.join(
+        cache_dir("metadata", parts.netloc, *parts.path.strip("/").split("/")[:-1]),
+        os.path.basename(parts.path),
+    )
+    if persist and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    resp = transport.get(url)
+    resp.raise_for_status()
+    document = resp.json()
+    if persist:
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(document, f)
+        os.replace(tmp, path)
+    return document
+
+
+def _join_tables(tables, keys):
+    """align pyarrow tables holding different columns for the same geographies"""
+    import pyarrow as pa
+
+    def plain_keys(table):
+        for key in keys:
+            i = table.schema.get_field_index(key)
+            table = table.set_column(i, key, table[key].cast(pa.string()))
+        return table
+
+    if not keys:
+        return pa.table(
+            {name: table[name] for table in tables for name in table.column_names}
+        )
+    result = plain_keys(tables[0])
+    for table in tables[1:]:
+        shared = set(result.column_names).intersection(table.column_names)
+        table = table.drop_columns([name for name in shared if name not in keys])
+        result = result.join(plain_keys(table), keys, join_type="full outer")
+    result = result.sort_by([(key, "ascending") for key in keys])
+    for key in keys:
+        i = result.schema.get_field_index(key)
+        result = result.set_column(i, key, result[key].dictionary_encode())
+    return result
+
+
+def _storable(cols, geo_unit, kwargs):
+    """
+    check whether the result of a query can be kept in a ResultStore: it
+    names each variable, and is not narrowed by any search predicates
+    """
+    options = {"convert_numeric", "index", "output", "dtype_backend", "concurrency"}
+    return (
+        ":" in geo_unit
+        and not any(_is_group(col) for col in cols)
+        and set(kwargs).issubset(options)
+    )
+
+
+def _is_group(col):
+    """check whether a requested column is a group of variables, like group(B01001)"""
+    return col.startswith("group(") and col.endswith(")")
+
+
+def _checked(res):
+    """raise an HTTPError for a response to a query that failed or matched nothing"""
+    if res.status_code == 204:
+        res.close()
+        raise r.HTTPError(
+            " ".join((str(res.status_code), "error: no records matched your query"))
+        )
+    if res.status_code == 400:
+        raise r.HTTPError("400 " + res.text)
+    res.raise_for_status()
+    return res
+
+
+def _malformed_table(res):
+    """
+    check whether a successful response from the Census API is not the JSON table
+    it should be, which happens when the API is overloaded. These are retried.
+    The type of the content is checked if it is given, so that the body of
+    the response can still be streamed.
+    """
+    if res.status_code != 200:
+        return False
+    content_type = res.headers.get("Content-Type")
+    if content_type is not None:
+        return "json" not in content_type.lower()
+    return not res.content.lstrip().startswith(b"[")
+
+
+def _unpack_spec(spec, kwargs):
+    """
+    split a query specification for query_many into the positional and keyword
+    arguments of APIConnection.query, filling in the shared keyword arguments
+    """
+    spec_kwargs = dict(kwargs)
+    if isinstance(spec, dict):
+        spec_kwargs.update(spec)
+        return (), spec_kwargs
+    return tuple(spec), spec_kwargs
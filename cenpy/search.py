@@ -0,0 +1,289 @@
+"""
+Search over the variables published by a Census API dataset.
+
+Variable tables can have tens of thousands of rows, so rather than scanning
+every name or label for each pattern, the VariableIndex keeps, for each
+searched column, a trigram index used to narrow regular expressions to rows
+that could possibly match, a sorted order used for prefix queries, and an
+index of words for token queries. Each of these is built on first use.
+"""
+
+import fnmatch as _fnmatch
+import re
+import numpy as np
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # python < 3.11
+    import sre_parse
+    import sre_constants
+
+_tokenizer = re.compile(r"[a-z0-9]+")
+
+
+class VariableIndex(object):
+    """A search index over the names, labels, concepts and groups of variables"""
+
+    def __init__(self, frame):
+        """
+        Parameters
+        ----------
+        frame   :   pandas.DataFrame
+                    table of variables, indexed by variable name, like
+                    APIConnection.variables. Any column of the table, or
+                    "name" for the index, can be searched.
+        """
+        self.frame = frame
+        self._values = dict()
+        self._trigrams = dict()
+        self._tokens = dict()
+        self._order = dict()
+
+    def __repr__(self):
+        return "VariableIndex({} variables)".format(len(self))
+
+    def __len__(self):
+        return self.frame.shape[0]
+
+    def values(self, by=None):
+        """
+        The strings searched for a column, as a numpy array. If by is None or not a
+        column of the table, the variable names are searched.
+        """
+        by = by if by in self.frame.columns else "name"
+        if by not in self._values:
+            column = self.frame.index if by == "name" else self.frame[by]
+            self._values[by] = np.asarray(column.fillna("").astype(str), dtype=object)
+        return self._values[by]
+
+    def _trigram_index(self, by):
+        key = by if by in self.frame.columns else "name"
+        if key not in self._trigrams:
+            postings = dict()
+            for i, value in enumerate(self.values(by)):
+                for gram in {value[j : j + 3] for j in range(len(value) - 2)}:
+                    postings.setdefault(gram, []).append(i)
+            self._trigrams[key] = {
+                gram: np.asarray(rows, dtype=np.int64)
+                for gram, rows in postings.items()
+            }
+        return self._trigrams[key]
+
+    def _token_index(self, by):
+        key = by if by in self.frame.columns else "name"
+        if key not in self._tokens:
+            postings = dict()
+            for i, value in enumerate(self.values(by)):
+                for token in set(_tokenizer.findall(value.lower())):
+                    postings.setdefault(token, []).append(i)
+            self._tokens[key] = {
+                token: np.asarray(rows, dtype=np.int64)
+                for token, rows in postings.items()
+            }
+        return self._tokens[key]
+
+    def _sorted(self, by):
+        key = by if by in self.frame.columns else "name"
+        if key not in self._order:
+            values = self.values(by)
+            order = np.argsort(values, kind="stable")
+            self._order[key] = (order, values[order])
+        return self._order[key]
+
+    def candidates(self, pattern, by=None):
+        """
+        Rows that could match a regular expression, or None if the pattern has
+        no literal text of three or more characters that every match must contain.
+        """
+        literals = _required_literals(pattern)
+        if not literals:
+            return None
+        index = self._trigram_index(by)
+        rows = None
+        for literal in literals:
+            for j in range(len(literal) - 2):
+                posting = index.get(literal[j : j + 3])
+                if posting is None:
+                    return np.empty(0, dtype=np.int64)
+                rows = (
+                    posting
+                    if rows is None
+                    else np.intersect1d(rows, posting, assume_unique=True)
+                )
+        return rows
+
+    def regex(self, pattern, by=None):
+        """
+        Rows where a regular expression matches anywhere in the column (as re.search)
+
+        Returns
+        -------
+        sorted numpy array of row positions
+        """
+        compiled = re.compile(pattern)
+        values = self.values(by)
+        rows = self.candidates(pattern, by)
+        if rows is None:
+            rows = np.arange(len(values))
+        return np.asarray(
+            [i for i in rows if compiled.search(values[i]) is not None], dtype=np.int64
+        )
+
+    def prefix(self, prefix, by=None):
+        """
+        Rows where the column starts with prefix.
+
+        Returns
+        -------
+        sorted numpy array of row positions
+        """
+        order, ordered = self._sorted(by)
+        lo = np.searchsorted(ordered, prefix, side="left")
+        hi = np.searchsorted(ordered, prefix + "\U0010ffff", side="left")
+        return np.sort(order[lo:hi])
+
+    def fnmatch(self, pattern, by=None):
+        """
+        Rows where the whole column matches a shell-style wildcard pattern,
+        as in fnmatch.fnmatchcase
+
+        Returns
+        -------
+        sorted numpy array of row positions
+        """
+        if not any(c in pattern for c in "*?["):
+            rows = self.prefix(pattern, by)
+            return rows[self.values(by)[rows] == pattern]
+        return self.regex(r"\A" + _fnmatch.translate(pattern), by)
+
+    def tokens(self, *words, by="label"):
+        """
+        Rows where the column contains all of the given words, ignoring case
+        and punctuation. Labels are searched by default.
+
+        Returns
+        -------
+        sorted numpy array of row positions
+        """
+        index = self._token_index(by)
+        rows = None
+        for word in words:
+            for token in _tokenizer.findall(str(word).lower()):
+                posting = index.get(token, np.empty(0, dtype=np.int64))
+                rows = (
+                    posting
+                    if rows is None
+                    else np.intersect1d(rows, posting, assume_unique=True)
+                )
+        return np.arange(len(self)) if rows is None else rows
+
+    def match(self, pattern, by=None, engine="re"):
+        """
+        Rows matching a pattern using the named engine.
+
+        Parameters
+        ----------
+        pattern :   str
+                    the pattern to match
+        by      :   str
+                    column to search. (default: the variable names)
+        engine  :   {'re', 'regex', 'fnmatch', 'prefix', 'tokens'}
+                    how to interpret the pattern (default: 're')
+
+        Returns
+        -------
+        sorted numpy array of row positions
+        """
+        if engine in ("re", "regex"):
+            return self.regex(pattern, by)
+        elif engine == "fnmatch":
+            return self.fnmatch(pattern, by)
+        elif engine == "prefix":
+            return self.prefix(pattern, by)
+        elif engine == "tokens":
+            return self.tokens(pattern, by="label" if by is None else by)
+        raise TypeError("Engine option is not supported or not callable.")
+
+    def match_many(self, patterns, by=None, engine="re"):
+        """
+        Rows matching any of the patterns.
+
+        Regular expressions that can be narrowed using the trigram index are
+        matched against their candidates. The rest are combined into one
+        expression, so the column is scanned at most once, unless any of them
+        has groups. Then, each is scanned on its own.
+
+        Returns
+        -------
+        sorted numpy array of row positions
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        if engine not in ("re", "regex"):
+            found = [self.match(pattern, by, engine) for pattern in patterns]
+            return _union(found)
+        found, scan = [], []
+        for pattern in patterns:
+            if self.candidates(pattern, by) is None:
+                scan.append(pattern)
+            else:
+                found.append(self.regex(pattern, by))
+        if len(scan) > 1 and not any(_has_groups(pattern) for pattern in scan):
+            try:
+                combined = "|".join("(?:{})".format(pattern) for pattern in scan)
+                found.append(self.regex(combined, by))
+            except re.error:
+                # patterns with global flags can't be combined
+                found.extend(self.regex(pattern, by) for pattern in scan)
+        else:
+            # combining patterns renumbers their groups, so a backreference in
+            # one could silently point into another
+            found.extend(self.regex(pattern, by) for pattern in scan)
+        return _union(found)
+
+
+def _has_groups(pattern):
+    """check whether a regular expression has groups, which backreferences refer to"""
+    try:
+        return re.compile(pattern).groups > 0
+    except re.error:
+        return True
+
+
+def _union(found):
+    if not found:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(found)).astype(np.int64)
+
+
+def _required_literals(pattern):
+    """
+    find runs of literal text, three characters or longer, that any string
+    matching the regular expression must contain. Returns an empty list if there
+    are none, or if the pattern is not understood well enough to be sure.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, TypeError):
+        return []
+    if parsed.state.flags & (re.IGNORECASE | re.VERBOSE):
+        return []
+    runs = []
+    _collect_literals(parsed, runs)
+    return [run for run in runs if len(run) >= 3]
+
+
+def _collect_literals(parsed, runs):
+    """gather the runs of literals in a parsed pattern that every match passes through"""
+    current = []
+    for op, arg in parsed:
+        if op is sre_constants.LITERAL:
+            current.append(chr(arg))
+            continue
+        runs.append("".join(current))
+        current = []
+        # groups are required when they are not repeated or alternated
+        if op is sre_constants.SUBPATTERN and not arg[1] & re.IGNORECASE:
+            _collect_literals(arg[-1], runs)
+    runs.append("".join(current))
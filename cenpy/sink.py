@@ -0,0 +1,215 @@
+"""
+Write the results of long extractions to disk as they arrive.
+
+The generators in cenpy.tools, like genstate_to_block or gennational_to_block,
+yield one dataframe for each query they run. Gathering those into one table
+needs the whole extraction in memory at once, which for the blocks of every
+state is many gigabytes. A ParquetSink instead writes each dataframe straight
+to a Parquet dataset, partitioned into state=.../county=... directories as
+Hive does, and keeps none of them.
+
+Every file in the dataset is written with the same schema, fixed before the
+first dataframe arrives, so that a column decoded as int32 in one county and
+as float64 in another (because it has missing values there) is stored the same
+way in both. Reading the dataset needs pyarrow, or any other Parquet reader that
+understands Hive partitioning.
+
+>>> schema = sink.table_schema(cxn, "block", ["P001001"])
+>>> blocks = sink.ParquetSink("blocks", schema)
+>>> blocks.write_all(tools.gennational_to_block(cxn, "P001001"))
+"""
+
+import os
+import uuid
+
+from .decode import _import_pyarrow, column_kinds
+from .planner import Planner
+
+# the type in which each kind of decoded column is stored
+_arrow_types = {"int": "int64", "float": "float64", "string": "string", "geo": "string"}
+
+
+def table_schema(cxn, level, columns):
+    """
+    Build the schema of the table of columns for every geography at a level,
+    from the predicateType of each variable in the dataset.
+
+    Parameters
+    ----------
+    cxn     :   cenpy.remote.APIConnection
+                connection to the dataset the columns are queried from
+    level   :   str
+                level of geography queried, like "block" or "tract"
+    columns :   list of str
+                variables queried. NAME, which the cenpy.tools helpers always
+                query, is added first if it is not given.
+
+    Returns
+    -------
+    pyarrow.Schema with the variables, in order, followed by the codes of the
+    geographies enclosing each row and the code of the row itself. Integers are
+    stored as int64, and decimals, or variables whose type is not listed,
+    as float64. Geography codes are stored as strings.
+    """
+    pa = _import_pyarrow()
+    rule = Planner(cxn).rule(level)
+    columns = ["NAME"] + [col for col in columns if col != "NAME"]
+    kinds = column_kinds(columns, columns, cxn.variables)
+    fields = []
+    for name, kind in zip(columns, kinds):
+        if kind is None:
+            kind = "string" if name in ("NAME", "GEO_ID") else "float"
+        fields.append(pa.field(name, _arrow_types[kind]))
+    for name in rule["requires"] + [rule["name"]]:
+        fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+class ParquetSink(object):
+    """A Hive-partitioned Parquet dataset, written one dataframe at a time"""
+
+    def __init__(self, path, schema=None, partition_by=("state", "county")):
+        """
+        Parameters
+        ----------
+        path        :   str
+                        directory of the dataset. Files already in it are kept,
+                        so a dataset can be written by more than one sink.
+        schema      :   pyarrow.Schema or None
+                        schema of every file in the dataset, as from table_schema.
+                        If None, it is fixed from the first dataframe written,
+                        storing integers as int64 and codes as strings.
+        partition_by:   tuple of str
+                        columns whose values name the directories of the dataset,
+                        outermost first. (default: ("state", "county"))
+        """
+        _import_pyarrow()
+        self.path = path
+        self.partition_by = list(partition_by)
+        self.schema = None
+        self.rows = 0
+        self.chunks = 0
+        self._token = uuid.uuid4().hex[:12]
+        if schema is not None:
+            self._fix(schema)
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return "ParquetSink({}, {} rows in {} chunks)".format(
+            self.path, self.rows, self.chunks
+        )
+
+    def _fix(self, schema):
+        """fix the schema of the dataset, checking it has the partition columns"""
+        missing = [name for name in self.partition_by if name not in schema.names]
+        if missing:
+            raise ValueError(
+                "Cannot partition by {}, which are not in the schema: {}".format(
+                    missing, schema.names
+                )
+            )
+        self.schema = schema
+
+    def _infer(self, frame):
+        """the schema of a dataframe, widened to hold the other chunks too"""
+        pa = _import_pyarrow()
+        fields = []
+        for field in pa.Schema.from_pandas(frame, preserve_index=False):
+            kind = field.type
+            if pa.types.is_dictionary(kind) or pa.types.is_large_string(kind):
+                kind = pa.string()
+            elif pa.types.is_integer(kind):
+                kind = pa.int64()
+            elif pa.types.is_floating(kind):
+                kind = pa.float64()
+            fields.append(pa.field(field.name, kind))
+        return pa.schema(fields)
+
+    def write(self, frame):
+        """
+        Write a dataframe to the dataset, as one file in the directory of each
+        partition it has rows in.
+
+        Parameters
+        ----------
+        frame   :   pandas.DataFrame
+                    the dataframe to write. It must have every column of the
+                    schema, and may have others, which are not written.
+        """
+        if self.schema is None:
+            self._fix(self._infer(frame))
+        if frame.shape[0] == 0:
+            return
+        pq = _import_parquet()
+        pa = _import_pyarrow()
+        table = pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+        template = "part-{}-{}-{{i}}.parquet".format(self._token, self.chunks)
+        pq.write_to_dataset(
+            table,
+            self.path,
+            partition_cols=self.partition_by,
+            basename_template=template,
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        self.rows += frame.shape[0]
+        self.chunks += 1
+
+    def write_all(self, frames):
+        """
+        Write each dataframe from an iterable, like a genstate_to_* generator,
+        as it arrives.
+
+        Returns
+        -------
+        this sink, to chain with read()
+        """
+        for frame in frames:
+            self.write(frame)
+        return self
+
+    def dataset(self):
+        """
+        Open the dataset written so far, with the codes in its directory names
+        read as strings.
+
+        Returns
+        -------
+        pyarrow.dataset.Dataset
+        """
+        pa = _import_pyarrow()
+        import pyarrow.dataset as ds
+
+        if self.schema is None:
+            raise ValueError("Nothing has been written to {}".format(self.path))
+        partitioning = ds.partitioning(
+            pa.schema([self.schema.field(name) for name in self.partition_by]),
+            flavor="hive",
+        )
+        return ds.dataset(
+            self.path,
+            schema=self.schema,
+            format="parquet",
+            partitioning=partitioning,
+        )
+
+    def read(self, columns=None):
+        """
+        Read the dataset written so far into one dataframe. This holds the whole
+        dataset in memory; use dataset() to read it in pieces.
+
+        Parameters
+        ----------
+        columns :   list of str or None
+                    the columns to read. (default: every column)
+        """
+        from .tools import _sorted
+
+        frame = self.dataset().to_table(columns=columns).to_pandas()
+        return _sorted(frame).reset_index(drop=True)
+
+
+def _import_parquet():
+    _import_pyarrow()
+    import pyarrow.parquet
+
+    return pyarrow.parquet
@@ -0,0 +1,164 @@
+import unittest
+import io
+import os
+import tempfile
+import time
+from cenpy import cache, transport
+from cenpy.tests.test_transport import RecordingAdapter
+
+
+class StreamingAdapter(RecordingAdapter):
+    """an adapter whose responses are read from a stream, as off the wire"""
+
+    def send(self, request, **kwargs):
+        response = super(StreamingAdapter, self).send(request, **kwargs)
+        response.raw = io.BytesIO(response._content)
+        response._content = False
+        return response
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    This tests the on-disk cache of responses, without the network
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "responses.sqlite")
+        self.adapter = RecordingAdapter(body=b'[["NAME"],["Arizona"]]')
+        self.tport = transport.Transport(cache=cache.ResponseCache(self.path))
+        self.tport.session.mount("https://api.census.gov/", self.adapter)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_normalize(self):
+        a = cache.ResponseCache.normalize(
+            "https://API.census.gov/data/2019/acs/acs5?get=NAME&for=state:*&key=abc"
+        )
+        b = cache.ResponseCache.normalize(
+            "https://api.census.gov/data/2019/acs/acs5",
+            params={"for": "state:*", "get": "NAME", "key": "xyz"},
+        )
+        self.assertEqual(a, b)
+        self.assertNotIn("key", a)
+
+    def test_hit(self):
+        url = "https://api.census.gov/data/2019/acs/acs5?get=NAME&key=abc"
+        first = self.tport.get(url)
+        second = self.tport.get(url.replace("abc", "def"))
+        self.assertEqual(len(self.adapter.sent), 1)
+        self.assertEqual(second.json(), first.json())
+        self.assertTrue(second.from_cache)
+        # the cache persists across sessions
+        reopened = transport.Transport(cache=cache.ResponseCache(self.path))
+        reopened.session.mount("https://api.census.gov/", self.adapter)
+        reopened.get(url)
+        self.assertEqual(len(self.adapter.sent), 1)
+        self.assertEqual(self.tport.cache.stats["hits"], 1)
+        self.assertEqual(self.tport.cache.stats["stores"], 1)
+
+    def test_key_not_stored(self):
+        url = "https://api.census.gov/data/2019/acs/acs5?get=NAME&key=SECRETKEY123"
+        self.tport.get(url)
+        cached = self.tport.get(url)
+        self.assertTrue(cached.from_cache)
+        self.assertNotIn("SECRETKEY123", cached.url)
+        self.tport.cache._db.close()
+        with open(self.path, "rb") as db:
+            self.assertNotIn(b"SECRETKEY123", db.read())
+
+    def test_streamed(self):
+        adapter = StreamingAdapter(body=b'[["NAME"],["Arizona"]]')
+        self.tport.session.mount("https://api.census.gov/", adapter)
+        url = "https://api.census.gov/data/2019/acs/acs5?get=NAME"
+        response = self.tport.get(url, stream=True)
+        # nothing is read, or stored, until the body is streamed
+        self.assertIs(response._content, False)
+        self.assertEqual(self.tport.cache.stats["stores"], 0)
+        chunks = list(response.iter_content(chunk_size=4))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(self.tport.cache.stats["stores"], 1)
+        cached = self.tport.get(url, stream=True)
+        self.assertTrue(cached.from_cache)
+        self.assertEqual(b"".join(cached.iter_content(chunk_size=4)), b"".join(chunks))
+
+    def test_failures_not_stored(self):
+        self.adapter.status = 404
+        self.tport.get("https://api.census.gov/data/2019/acs/acs5")
+        self.tport.get("https://api.census.gov/data/2019/acs/acs5")
+        self.assertEqual(len(self.adapter.sent), 2)
+        self.assertEqual(len(self.tport.cache), 0)
+
+    def test_ttl(self):
+        self.tport.cache = cache.ResponseCache(self.path, ttls={r"/variables": 0.05})
+        variables = "https://api.census.gov/data/2019/acs/acs5/variables.json"
+        data = "https://api.census.gov/data/2019/acs/acs5?get=NAME"
+        self.tport.get(variables)
+        self.tport.get(data)
+        time.sleep(0.1)
+        self.tport.get(variables)
+        self.tport.get(data)
+        self.assertEqual(len(self.adapter.sent), 3)
+
+    def test_eviction(self):
+        size = len(self.adapter.body)
+        self.tport.cache = cache.ResponseCache(self.path, max_size=2 * size)
+        urls = ["https://api.census.gov/data/{}".format(year) for year in range(3)]
+        self.tport.get(urls[0])
+        self.tport.get(urls[1])
+        self.tport.get(urls[0])
+        self.tport.get(urls[2])
+        stats = self.tport.cache.stats
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["size"], 2 * size)
+        # the least recently used response was evicted
+        self.assertIsNone(self.tport.cache.get(urls[1]))
+        self.assertIsNotNone(self.tport.cache.get(urls[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = cache.ResultStore(os.path.join(self.tmpdir.name, "r.sqlite"))
+        self.key = ("TESTDATASET", "2019", "tract")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_geoid(self):
+        codes = dict(tract="000100", county="019", state="04")
+        self.assertEqual(cache.ResultStore.geoid(codes), "04019000100")
+        self.assertEqual(
+            cache.ResultStore.scope("tract:*", dict(state="04", county="*")),
+            cache.ResultStore.scope("tract:*", dict(county="*", state="04")),
+        )
+
+    def test_put(self):
+        header = ["B01001_001E", "NAME", "state", "county", "tract"]
+        rows = [
+            ["10", "A", "04", "019", "000100"],
+            [None, "B", "04", "019", "000200"],
+        ]
+        scope = cache.ResultStore.scope("tract:*", dict(state="04", county="019"))
+        self.assertIsNone(self.store.members(self.key, scope))
+        self.store.put(self.key, header, rows, header[:2], scope)
+        geoids = ["04019000100", "04019000200"]
+        self.assertEqual(self.store.members(self.key, scope), geoids)
+        self.assertEqual(len(self.store), 4)
+        cells = self.store.cells(self.key, geoids + ["04019000300"], ["B01001_001E"])
+        self.assertEqual(
+            cells,
+            {(geoids[0], "B01001_001E"): "10", (geoids[1], "B01001_001E"): None},
+        )
+        geographies = self.store.geographies(self.key, geoids)
+        self.assertEqual(list(geographies[geoids[1]]), ["state", "county", "tract"])
+        other = ("TESTDATASET", "2018", "tract")
+        self.assertEqual(self.store.cells(other, geoids, ["NAME"]), dict())
+        self.store.clear()
+        self.assertEqual(len(self.store), 0)
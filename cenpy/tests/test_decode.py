@@ -0,0 +1,210 @@
+import unittest
+import json
+from unittest import mock
+import numpy as np
+import pandas as pd
+from cenpy import decode
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# dtype backends need pandas 2.0 or newer
+old_pandas = decode._major_version(pd.__version__) < 2
+
+VARIABLES = pd.DataFrame(
+    dict(predicateType=["int", "float", "string", "int"]),
+    index=["B01001_001E", "B19013_001E", "NAICS2017", "B25077_001E"],
+)
+
+
+class TestDecode(unittest.TestCase):
+    def test_kinds(self):
+        kinds = decode.column_kinds(
+            ["NAME", "B01001_001E", "NAICS2017", "state"],
+            requested=["NAME", "B01001_001E", "NAICS2017"],
+            variables=VARIABLES,
+        )
+        self.assertEqual(kinds, [None, "int", "string", "geo"])
+
+    def test_groups(self):
+        header = ["NAME", "P001001", "P001001A", "GEO_ID", "NAME", "state"]
+        groups = pd.DataFrame(dict(group=["P1", "P1"]), index=["P001001", "P001001A"])
+        self.assertEqual(
+            decode.requested_columns(header, ["NAME", "group(P1)"], groups),
+            ["NAME", "P001001", "P001001A", "GEO_ID", "NAME"],
+        )
+        self.assertEqual(
+            decode.requested_columns(
+                ["B01001_001E", "B01001_001M", "state"], ["group(B01001)"]
+            ),
+            ["B01001_001E", "B01001_001M"],
+        )
+        rows = [["A", "1", "x", "0400000US04", "A", "04"]]
+        table = decode.decode_table(header, rows, ["NAME", "group(P1)"], groups)
+        self.assertEqual(table.columns.tolist(), header[:4] + ["state"])
+        self.assertEqual(table.P001001.tolist(), [1])
+
+    def test_decode_column(self):
+        values = np.array(["12", "-666666666", "4"], dtype=object)
+        self.assertEqual(decode.decode_column(values, "int").dtype, np.int32)
+        big = np.array(["12", "9000000000"], dtype=object)
+        self.assertEqual(decode.decode_column(big, "int").dtype, np.int64)
+        nulls = np.array(["12", None], dtype=object)
+        self.assertTrue(np.isnan(decode.decode_column(nulls, "int")[1]))
+        decimals = np.array(["1.5", "2"], dtype=object)
+        self.assertEqual(decode.decode_column(decimals, "float").dtype, np.float64)
+        self.assertEqual(decode.decode_column(decimals).dtype, np.float64)
+        # codes with leading zeros are not numbers, unless the metadata says so
+        codes = np.array(["04", "10"], dtype=object)
+        self.assertEqual(decode.decode_column(codes).tolist(), ["04", "10"])
+        self.assertEqual(decode.decode_column(codes, "int").tolist(), [4, 10])
+        names = np.array(["Arizona", "Utah"], dtype=object)
+        self.assertIs(decode.decode_column(names), names)
+
+    def test_decode_table(self):
+        header = ["NAME", "B01001_001E", "B19013_001E", "state", "county"]
+        rows = [
+            ["A", "10", "52000.5", "04", "001"],
+            ["B", "20", None, "04", "003"],
+        ]
+        table = decode.decode_table(header, rows, header[:3], VARIABLES)
+        self.assertEqual(table.columns.tolist(), header)
+        self.assertTrue(pd.api.types.is_string_dtype(table.NAME))
+        self.assertEqual(
+            [str(dtype) for dtype in table.dtypes[1:]],
+            ["int32", "float64", "category", "category"],
+        )
+        raw = decode.decode_table(header, rows, header[:3], convert=False)
+        self.assertTrue(all(pd.api.types.is_string_dtype(raw[c]) for c in header))
+        empty = decode.decode_table(header, [], header[:3])
+        self.assertEqual(empty.shape, (0, 5))
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        header = ["NAME", "B01001_001E", "state", "county"]
+        rows = [
+            ['Place "{}", \u00e9'.format(i), str(i * 7), "04", "{:03d}".format(i % 3)]
+            for i in range(1000)
+        ]
+        rows.append(["Nowhere", None, "04", "001"])
+        self.table = [header] + rows
+        self.text = json.dumps(self.table).replace("], [", "],\n[")
+
+    def chunks(self, size):
+        return [self.text[i : i + size] for i in range(0, len(self.text), size)]
+
+    def test_read_table(self):
+        expected = decode.decode_table(self.table[0], self.table[1:], ["NAME"])
+        for size in (7, 64, len(self.text)):
+            for batch_size in (1, 97, 5000):
+                table = decode.read_table(
+                    self.chunks(size), ["NAME"], batch_size=batch_size
+                )
+                pd.testing.assert_frame_equal(table, expected)
+
+    def test_buffers(self):
+        header, rows = self.table[0], self.table[1:]
+        kinds = decode.column_kinds(header, header[:2], variables=None)
+        self.assertEqual(kinds, [None, None, "geo", "geo"])
+        buffers = [decode._ColumnBuffer(kind) for kind in kinds]
+        table = decode._to_array(header, rows)
+        for start in range(0, len(rows), 400):
+            for i, buffer in enumerate(buffers):
+                buffer.append(table[start : start + 400, i])
+        # only columns that are not numbers are kept as strings
+        names, counts, states, counties = buffers
+        self.assertTrue(all(batch.dtype == object for batch in names.batches))
+        self.assertTrue(all(batch.dtype.kind == "f" for batch in counts.batches[2:]))
+        self.assertTrue(all(batch.dtype.kind == "i" for batch in counts.batches[:2]))
+        for buffer in (states, counties):
+            self.assertTrue(all(batch.dtype == np.int32 for batch in buffer.batches))
+        self.assertEqual(sorted(counties.categories), ["000", "001", "002"])
+        expected = decode.decode_table(header, rows, header[:2])
+        for i, buffer in enumerate(buffers):
+            np.testing.assert_array_equal(
+                np.asarray(buffer.finish()), np.asarray(expected.iloc[:, i])
+            )
+
+    def test_inferred_strings(self):
+        header = ["NAICS2017", "state"]
+        rows = [[str(i), "04"] for i in range(10)] + [["1.50", "04"], ["31-33", "04"]]
+        text = json.dumps([header] + rows)
+        expected = decode.decode_table(header, rows, header[:1])
+        for batch_size in (1, 4, 100):
+            table = decode.read_table([text], header[:1], batch_size=batch_size)
+            pd.testing.assert_frame_equal(table, expected)
+        self.assertEqual(table.NAICS2017.tolist()[-3:], ["9", "1.50", "31-33"])
+        nulls = [["A", None], ["B", None]]
+        text = json.dumps([header] + nulls)
+        pd.testing.assert_frame_equal(
+            decode.read_table([text], header[:1], batch_size=1),
+            decode.decode_table(header, nulls, header[:1]),
+        )
+
+    def test_iter_tables(self):
+        batches = list(decode.iter_tables(self.chunks(100), ["NAME"], batch_size=300))
+        self.assertEqual([len(batch) for batch in batches], [300, 300, 300, 101])
+        self.assertEqual(batches[-1].NAME.iloc[-1], "Nowhere")
+        (empty,) = decode.iter_tables(['[["NAME", "state"]]'], ["NAME"])
+        self.assertEqual(empty.columns.tolist(), ["NAME", "state"])
+
+    def test_malformed(self):
+        for text in ["", "<html>busy</html>", '[["a"],["b"]', '[["a"],{"b":1}]']:
+            with self.assertRaises(ValueError):
+                decode.read_table([text])
+
+
+class TestOutput(unittest.TestCase):
+    def setUp(self):
+        self.header = ["NAME", "B01001_001E", "state"]
+        self.rows = [["A", "10", "04"], ["B", None, "04"], [None, "30", "06"]]
+
+    @unittest.skipIf(old_pandas, "dtype backends need pandas 2.0 or newer")
+    def test_nullable(self):
+        table = decode.decode_table(
+            self.header, self.rows, self.header[:2], dtype_backend="numpy_nullable"
+        )
+        self.assertEqual(str(table["B01001_001E"].dtype), "Int64")
+        self.assertTrue(table["B01001_001E"].isna().iloc[1])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            decode.decode_table(self.header, self.rows, output="polars")
+
+    def test_versions(self):
+        with mock.patch.object(decode.pd, "__version__", "1.3.5"):
+            with self.assertRaises(ImportError):
+                decode.decode_table(
+                    self.header, self.rows, dtype_backend="numpy_nullable"
+                )
+            # numpy dtypes work with any version of pandas
+            decode.decode_table(self.header, self.rows)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_old_geopandas(self):
+        class OldGeoDataFrame(pd.DataFrame):
+            _geometry_column_name = "geometry"
+
+        frame = OldGeoDataFrame(dict(NAME=["A"], geometry=[None]))
+        with self.assertRaises(ImportError):
+            decode.convert_frame(frame, output="arrow")
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    @unittest.skipIf(old_pandas, "dtype backends need pandas 2.0 or newer")
+    def test_arrow(self):
+        chunks = [json.dumps([self.header] + self.rows)]
+        table = decode.read_table(chunks, self.header[:2], output="arrow")
+        self.assertIsInstance(table, pyarrow.Table)
+        self.assertEqual(table.column_names, self.header)
+        self.assertEqual(table["NAME"].to_pylist(), ["A", "B", None])
+        self.assertEqual(table["B01001_001E"].null_count, 1)
+        self.assertTrue(pyarrow.types.is_dictionary(table.schema.field("state").type))
+        frame = decode.read_table(chunks, self.header[:2], dtype_backend="pyarrow")
+        self.assertIsInstance(frame["NAME"].dtype, pd.ArrowDtype)
+
+
+if __name__ == "__main__":
+    unittest.main()
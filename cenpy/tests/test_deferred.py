@@ -0,0 +1,42 @@
+import unittest
+from cenpy import deferred
+from cenpy.tests.test_remote import FakeCensusTestCase
+
+
+class TestDeferred(FakeCensusTestCase):
+    def test_deferred(self):
+        query = self.cxn.select("B01001_001E").where(state="04").at("tract")
+        self.assertEqual(self.census.queries, [])
+        self.assertEqual(
+            query.plan(), [(["B01001_001E"], "tract:*", {"state": "04", "county": "*"})]
+        )
+        result = query.select("NAME").collect()
+        self.assertEqual(
+            result.columns.tolist(),
+            ["B01001_001E", "NAME", "state", "county", "tract"],
+        )
+        self.assertEqual(query.cols, ["B01001_001E"])
+        self.assertEqual(len(self.census.queries), 1)
+
+    def test_merge(self):
+        base = self.cxn.select().where(state="04").at("tract")
+        first = base.select(["B01001_{:03d}E".format(i) for i in range(1, 31)])
+        second = base.select(["B01001_{:03d}E".format(i) for i in range(21, 61)])
+        county = self.cxn.select("NAME").where(state="04").at("county", "001")
+        a, b, c = deferred.collect([first, second, county])
+        # the two tract queries share two chunks of columns, and the county is one more
+        self.assertEqual(len(self.census.queries), 3)
+        self.assertEqual(a.columns.tolist(), first.cols + ["state", "county", "tract"])
+        self.assertEqual(b.columns.tolist(), second.cols + ["state", "county", "tract"])
+        self.assertEqual(b["B01001_060E"].tolist(), list(range(6000, 6006)))
+        self.assertEqual(c.county.tolist(), ["001"])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.cxn.select("NAME").collect()
+        with self.assertRaises(ValueError):
+            self.cxn.select().at("tract").collect()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,9 @@ import cenpy
 from six import iteritems as diter
 import pandas
 import six
+import json
+import os
+import tempfile
 
 if six.PY3:
     testtype = str
@@ -66,5 +69,48 @@ class TestExplorer(unittest.TestCase):
         self.assertEqual(currcounties, AZcounties)
 
 
+class TestCatalog(unittest.TestCase):
+    """
+    This tests the on-disk snapshot of the API listing, without the network
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "data.json")
+        self.entry = {
+            "identifier": "https://api.census.gov/data/id/TESTDATASET",
+            "title": "A Test Dataset",
+            "description": "Used to check the catalog",
+            "distribution": [{"format": "API", "accessURL": "http://example.com"}],
+        }
+        with open(self.path, "w") as f:
+            json.dump([self.entry], f)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_offline_snapshot(self):
+        catalog = cenpy.explorer.Catalog(path=self.path, offline=True)
+        self.assertIsNone(catalog._raw)
+        self.assertIn("TESTDATASET", catalog)
+        self.assertEqual(catalog["TESTDATASET"]["title"], "A Test Dataset")
+        self.assertEqual(len(catalog), 1)
+
+    def test_offline_without_snapshot(self):
+        missing = os.path.join(self.tmpdir.name, "missing.json")
+        catalog = cenpy.explorer.Catalog(path=missing, offline=True)
+        with self.assertRaises(FileNotFoundError):
+            catalog.apis
+        with self.assertRaises(RuntimeError):
+            catalog.refresh()
+
+    def test_stale_snapshot_fallback(self):
+        catalog = cenpy.explorer.Catalog(
+            url="http://localhost:9/data.json", path=self.path, ttl=0
+        )
+        with self.assertWarns(UserWarning):
+            self.assertIn("TESTDATASET", catalog)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import subprocess
+import sys
+import json
+
+# budget, in seconds, for the time spent importing cenpy itself
+IMPORT_BUDGET = 0.25
+
+# modules that must not be imported as a side effect of `import <statement>`
+HEAVY = ("geopandas", "shapely", "fuzzywuzzy", "libpysal", "requests", "pandas")
+GIS = ("geopandas", "shapely", "fuzzywuzzy", "libpysal")
+
+
+def profile_import(module):
+    """
+    Import a module in a fresh interpreter.
+
+    Returns
+    -------
+    tuple of (seconds, modules), where seconds is the cumulative time reported
+    by `python -X importtime` for the module and modules is the set of top-level
+    packages imported as a result.
+    """
+    script = (
+        "import sys, json; before = set(sys.modules); import {};"
+        " print(json.dumps(sorted(set(sys.modules) - before)))"
+    ).format(module)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    modules = {name.split(".")[0] for name in json.loads(proc.stdout)}
+    seconds = 0
+    for line in proc.stderr.splitlines():
+        # lines look like "import time:  self [us] | cumulative | imported package"
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            seconds = int(fields[1]) / 1e6
+    return seconds, modules
+
+
+class TestImport(unittest.TestCase):
+    """
+    This benchmarks the cost of starting up with cenpy
+    """
+
+    def test_import_budget(self):
+        seconds, modules = profile_import("cenpy")
+        self.assertLess(
+            seconds,
+            IMPORT_BUDGET,
+            msg="import cenpy took {:.3f}s, over the budget of {}s".format(
+                seconds, IMPORT_BUDGET
+            ),
+        )
+        self.assertFalse(
+            modules.intersection(HEAVY),
+            msg="import cenpy imported {}".format(sorted(modules.intersection(HEAVY))),
+        )
+
+    def test_tabular_import(self):
+        seconds, modules = profile_import("cenpy.remote")
+        self.assertFalse(
+            modules.intersection(GIS),
+            msg="import cenpy.remote imported {}".format(
+                sorted(modules.intersection(GIS))
+            ),
+        )
+
+    def test_star_import(self):
+        import cenpy
+
+        self.assertEqual(dir(cenpy), cenpy.__all__)
+        self.assertIn("products", cenpy.__all__)
+        self.assertIn("ACS", cenpy.__all__)
+        self.assertNotIn("_APIConnection", cenpy.__all__)
+        namespace = {}
+        exec("from cenpy import *", namespace)
+        self.assertTrue(set(cenpy.__all__) <= set(namespace))
+
+
+if __name__ == "__main__":
+    unittest.main()
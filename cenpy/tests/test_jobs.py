@@ -0,0 +1,84 @@
+import unittest
+import os
+from unittest import mock
+import requests
+from cenpy import jobs, tools
+from cenpy.tests.test_remote import FakeCensusTestCase
+
+
+class TestExtractionJob(FakeCensusTestCase):
+    def setUp(self):
+        super(TestExtractionJob, self).setUp()
+        fips = self.cxn.geographies["fips"].copy()
+        fips.at[2, "wildcard"] = None
+        self.cxn.geographies = dict(fips=fips)
+        self.path = os.path.join(self.tmpdir.name, "job")
+        self.failing = True
+        send = self.census.send
+
+        def flaky(request, **kwargs):
+            if self.failing and "county:003" in requests.utils.unquote(request.url):
+                response = requests.Response()
+                response.status_code, response._content = 400, b"unavailable"
+                response.url, response.request = request.url, request
+                return response
+            return send(request, **kwargs)
+
+        self.census.send = flaky
+
+    def job(self, columns=("B01001_001E",)):
+        return jobs.ExtractionJob(
+            self.cxn, "tract", list(columns), self.path, states=["04"]
+        )
+
+    def test_resume(self):
+        with self.assertWarns(UserWarning), self.assertRaises(requests.HTTPError):
+            self.job().run()
+        job = self.job()
+        self.assertEqual(job.status(), dict(states=1, planned=2, done=1))
+        self.assertEqual(job.read().shape, (3, 5))
+
+        self.failing = False
+        queries = len(self.census.queries)
+        result = self.job().run().read()
+        extension = ".parquet" if jobs._can_store() else ".csv"
+        files = [name for name in os.listdir(self.path) if name.startswith("part-")]
+        self.assertTrue(all(name.endswith(extension) for name in files))
+        # only the failed county is queried again, without planning the state again
+        self.assertEqual(len(self.census.queries), queries + 1)
+        self.assertEqual(result.shape, (6, 5))
+        self.assertEqual(result.county.tolist(), ["001"] * 3 + ["003"] * 3)
+        self.assertEqual(result["B01001_001E"].tolist(), [100, 101, 102] * 2)
+
+    def test_csv_partitions(self):
+        self.failing = False
+        with mock.patch.object(jobs, "_can_store", lambda: False):
+            result = self.job().run().read()
+        files = [name for name in os.listdir(self.path) if name.startswith("part-")]
+        self.assertTrue(all(name.endswith(".csv") for name in files))
+        self.assertEqual(result.tract.tolist()[:2], ["000100", "000200"])
+        self.assertEqual(result["B01001_001E"].tolist(), [100, 101, 102] * 2)
+
+    def test_mismatch(self):
+        self.failing = False
+        self.job().run()
+        with self.assertRaises(ValueError):
+            self.job(columns=["B01001_002E"])
+
+    def test_tools(self):
+        self.failing = False
+        with mock.patch.object(tools, "_state_fipscodes", ["04"]):
+            tracts = tools.national_to_tract(
+                self.cxn, "B01001_001E", checkpoint=self.path
+            )
+            self.assertEqual(tracts.shape, (6, 5))
+            queries = len(self.census.queries)
+            again = tools.national_to_tract(
+                self.cxn, "B01001_001E", checkpoint=self.path
+            )
+        self.assertEqual(len(self.census.queries), queries)
+        self.assertTrue(again.equals(tracts))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,10 @@
 import geopandas as gpd
 import pandas as pd
 import numpy
-from unittest import TestCase, skip, main
+import shapely
+from unittest import TestCase, mock, skip, skipIf, main
 import os
-from ..geoparser import parse_polygon
+from ..geoparser import convert_geometries, parse_polygon, parse_polygons
 from ..remote import APIConnection
 
 DIRPATH = os.path.dirname(__file__)
@@ -22,14 +23,14 @@ class Geoparser_Test(TestCase):
         for i, row in self.all.iterrows():
             name, answer, test, degenerate = row
             converted = parse_polygon(dict(coordinates=test))
-            approx = answer.almost_equals(converted)
+            approx = answer.equals_exact(converted, 0.5e-6)
             exact = answer.equals(converted)
             self.assertTrue(
                 approx or exact, msg="Conversion fails on test shape {}".format(name)
             )
             if degenerate is not None:
                 converted2 = parse_polygon(dict(coordinates=degenerate))
-                approx = answer.almost_equals(converted2)
+                approx = answer.equals_exact(converted2, 0.5e-6)
                 exact = answer.equals(converted2)
                 self.assertTrue(
                     approx or exact,
@@ -69,5 +70,56 @@ class Geoparser_Test(TestCase):
         )
 
 
+@skipIf(int(shapely.__version__.split(".")[0]) < 2, "needs shapely 2.0 or newer")
+class TestParsePolygons(TestCase):
+    def setUp(self):
+        answers = gpd.read_file(DIRPATH + "/answers.geojson")
+        tests = pd.read_json(DIRPATH + "/tests.json")
+        hard_tests = pd.read_json(DIRPATH + "/degenerate.json")
+        self.all = answers.merge(tests, on="names").merge(hard_tests, on="names")
+
+    def test_matches_parse_polygon(self):
+        shapes = self.all.tests.tolist()
+        shapes += [shape for shape in self.all.degens if shape is not None]
+        answers = self.all.geometry.tolist()
+        answers += [a for a, d in zip(answers, self.all.degens) if d is not None]
+        converted = parse_polygons([dict(coordinates=shape) for shape in shapes])
+        self.assertEqual(len(converted), len(shapes))
+        for shape, answer, polygon in zip(shapes, answers, converted):
+            one = parse_polygon(dict(coordinates=shape))
+            self.assertEqual(polygon.geom_type, one.geom_type)
+            self.assertTrue(polygon.equals(one))
+            self.assertTrue(answer.equals(polygon))
+
+    def test_convert_geometries(self):
+        features = [
+            dict(type="MultiPolygon", coordinates=shape) for shape in self.all.tests
+        ]
+        df = pd.DataFrame(dict(names=self.all.names, geometry=features))
+        df.index = df.index + 10
+        converted = convert_geometries(df)
+        self.assertEqual(converted.index.tolist(), df.index.tolist())
+        for answer, polygon in zip(self.all.geometry, converted.geometry):
+            self.assertTrue(answer.equals(polygon))
+
+    def test_old_shapely(self):
+        features = [dict(coordinates=shape) for shape in self.all.tests]
+        with mock.patch.object(shapely, "__version__", "1.8.5"), mock.patch.object(
+            shapely, "from_ragged_array", side_effect=AttributeError
+        ):
+            converted = parse_polygons(features)
+        for answer, polygon in zip(self.all.geometry, converted):
+            self.assertTrue(answer.equals(polygon))
+
+    def test_mixed_dimensions(self):
+        square = [[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]
+        cube = [[0, 0, 1], [0, 2, 1], [2, 2, 1], [2, 0, 1], [0, 0, 1]]
+        flat, raised = parse_polygons(
+            [dict(coordinates=[square]), dict(coordinates=[cube])]
+        )
+        self.assertEqual(flat.area, 1)
+        self.assertTrue(raised.has_z)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,106 @@
+import unittest
+from unittest import mock
+from cenpy import planner, tools, transport
+from cenpy.products import ACS
+from cenpy.tests.test_remote import FakeCensusTestCase
+
+
+class TestPlanner(FakeCensusTestCase):
+    def test_wildcard(self):
+        plan = planner.plan(self.cxn, "tract", {"state": 4})
+        self.assertEqual(plan, [("tract:*", {"state": "4", "county": "*"})])
+        self.assertEqual(self.census.queries, [])
+        plan = planner.plan(self.cxn, "tract", {"state": "04", "county": ["001"]})
+        self.assertEqual(plan, [("tract:*", {"state": "04", "county": "001"})])
+
+    def test_list_out(self):
+        geographies = dict(self.cxn.geographies)
+        fips = geographies["fips"].copy()
+        fips.at[2, "wildcard"] = None
+        self.cxn.geographies = dict(fips=fips)
+        plan = planner.plan(self.cxn, "tract", {"state": "04"})
+        self.assertEqual(len(self.census.queries), 1)
+        self.assertEqual(
+            plan,
+            [
+                ("tract:*", {"state": "04", "county": "001"}),
+                ("tract:*", {"state": "04", "county": "003"}),
+            ],
+        )
+
+    def test_invalid(self):
+        with self.assertRaises(KeyError):
+            planner.plan(self.cxn, "block")
+        with self.assertRaises(ValueError):
+            planner.plan(self.cxn, "county", {"tract": "000100"})
+
+    def test_tools(self):
+        (tracts,) = list(tools.genstate_to_tract("04", self.cxn, "B01001_001E"))
+        self.assertEqual(len(self.census.queries), 1)
+        self.assertEqual(tracts.shape, (6, 5))
+
+    def test_national(self):
+        fips = self.cxn.geographies["fips"].copy()
+        fips.at[2, "wildcard"] = None
+        self.cxn.geographies = dict(fips=fips)
+        with mock.patch.object(tools, "_state_fipscodes", ["04"]):
+            results = list(tools.gennational_to_tract(self.cxn, "B01001_001E"))
+            self.assertEqual(sorted(len(result) for result in results), [3, 3])
+            # one query listing counties, and one query for the tracts in each
+            self.assertEqual(len(self.census.queries), 3)
+            tracts = tools.national_to_tract(self.cxn, "B01001_001E", max_workers=4)
+        self.assertEqual(tracts.shape, (6, 5))
+        self.assertEqual(tracts.county.tolist(), ["001"] * 3 + ["003"] * 3)
+
+
+class TestExplain(FakeCensusTestCase):
+    def test_explain(self):
+        explained = planner.Planner(self.cxn).explain(
+            ["B01001_001E"], "tract", {"state": "04"}
+        )
+        self.assertEqual(explained["requests"], 1)
+        self.assertEqual(explained["geographies"], round(85528 / 52))
+        self.assertEqual(explained["bytes"], explained["cells"] * 12)
+
+        fips = self.cxn.geographies["fips"].copy()
+        fips.at[2, "wildcard"] = None
+        self.cxn.geographies = dict(fips=fips)
+        explained = planner.Planner(self.cxn).explain(
+            ["NAME"], "tract", {"state": "04"}
+        )
+        self.assertEqual(explained["discovery_requests"], 1)
+        self.assertEqual(explained["requests"], round(3221 / 52) + 1)
+        self.assertEqual(self.census.queries, [])
+
+    def test_query(self):
+        cols = ["B01001_{:03d}E".format(i) for i in range(1, 61)]
+        explained = self.cxn.explain_plan(
+            cols, "tract:*", {"state": "04", "county": "001,003"}
+        )
+        self.assertEqual(explained["requests"], 2)
+        self.assertEqual(explained["cells"], 60 * round(2 * 85528 / 3221))
+        explained = self.cxn.explain_plan(
+            cols[:1], "tract:000100,000200", {"state": "04"}
+        )
+        self.assertEqual(explained["geographies"], 2)
+
+    def test_rate(self):
+        limiter = transport.get_transport().set_rate_limit(2, burst=2)
+        self.addCleanup(transport.get_transport().set_rate_limit, None)
+        explained = tools.explain_plan(self.cxn, "tract", "B01001_001E", latency=0.0)
+        self.assertEqual(explained["requests"], len(tools._state_fipscodes))
+        self.assertEqual(explained["seconds"], (explained["requests"] - 2) / 2.0)
+        explained = tools.explain_plan(self.cxn, "tract", stfips="4", latency=0.5)
+        self.assertEqual(explained["seconds"], 0.5)
+        self.assertEqual(self.census.queries, [])
+
+    def test_product(self):
+        product = ACS.__new__(ACS)
+        product._api = self.cxn
+        explained = product.explain_plan("^B01001_", counties=2, geographies=1200)
+        self.assertEqual(explained["requests"], 4 + 2)
+        self.assertEqual(explained["cells"], 1200 * (60 + 2 + 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
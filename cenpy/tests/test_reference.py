@@ -0,0 +1,87 @@
+import unittest
+import os
+import tempfile
+import pandas
+from cenpy import reference
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestReference(unittest.TestCase):
+    """
+    This tests the reference tables, which must not require the network
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self._environ = os.environ.get("CENPY_CACHE_DIR")
+        os.environ["CENPY_CACHE_DIR"] = self.tmpdir.name
+
+    def tearDown(self):
+        if self._environ is None:
+            del os.environ["CENPY_CACHE_DIR"]
+        else:
+            os.environ["CENPY_CACHE_DIR"] = self._environ
+        self.tmpdir.cleanup()
+
+    def test_states(self):
+        states = reference.states()
+        self.assertEqual(states.lookup(4).STATE, "AZ")
+        self.assertEqual(states.lookup("06").STATENAME, "CALIFORNIA")
+        self.assertEqual(states.find("az").STATEFP.tolist(), ["04"])
+        self.assertEqual(states.find("Arizona").STATEFP.tolist(), ["04"])
+        self.assertTrue(states.find("Atlantis").empty)
+        with self.assertRaises(KeyError):
+            states.lookup(99)
+
+    def test_composite_codes(self):
+        frame = pandas.DataFrame(
+            dict(
+                STATEFP=["01", "01", "04"],
+                PLACEFP=["00100", "00124", "00100"],
+                PLACENAME=["Abbeville city", "Adamsville city", "Ajo CDP"],
+            )
+        )
+        table = reference.ReferenceTable(
+            frame,
+            ("STATEFP", "PLACEFP"),
+            ("PLACENAME",),
+            widths=dict(STATEFP=2, PLACEFP=5),
+        )
+        self.assertEqual(table.lookup(1, 124).PLACENAME, "Adamsville city")
+        self.assertEqual(table.lookup("04", "00100").PLACENAME, "Ajo CDP")
+        self.assertEqual(len(table.find("ajo cdp")), 1)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_remote_table_is_stored(self):
+        source = os.path.join(self.tmpdir.name, "st04_az_cou.txt")
+        with open(source, "w") as f:
+            f.write("AZ,04,001,Apache County,H1\nAZ,04,003,Cochise County,H1\n")
+        first = reference.remote_table(source)
+        self.assertEqual(first[2].tolist(), ["001", "003"])
+        os.remove(source)
+        second = reference.remote_table(source)
+        pandas.testing.assert_frame_equal(first, second)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_unreadable_table_is_rebuilt(self):
+        source = os.path.join(self.tmpdir.name, "st04_az_cou.txt")
+        with open(source, "w") as f:
+            f.write("AZ,04,001,Apache County,H1\n")
+        stored = os.path.join(
+            self.tmpdir.name, "reference", reference._filename("st04_az_cou")
+        )
+        os.makedirs(os.path.dirname(stored))
+        with open(stored, "wb") as f:
+            f.write(b"not a table")
+        with self.assertWarns(UserWarning):
+            frame = reference.remote_table(source)
+        self.assertEqual(frame[3].tolist(), ["Apache County"])
+        pandas.testing.assert_frame_equal(reference.remote_table(source), frame)
+
+
+if __name__ == "__main__":
+    unittest.main()
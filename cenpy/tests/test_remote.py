@@ -1,5 +1,190 @@
 import unittest
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import requests
+from requests.adapters import BaseAdapter
+from urllib3.exceptions import ProtocolError
+from urllib.parse import urlparse, parse_qs
 import cenpy
+from cenpy import cache, explorer, transport
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+BASEURL = "https://api.census.gov/data/2019/test"
+
+# three tracts in each of two counties in Arizona
+GEOGRAPHIES = [
+    dict(state="04", county=county, tract=tract)
+    for county in ("001", "003")
+    for tract in ("000100", "000200", "000300")
+]
+
+VARIABLES = {
+    "NAME": dict(label="Geographic Area Name", concept="", predicateType="string"),
+    "GEO_ID": dict(label="Geography", concept="", predicateType="string"),
+}
+VARIABLES.update(
+    {
+        "B01001_{:03d}E".format(i): dict(
+            label="Estimate!!Total!!{}".format(i),
+            concept="SEX BY AGE",
+            predicateType="int",
+            group="B01001",
+        )
+        for i in range(1, 61)
+    }
+)
+
+GEOGRAPHY_LEVELS = {
+    "fips": [
+        dict(name="state", geoLevelDisplay="040"),
+        dict(
+            name="county", geoLevelDisplay="050", requires=["state"], wildcard=["state"]
+        ),
+        dict(
+            name="tract",
+            geoLevelDisplay="140",
+            requires=["state", "county"],
+            wildcard=["county"],
+        ),
+    ]
+}
+
+
+class FakeCensus(BaseAdapter):
+    """an adapter answering requests like the Census Data API, for a tiny dataset"""
+
+    def __init__(self):
+        super(FakeCensus, self).__init__()
+        self.queries = []
+        self.metadata = []
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        if url.path.endswith(".json"):
+            with self._lock:
+                self.metadata.append(url.path)
+        if url.path.endswith("variables.json"):
+            body = dict(variables=VARIABLES)
+        elif url.path.endswith("geography.json"):
+            body = GEOGRAPHY_LEVELS
+        elif url.path.endswith("tags.json"):
+            body = dict(tags=["test", "census"])
+        else:
+            with self._lock:
+                self.queries.append(request.url)
+            body = self.answer(parse_qs(url.query))
+        response = requests.Response()
+        response.status_code = 200 if body is not None else 204
+        response._content = json.dumps(body).encode() if body is not None else b""
+        response.url = request.url
+        response.request = request
+        return response
+
+    def answer(self, query):
+        cols = []
+        for col in query["get"][0].split(","):
+            if col.startswith("group("):
+                group = col[len("group(") : -1]
+                cols.extend(
+                    name for name, v in VARIABLES.items() if v.get("group") == group
+                )
+                cols.extend(["GEO_ID", "NAME"])
+            else:
+                cols.append(col)
+        level, selected = query["for"][0].split(":")
+        within = dict(
+            pair.split(":") for pair in query.get("in", [""])[0].split(" ") if pair
+        )
+        keys = ["state", "county", "tract"]
+        keys = keys[: keys.index(level) + 1]
+        rows = []
+        for geo in GEOGRAPHIES:
+            row = [geo[k] for k in keys]
+            if row in rows:
+                continue
+            if selected != "*" and geo[level] not in selected.split(","):
+                continue
+            if any(v != "*" and geo[k] not in v.split(",") for k, v in within.items()):
+                continue
+            rows.append(row)
+        if not rows:
+            return None
+        table = [cols + keys]
+        for i, row in enumerate(rows):
+            values = []
+            for col in cols:
+                if col == "NAME":
+                    values.append("Place {}".format("".join(row)))
+                elif col == "GEO_ID":
+                    values.append("1400000US{}".format("".join(row)))
+                else:
+                    values.append(str(int(col[-4:-1]) * 100 + i))
+            table.append(values + row)
+        return table
+
+    def close(self):
+        pass
+
+
+class BrokenBody(object):
+    """the raw body of a response whose connection breaks off partway through"""
+
+    def __init__(self, content, error=True):
+        self.content = content
+        self.error = error
+
+    def stream(self, chunk_size, decode_content=True):
+        yield self.content[: len(self.content) // 2]
+        if self.error:
+            raise ProtocolError("Connection broken: IncompleteRead")
+
+    def close(self):
+        pass
+
+
+class FakeCensusTestCase(unittest.TestCase):
+    """sets up a connection to the fake census, without the network"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self._cache_dir = os.environ.get("CENPY_CACHE_DIR")
+        os.environ["CENPY_CACHE_DIR"] = self.tmpdir.name
+        path = os.path.join(self.tmpdir.name, "data.json")
+        entry = {
+            "identifier": "https://api.census.gov/data/id/TESTDATASET",
+            "title": "A Test Dataset",
+            "description": "Used to check the connection",
+            "distribution": [{"format": "API", "accessURL": BASEURL}],
+            "c_variablesLink": BASEURL + "/variables.json",
+            "c_geographyLink": BASEURL + "/geography.json",
+            "c_tagsLink": BASEURL + "/tags.json",
+            "c_vintage": 2019,
+        }
+        with open(path, "w") as f:
+            json.dump([entry], f)
+        self._catalog = explorer.catalog
+        explorer.catalog = explorer.Catalog(path=path, offline=True)
+        self.census = FakeCensus()
+        self._transport = transport.set_transport(transport.Transport())
+        transport.get_transport().session.mount("https://api.census.gov/", self.census)
+        self.cxn = cenpy.remote.APIConnection("TESTDATASET", apikey="")
+
+    def tearDown(self):
+        explorer.catalog = self._catalog
+        transport.set_transport(self._transport)
+        if self._cache_dir is None:
+            del os.environ["CENPY_CACHE_DIR"]
+        else:
+            os.environ["CENPY_CACHE_DIR"] = self._cache_dir
+        self.tmpdir.cleanup()
 
 
 class test_remote(unittest.TestCase):
@@ -7,5 +192,242 @@ class test_remote(unittest.TestCase):
         cenpy.remote.APIConnection(cenpy.explorer.available(verbose=False)[0])
 
 
+class TestQuery(FakeCensusTestCase):
+    def test_query(self):
+        result = self.cxn.query(
+            ["NAME", "B01001_001E"], geo_unit="tract:*", geo_filter=dict(state="04")
+        )
+        self.assertEqual(result.shape, (6, 5))
+        self.assertEqual(result.tract.tolist()[:2], ["000100", "000200"])
+        self.assertEqual(result.tract.dtype, "category")
+        self.assertEqual(result["B01001_001E"].dtype, "int32")
+        self.assertEqual(result["NAME"].iloc[0], "Place 04001000100")
+
+        raw = self.cxn.query(
+            ["B01001_001E"],
+            geo_unit="tract:*",
+            geo_filter=dict(state="04"),
+            convert_numeric=False,
+        )
+        self.assertEqual(raw["B01001_001E"].iloc[0], "100")
+
+    def test_broken_body(self):
+        transport.get_transport().retry = transport.RetryPolicy(backoff_factor=0)
+        send = self.census.send
+        for error in (True, False):
+            broken = []
+
+            def break_once(request, **kwargs):
+                response = send(request, **kwargs)
+                if not broken and "get=" in request.url:
+                    broken.append(request.url)
+                    response.raw = BrokenBody(response._content, error=error)
+                    response.headers["Content-Type"] = "application/json"
+                    response._content = False
+                return response
+
+            self.census.send = break_once
+            queries = len(self.census.queries)
+            result = self.cxn.query(
+                ["NAME", "B01001_001E"], geo_unit="tract:*", geo_filter=dict(state="04")
+            )
+            # the query is made again, whether the body broke off or was cut short
+            self.assertEqual(len(self.census.queries), queries + 2)
+            self.assertEqual(result.shape, (6, 5))
+            self.assertEqual(result["B01001_001E"].tolist(), list(range(100, 106)))
+
+    def test_query_batches(self):
+        batches = list(
+            self.cxn.query_batches(
+                ["B01001_001E"],
+                geo_unit="tract:*",
+                geo_filter=dict(state="04"),
+                batch_size=4,
+            )
+        )
+        self.assertEqual([len(batch) for batch in batches], [4, 2])
+        self.assertEqual(batches[1]["B01001_001E"].tolist(), [104, 105])
+
+    def test_cached(self):
+        transport.get_transport().cache = cache.ResponseCache(
+            path=os.path.join(self.tmpdir.name, "responses.sqlite")
+        )
+        args = ["NAME", "B01001_001E"], "tract:*", dict(state="04")
+        first = self.cxn.query(*args)
+        again = self.cxn.query(*args)
+        self.assertEqual(len(self.census.queries), 1)
+        self.assertTrue(again.equals(first))
+        batches = list(self.cxn.query_batches(*args, batch_size=4))
+        self.assertEqual(len(self.census.queries), 1)
+        self.assertEqual([len(batch) for batch in batches], [4, 2])
+
+    def test_query_many(self):
+        specs = [
+            (["B01001_001E"], "tract:*", dict(state="04", county=county))
+            for county in ("003", "001")
+        ]
+        results = self.cxn.query_many(specs, concurrency=2)
+        self.assertEqual(
+            [r.county.unique().tolist() for r in results], [["003"], ["001"]]
+        )
+
+        results = asyncio.run(self.cxn.aquery_many(specs, concurrency=2))
+        self.assertEqual(
+            [r.county.unique().tolist() for r in results], [["003"], ["001"]]
+        )
+
+        dict_spec = dict(
+            cols=["B01001_001E"], geo_unit="county:*", geo_filter=dict(state="04")
+        )
+        (counties,) = self.cxn.query_many([dict_spec])
+        self.assertEqual(counties.county.tolist(), ["001", "003"])
+
+    def test_iquery_many_window(self):
+        specs = [
+            (["B01001_001E"], "tract:*", dict(state="04", county=county))
+            for county in ("001", "003") * 10
+        ]
+        results = self.cxn.iquery_many(specs, concurrency=2)
+        first = next(results)
+        # only the first window of four queries, and one to refill it, are sent
+        self.assertLessEqual(len(self.census.queries), 5)
+        rest = list(results)
+        self.assertEqual(len(self.census.queries), 20)
+        counties = [r.county.unique().tolist() for r in [first] + rest]
+        self.assertEqual(counties, [["001"], ["003"]] * 10)
+
+    def test_bigcolq(self):
+        cols = ["NAME"] + ["B01001_{:03d}E".format(i) for i in range(1, 61)]
+        result = self.cxn.query(cols, geo_unit="tract:*", geo_filter=dict(state="04"))
+        self.assertEqual(len(self.census.queries), 2)
+        self.assertEqual(result.columns.tolist(), cols + ["state", "county", "tract"])
+        self.assertEqual(result.shape[0], 6)
+        self.assertEqual(result["B01001_060E"].tolist(), list(range(6000, 6006)))
+        self.assertEqual(result["NAME"].iloc[0], "Place 04001000100")
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow(self):
+        cols = ["NAME"] + ["B01001_{:03d}E".format(i) for i in range(1, 61)]
+        table = self.cxn.query(
+            cols, geo_unit="tract:*", geo_filter=dict(state="04"), output="arrow"
+        )
+        self.assertIsInstance(table, pyarrow.Table)
+        self.assertEqual(table.column_names, cols + ["state", "county", "tract"])
+        self.assertEqual(table["B01001_060E"].to_pylist(), list(range(6000, 6006)))
+        self.assertEqual(table["tract"].to_pylist()[:2], ["000100", "000200"])
+
+    def test_group(self):
+        result = self.cxn.query(
+            ["NAME", "group(B01001)"], geo_unit="tract:*", geo_filter=dict(state="04")
+        )
+        self.assertEqual(len(self.census.queries), 1)
+        self.assertEqual(result.shape, (6, 65))
+        self.assertEqual(result.columns[-3:].tolist(), ["state", "county", "tract"])
+        self.assertEqual(result["B01001_060E"].dtype, "int32")
+        self.assertEqual(result["GEO_ID"].iloc[0], "1400000US04001000100")
+
+        cols = ["group(B01001)"] + ["B01001_{:03d}E".format(i) for i in range(1, 50)]
+        result = self.cxn.query(cols, geo_unit="tract:*", geo_filter=dict(state="04"))
+        self.assertEqual(result.shape, (6, 65))
+        self.assertEqual(result["B01001_060E"].tolist(), list(range(6000, 6006)))
+
+    def test_preprocess_variables(self):
+        product = cenpy.products.ACS.__new__(cenpy.products.ACS)
+        product._api = self.cxn
+        self.assertEqual(
+            product._preprocess_variables(["^B01001_", "NAME"]),
+            ["NAME", "group(B01001)"],
+        )
+        self.assertEqual(
+            product._preprocess_variables("B01001_00[12]E"),
+            ["B01001_001E", "B01001_002E"],
+        )
+
+    def test_varslike(self):
+        found = self.cxn.varslike(["B01001_00[1-3]E", "^NAME$"])
+        self.assertEqual(
+            found.index.tolist(), ["NAME", "B01001_001E", "B01001_002E", "B01001_003E"]
+        )
+        found = self.cxn.varslike("total 12", by="label", engine="tokens")
+        self.assertEqual(found.index.tolist(), ["B01001_012E"])
+        found = self.cxn.varslike("B01001_05", engine=lambda c, p: c.startswith(p))
+        self.assertEqual(len(found), 10)
+
+
+class TestStore(FakeCensusTestCase):
+    def setUp(self):
+        super(TestStore, self).setUp()
+        self.store = cenpy.cache.ResultStore(
+            os.path.join(self.tmpdir.name, "results.sqlite")
+        )
+
+    def test_wildcard(self):
+        geo = dict(geo_unit="tract:*", geo_filter=dict(state="04"))
+        first = self.cxn.query(["B01001_001E"], store=self.store, **geo)
+        both = self.cxn.query(["B01001_001E", "B01001_002E"], store=self.store, **geo)
+        self.assertEqual(len(self.census.queries), 2)
+        self.assertIn("get=B01001_002E&", self.census.queries[1])
+        expected = self.cxn.query(["B01001_001E", "B01001_002E"], store=False, **geo)
+        self.assertTrue(both.equals(expected))
+        self.assertTrue(first.equals(expected.drop(columns="B01001_002E")))
+
+        again = self.cxn.query(["B01001_002E"], store=self.store, **geo)
+        self.assertEqual(len(self.census.queries), 3)
+        self.assertEqual(again["B01001_002E"].tolist(), list(range(200, 206)))
+
+    def test_concurrency(self):
+        geo = dict(geo_unit="tract:*", geo_filter=dict(state="04"))
+        self.cxn.query(["B01001_001E"], store=self.store, concurrency=4, **geo)
+        self.cxn.query(
+            ["B01001_001E", "B01001_002E"], store=self.store, concurrency=4, **geo
+        )
+        self.assertEqual(len(self.census.queries), 2)
+        self.assertNotIn("concurrency", self.cxn.last_query)
+        self.cxn.query(["B01001_001E"], store=False, concurrency=4, **geo)
+        self.assertNotIn("concurrency", self.cxn.last_query)
+
+    def test_listed(self):
+        geo_filter = dict(state="04", county="001")
+        self.cxn.query(["NAME"], "tract:000100", geo_filter, store=self.store)
+        previous = cenpy.cache.set_result_store(self.store)
+        try:
+            result = self.cxn.query(["NAME"], "tract:000100,000300", geo_filter)
+        finally:
+            cenpy.cache.set_result_store(previous)
+        self.assertEqual(len(self.census.queries), 2)
+        self.assertIn("for=tract:000300&", self.census.queries[1])
+        self.assertEqual(result.tract.tolist(), ["000100", "000300"])
+        self.assertEqual(result.NAME.tolist()[1], "Place 04001000300")
+
+
+class TestMetadata(FakeCensusTestCase):
+    def test_lazy(self):
+        self.assertEqual(self.census.metadata, [])
+        self.cxn.query(
+            ["B01001_001E"], geo_unit="county:*", geo_filter=dict(state="04")
+        )
+        self.assertEqual(self.census.metadata, [])
+        self.assertIn("B01001_001E", self.cxn.variables.index)
+        self.assertEqual(self.census.metadata, ["/data/2019/test/variables.json"])
+        self.assertIsNone(self.cxn.example_entries)
+
+    def test_load_metadata(self):
+        self.cxn.load_metadata("geographies", "tags")
+        self.assertEqual(
+            sorted(self.census.metadata),
+            ["/data/2019/test/geography.json", "/data/2019/test/tags.json"],
+        )
+        self.assertEqual(self.cxn.tags, ["test", "census"])
+        self.assertEqual(self.cxn.geographies["fips"].shape[0], 3)
+
+    def test_persisted(self):
+        self.cxn.load_metadata()
+        fetched = len(self.census.metadata)
+        fresh = cenpy.remote.APIConnection("TESTDATASET", apikey="")
+        fresh.load_metadata()
+        self.assertEqual(len(self.census.metadata), fetched)
+        self.assertEqual(fresh.variables.shape, self.cxn.variables.shape)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import fnmatch
+import re
+import numpy as np
+import pandas as pd
+from cenpy.search import VariableIndex, _required_literals
+
+NAMES = [
+    "B{:05d}{}_{:03d}{}".format(table, suffix, i, kind)
+    for table in range(1, 40)
+    for suffix in ("", "A")
+    for i in range(1, 8)
+    for kind in "EM"
+]
+VARIABLES = pd.DataFrame(
+    dict(
+        label=["Estimate!!Total!!Line {}".format(n[-5:-1]) for n in NAMES],
+        concept=["SEX BY AGE" if n[-1] == "E" else None for n in NAMES],
+        group=[n.split("_")[0] for n in NAMES],
+    ),
+    index=NAMES,
+)
+
+
+def scan(pattern, by=None, engine="re"):
+    """match the way varslike did before it used an index"""
+    values = VARIABLES.get(by, VARIABLES.index).fillna("")
+    if engine == "re":
+        return np.flatnonzero([re.search(pattern, v) is not None for v in values])
+    return np.flatnonzero(values.isin(fnmatch.filter(values, pattern)))
+
+
+class TestVariableIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = VariableIndex(VARIABLES)
+
+    def test_required_literals(self):
+        self.assertEqual(_required_literals("^B01001_0[0-9]+E$"), ["B01001_0"])
+        self.assertEqual(_required_literals("(?:B01001)A?_001"), ["B01001", "_001"])
+        self.assertEqual(_required_literals("B01001|B02001"), [])
+        self.assertEqual(_required_literals("(?i)b01001"), [])
+
+    def test_regex(self):
+        for pattern in [
+            "^B00001_00[0-9]E$",
+            "B0000[1-3]A",
+            "_00.M",
+            "E$",
+            "B00002_001E|B00003",
+            "(?i)b00004a",
+            "B0000(1|2)A_",
+        ]:
+            np.testing.assert_array_equal(self.index.regex(pattern), scan(pattern))
+        np.testing.assert_array_equal(
+            self.index.regex("AGE", by="concept"), scan("AGE", by="concept")
+        )
+        self.assertEqual(self.index.regex("B99999").size, 0)
+
+    def test_fnmatch(self):
+        for pattern in ["B0001*_00?E", "B00001_001E", "*A_00[12]M"]:
+            np.testing.assert_array_equal(
+                self.index.fnmatch(pattern), scan(pattern, engine="fnmatch")
+            )
+
+    def test_prefix_and_tokens(self):
+        np.testing.assert_array_equal(self.index.prefix("B00002A"), scan("^B00002A"))
+        np.testing.assert_array_equal(
+            self.index.tokens("TOTAL", "line 001"), scan("Line _001$", by="label")
+        )
+        self.assertEqual(
+            self.index.match("sex age", by="concept", engine="tokens").size,
+            len(NAMES) // 2,
+        )
+
+    def test_match_many(self):
+        patterns = ["B0000[1-3]A", "_00.M", "E$", "x|y", "B00005_001E"]
+        expected = np.unique(np.concatenate([scan(p) for p in patterns]))
+        np.testing.assert_array_equal(self.index.match_many(patterns), expected)
+        self.assertEqual(self.index.match_many([]).size, 0)
+        # backreferences must keep referring to groups in their own pattern
+        patterns = [r"(B)x", r"(\d)\1_"]
+        expected = np.unique(np.concatenate([scan(p) for p in patterns]))
+        self.assertGreater(expected.size, 0)
+        np.testing.assert_array_equal(self.index.match_many(patterns), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+from unittest import mock
+from cenpy import tools
+from cenpy.tests.test_remote import FakeCensusTestCase
+
+try:
+    import pyarrow
+    from cenpy import sink
+except ImportError:
+    pyarrow = None
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestParquetSink(FakeCensusTestCase):
+    def setUp(self):
+        super(TestParquetSink, self).setUp()
+        fips = self.cxn.geographies["fips"].copy()
+        fips.at[2, "wildcard"] = None
+        self.cxn.geographies = dict(fips=fips)
+        self.path = os.path.join(self.tmpdir.name, "tracts")
+
+    def test_schema(self):
+        schema = sink.table_schema(self.cxn, "tract", ["B01001_001E"])
+        self.assertEqual(
+            schema.names, ["NAME", "B01001_001E", "state", "county", "tract"]
+        )
+        self.assertEqual(schema.field("B01001_001E").type, pyarrow.int64())
+        self.assertEqual(schema.field("county").type, pyarrow.string())
+
+    def test_partitions(self):
+        schema = sink.table_schema(self.cxn, "tract", ["B01001_001E"])
+        tracts = sink.ParquetSink(self.path, schema)
+        tracts.write_all(tools.genstate_to_tract("04", self.cxn, "B01001_001E"))
+        self.assertEqual((tracts.rows, tracts.chunks), (6, 2))
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.path, "state=04"))),
+            ["county=001", "county=003"],
+        )
+        result = tracts.read()
+        self.assertEqual(result.county.tolist(), ["001"] * 3 + ["003"] * 3)
+        self.assertEqual(result["B01001_001E"].tolist(), [100, 101, 102] * 2)
+        self.assertEqual(str(result["B01001_001E"].dtype), "int64")
+
+    def test_inferred(self):
+        tracts = sink.ParquetSink(self.path)
+        frame = self.cxn.query(
+            ["B01001_001E"], "tract:*", dict(state="04", county="001")
+        )
+        tracts.write(frame)
+        frame["B01001_001E"] = frame["B01001_001E"].astype(float)
+        frame.loc[0, "B01001_001E"] = None
+        tracts.write(frame)
+        self.assertEqual(tracts.schema.field("B01001_001E").type, pyarrow.int64())
+        self.assertEqual(tracts.read()["B01001_001E"].isnull().sum(), 1)
+        with self.assertRaises(ValueError):
+            sink.ParquetSink(self.path, tracts.schema, partition_by=["place"])
+
+    def test_tools(self):
+        schema = sink.table_schema(self.cxn, "tract", ["B01001_001E"])
+        for max_workers in (1, 4):
+            path = os.path.join(self.path, str(max_workers))
+            with mock.patch.object(tools, "_state_fipscodes", ["04"]):
+                tracts = tools.national_to_tract(
+                    self.cxn,
+                    "B01001_001E",
+                    max_workers=max_workers,
+                    sink=sink.ParquetSink(path, schema),
+                )
+            self.assertEqual(tracts.read().shape, (6, 5))
+        with self.assertRaises(ValueError):
+            tools.national_to_tract(
+                self.cxn, "B01001_001E", checkpoint=path, sink=tracts
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
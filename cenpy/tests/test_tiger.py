@@ -1,5 +1,164 @@
 import unittest
+import json
+import threading
+from unittest import mock
+import requests
+import shapely
+from requests.adapters import BaseAdapter
+from urllib.parse import urlparse, parse_qs
 import cenpy
+from cenpy import transport
+
+LAYERURL = (
+    "https://tigerweb.geo.census.gov/arcgis/rest/services/TIGERweb/Test/MapServer"
+)
+
+
+class FakeMapServer(BaseAdapter):
+    """an adapter answering queries like a map server layer of 25 unit squares"""
+
+    def __init__(self, features=25, limit=10):
+        super(FakeMapServer, self).__init__()
+        self.features = features
+        self.limit = limit
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        query = parse_qs(urlparse(request.url).query, keep_blank_values=True)
+        with self._lock:
+            self.queries.append(query)
+        ids = list(range(1, self.features + 1))
+        if query["objectIds"][0]:
+            ids = [int(i) for i in query["objectIds"][0].split(",")]
+        if query["returnIdsOnly"][0] == "true":
+            body = dict(objectIdFieldName="OBJECTID", objectIds=ids[::-1])
+        else:
+            body = dict(
+                geometryType="esriGeometryPolygon",
+                spatialReference=dict(wkid=4326, latestWkid=4326),
+                features=[self.feature(i) for i in ids[: self.limit]],
+            )
+            fields = query["outFields"][0]
+            if fields != "*" and "OBJECTID" not in fields.split(","):
+                for feature in body["features"]:
+                    del feature["attributes"]["OBJECTID"]
+            if len(ids) > self.limit:
+                body["exceededTransferLimit"] = True
+            if query["f"][0] == "geojson":
+                body = self.geojson(body)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(body).encode()
+        response.url, response.request = request.url, request
+        return response
+
+    def feature(self, i):
+        x = float(i)
+        ring = [[x, 0.0], [x, 1.0], [x + 1, 1.0], [x + 1, 0.0], [x, 0.0]]
+        return dict(
+            attributes=dict(OBJECTID=i, GEOID=str(i).rjust(4, "0")),
+            geometry=dict(rings=[ring]),
+        )
+
+    def geojson(self, body):
+        features = [
+            dict(
+                type="Feature",
+                id=feature["attributes"].get("OBJECTID"),
+                properties=feature["attributes"],
+                geometry=dict(type="Polygon", coordinates=feature["geometry"]["rings"]),
+            )
+            for feature in body["features"]
+        ]
+        collection = dict(type="FeatureCollection", features=features)
+        if body.get("exceededTransferLimit"):
+            collection["properties"] = dict(exceededTransferLimit=True)
+        return collection
+
+    def close(self):
+        pass
+
+
+class TestPagination(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeMapServer()
+        self._transport = transport.set_transport(transport.Transport())
+        transport.get_transport().session.mount(LAYERURL, self.server)
+        self.layer = cenpy.tiger.ESRILayer(LAYERURL, id=8, name="Squares")
+
+    def tearDown(self):
+        transport.set_transport(self._transport)
+
+    def test_complete(self):
+        squares = self.layer.query(where="1=1")
+        self.assertEqual(squares.shape[0], 25)
+        self.assertEqual(sorted(squares.OBJECTID), list(range(1, 26)))
+        self.assertEqual(squares.crs.to_epsg(), 4326)
+        # the first page, the object ids, and two batches of the 15 left out
+        self.assertEqual(len(self.server.queries), 4)
+        batches = [q["objectIds"][0] for q in self.server.queries[2:]]
+        self.assertEqual(
+            sorted(batches, key=len),
+            ["21,22,23,24,25", ",".join(str(i) for i in range(11, 21))],
+        )
+
+    def test_without_ids(self):
+        squares = self.layer.query(where="1=1", outFields="GEOID", raw=True)
+        self.assertNotIn("exceededTransferLimit", squares)
+        geoids = [f["attributes"]["GEOID"] for f in squares["features"]]
+        self.assertEqual(sorted(geoids), [str(i).rjust(4, "0") for i in range(1, 26)])
+        # the first page cannot be told apart, so all 25 features are fetched again
+        self.assertEqual(len(self.server.queries), 5)
+
+    def test_geojson(self):
+        squares = self.layer.query(where="1=1", f="geojson")
+        self.assertEqual(squares.columns.tolist(), ["OBJECTID", "GEOID", "geometry"])
+        self.assertEqual(sorted(squares.OBJECTID), list(range(1, 26)))
+        self.assertEqual(squares.crs.to_epsg(), 4326)
+        self.assertEqual(len(self.server.queries), 4)
+        self.assertEqual(
+            [q["f"][0] for q in self.server.queries],
+            ["geojson", "json", "geojson", "geojson"],
+        )
+        esri = self.layer.query(where="1=1").sort_values("OBJECTID")
+        squares = squares.sort_values("OBJECTID")
+        self.assertTrue(squares.geometry.geom_equals(esri.geometry).all())
+
+    def test_parse_geojson(self):
+        square = [[[0.0, 0.0], [0.0, 1.0], [1.0, 1.0], [1.0, 0.0], [0.0, 0.0]]]
+        geometries = [
+            dict(type="Polygon", coordinates=square),
+            None,
+            dict(type="MultiPolygon", coordinates=[square, square]),
+        ]
+        built = cenpy.geoparser.parse_geojson(geometries)
+        self.assertEqual(built[0].area, 1)
+        self.assertIsNone(built[1])
+        self.assertEqual(built[2].geom_type, "MultiPolygon")
+        with mock.patch.object(shapely, "__version__", "1.8.5"), mock.patch.object(
+            shapely, "from_geojson", side_effect=AttributeError
+        ):
+            old = cenpy.geoparser.parse_geojson(geometries)
+        self.assertTrue(old[0].equals(built[0]))
+        self.assertIsNone(old[1])
+        self.assertEqual(len(old[2].geoms), 2)
+
+    def test_formats(self):
+        with self.assertRaises(ValueError):
+            self.layer.query(where="1=1", f="pbf")
+        layer = cenpy.tiger.ESRILayer(
+            LAYERURL, id=8, name="Squares", supportedQueryFormats="JSON, AMF"
+        )
+        with self.assertRaises(ValueError):
+            layer.query(where="1=1", f="geojson")
+        self.assertEqual(self.server.queries, [])
+
+    def test_single_page(self):
+        self.server.limit = 100
+        squares = self.layer.query(where="1=1")
+        self.assertEqual(squares.shape[0], 25)
+        self.assertEqual(len(self.server.queries), 1)
 
 
 class test_tiger(unittest.TestCase):
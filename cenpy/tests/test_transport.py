@@ -0,0 +1,252 @@
+import unittest
+import asyncio
+import threading
+import time
+import requests
+from requests.adapters import BaseAdapter
+from cenpy import transport
+
+
+class RecordingAdapter(BaseAdapter):
+    """an adapter that answers every request with a canned body, recording what was sent"""
+
+    def __init__(self, body=b"[]", status=200):
+        super(RecordingAdapter, self).__init__()
+        self.body = body
+        self.status = status
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append((request, kwargs))
+        response = requests.Response()
+        response.status_code = self.status
+        response._content = self.body
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FlakyAdapter(RecordingAdapter):
+    """an adapter that fails in a given way a number of times before answering"""
+
+    def __init__(self, failures, failure=503, body=b"[]", headers=None):
+        super(FlakyAdapter, self).__init__(body=body)
+        self.failures = failures
+        self.failure = failure
+        self.headers = headers or dict()
+
+    def send(self, request, **kwargs):
+        if len(self.sent) < self.failures:
+            self.sent.append((request, kwargs))
+            if isinstance(self.failure, Exception):
+                raise self.failure
+            response = requests.Response()
+            response.status_code = self.failure
+            response._content = b"<html>overloaded</html>"
+            response.headers.update(self.headers)
+            response.url = request.url
+            return response
+        return super(FlakyAdapter, self).send(request, **kwargs)
+
+
+class TestTransport(unittest.TestCase):
+    """
+    This tests the pooled HTTP transport, without the network
+    """
+
+    def test_pool_sizes(self):
+        tport = transport.Transport(pool_maxsize=4, pool_sizes={"example.com": 2})
+        session = tport.session
+        self.assertIs(session, tport.session)
+        census = session.get_adapter("https://api.census.gov/data/2019/acs/acs5")
+        example = session.get_adapter("https://example.com/")
+        other = session.get_adapter("https://example.org/")
+        self.assertEqual(census._pool_maxsize, 16)
+        self.assertEqual(example._pool_maxsize, 2)
+        self.assertEqual(other._pool_maxsize, 4)
+        tport.set_pool_size("example.com", 8)
+        self.assertEqual(
+            tport.session.get_adapter("https://example.com/")._pool_maxsize, 8
+        )
+
+    def test_request_defaults(self):
+        tport = transport.Transport(timeout=3, compress=False, headers={"X-Test": "1"})
+        adapter = RecordingAdapter(body=b'[["NAME"],["Arizona"]]')
+        tport.session.mount("https://api.census.gov/", adapter)
+        resp = tport.get("https://api.census.gov/data", params=dict(get="NAME"))
+        self.assertEqual(resp.json(), [["NAME"], ["Arizona"]])
+        request, kwargs = adapter.sent[0]
+        self.assertEqual(kwargs["timeout"], 3)
+        self.assertEqual(request.headers["Accept-Encoding"], "identity")
+        self.assertEqual(request.headers["X-Test"], "1")
+        self.assertTrue(request.url.endswith("?get=NAME"))
+
+    def test_set_transport(self):
+        replacement = transport.Transport()
+        previous = transport.set_transport(replacement)
+        try:
+            self.assertIs(transport.get_transport(), replacement)
+        finally:
+            transport.set_transport(previous)
+
+
+class TestRetry(unittest.TestCase):
+    """
+    This tests retries and circuit breaking in the transport
+    """
+
+    def transport(self, adapter, **kwargs):
+        retry = transport.RetryPolicy(total=3, backoff_factor=0, jitter=False)
+        tport = transport.Transport(retry=retry, **kwargs)
+        tport.session.mount("https://api.census.gov/", adapter)
+        return tport
+
+    def test_retry_status(self):
+        adapter = FlakyAdapter(2, failure=503)
+        resp = self.transport(adapter).get("https://api.census.gov/data")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(adapter.sent), 3)
+
+        adapter = FlakyAdapter(5, failure=503)
+        resp = self.transport(adapter).get("https://api.census.gov/data")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(len(adapter.sent), 4)
+
+        adapter = FlakyAdapter(5, failure=404)
+        resp = self.transport(adapter).get("https://api.census.gov/data")
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(len(adapter.sent), 1)
+
+    def test_retry_exception(self):
+        adapter = FlakyAdapter(1, failure=requests.ConnectionError("reset"))
+        resp = self.transport(adapter).get("https://api.census.gov/data")
+        self.assertEqual(resp.status_code, 200)
+
+        adapter = FlakyAdapter(5, failure=requests.ConnectionError("reset"))
+        with self.assertRaises(requests.ConnectionError):
+            self.transport(adapter).get("https://api.census.gov/data")
+
+    def test_retry_on(self):
+        adapter = FlakyAdapter(0, body=b"<html>oops</html>")
+        tport = self.transport(adapter)
+        resp = tport.get(
+            "https://api.census.gov/data",
+            retry_on=lambda r: not r.content.startswith(b"["),
+        )
+        self.assertEqual(len(adapter.sent), 4)
+
+    def test_retry_after(self):
+        policy = transport.RetryPolicy(backoff_factor=1, jitter=False)
+        response = requests.Response()
+        response.headers["Retry-After"] = "7"
+        self.assertEqual(policy.backoff(0, response), 7)
+        response.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+        self.assertEqual(policy.backoff(0, response), 0)
+        self.assertEqual(policy.backoff(3), 8)
+        self.assertEqual(policy.backoff(30), policy.max_backoff)
+
+    def test_circuit_breaker(self):
+        adapter = FlakyAdapter(10, failure=502)
+        tport = self.transport(adapter, failure_threshold=2, reset_timeout=60)
+        tport.retry.total = 1
+        tport.get("https://api.census.gov/data")
+        self.assertEqual(tport.breaker("api.census.gov").state, "open")
+        tport.retry.total = 0
+        with self.assertRaises(transport.CircuitOpenError):
+            tport.get("https://api.census.gov/data")
+        self.assertEqual(len(adapter.sent), 2)
+
+        breaker = transport.CircuitBreaker("example.com", 1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "half-open")
+        breaker.check()
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_half_open_probe(self):
+        breaker = transport.CircuitBreaker("example.com", 1, reset_timeout=5)
+        outcomes = []
+
+        def request():
+            try:
+                breaker.check()
+                outcomes.append("through")
+            except transport.CircuitOpenError:
+                outcomes.append("open")
+
+        # only one request probes the host, and the others wait for its outcome
+        for record, outcome in [
+            (breaker.record_failure, "open"),
+            (breaker.record_success, "through"),
+        ]:
+            breaker.record_failure()
+            breaker._opened -= 5
+            self.assertEqual(breaker.state, "half-open")
+            breaker.check()
+            waiting = threading.Thread(target=request)
+            waiting.start()
+            time.sleep(0.1)
+            self.assertTrue(waiting.is_alive())
+            record()
+            waiting.join(1)
+            self.assertEqual(outcomes.pop(), outcome)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """
+    This tests the token bucket used to pace requests
+    """
+
+    def test_unlimited(self):
+        limiter = transport.RateLimiter()
+        start = time.monotonic()
+        for _ in range(100):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+
+    def test_pacing(self):
+        limiter = transport.RateLimiter(rate=50, burst=5)
+        start = time.monotonic()
+        for _ in range(15):
+            limiter.acquire()
+        # the first five are a burst, the next ten are paced at 50 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+        async def acquire_many():
+            await asyncio.gather(*[limiter.aacquire() for _ in range(10)])
+
+        start = time.monotonic()
+        asyncio.run(acquire_many())
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    def test_invalid_rate(self):
+        for rate in (0, -1):
+            with self.assertRaises(ValueError):
+                transport.RateLimiter(rate=rate)
+            with self.assertRaises(ValueError):
+                transport.Transport(rate=rate)
+            with self.assertRaises(ValueError):
+                transport.Transport().set_rate_limit(rate, key="abc")
+
+    def test_per_key_limits(self):
+        tport = transport.Transport(rate=5)
+        self.assertEqual(tport.limiter("").rate, 5)
+        self.assertIs(tport.limiter("abc"), tport.limiter("abc"))
+        tport.set_rate_limit(100, burst=10, key="abc")
+        self.assertEqual(tport.limiter("abc").rate, 100)
+        tport.set_rate_limit(1)
+        self.assertEqual(tport.limiter("").rate, 1)
+        self.assertEqual(tport.limiter("abc").rate, 100)
+
+    def test_api_key(self):
+        url = "https://api.census.gov/data/2019/acs/acs5?get=NAME&for=state:*&key=abc"
+        self.assertEqual(transport._api_key(url), "abc")
+        self.assertEqual(transport._api_key(url.split("&key")[0]), "")
+        self.assertEqual(transport._api_key(url, params=dict(key="def")), "def")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,4 @@
 from six import iteritems as diter
-import requests as r
 import pandas as pd
 
 try:
@@ -16,8 +15,10 @@ except (ImportError, OSError):
         ' in the "conda-forge" software channel will work.'
     )
 import copy
+from concurrent import futures
 
 from . import geoparser as gpsr
+from . import transport
 
 # all queries to a map server, mounted at
 # tigerweb.geo.census.gov/arcgis/rest/services/TIGERweb/
@@ -55,9 +56,13 @@ _basequery = {
     "returnDistinctValues": "",
 }  # no clue
 
+# the most object ids requested at once when a query is split into batches, to
+# keep the urls of the batches short
+_max_ids = 500
+
 
 def _jget(st):
-    return r.get(st + "?f=json")
+    return transport.get(st + "?f=json")
 
 
 def available(verbose=False):
@@ -119,7 +124,7 @@ class ESRILayer(object):
         except:
             return ""
 
-    def query(self, raw=False, strict=False, **kwargs):
+    def query(self, raw=False, strict=False, max_workers=4, f="json", **kwargs):
         """
         A query function to extract data out of MapServer layers. I've exposed
         every option here 
@@ -150,6 +155,15 @@ class ESRILayer(object):
                     or just warn that at least one polygon is invalid (default: False)
         raw : bool
               whether to provide the raw geometries from the API  (default: False)
+        max_workers: int
+                    number of requests to run at once when a query returns more
+                    features than the map server sends in one response. (default: 4)
+        f:          str
+                    format of the responses requested from the map server,
+                    "json" for Esri JSON, or "geojson" for GeoJSON, whose
+                    geometries are read directly by shapely, skipping the
+                    conversion of Esri geometries. Requires a server that lists
+                    geoJSON in its supportedQueryFormats. (default: "json")
         
         Returns
         ------- 
@@ -164,9 +178,15 @@ class ESRILayer(object):
 
         In most cases, you'll be querying against layers, not MapServices
         overall. 
+
+        Map servers send at most a fixed number of features for each request,
+        like 1000 or 100000. When a query matches more, the object ids of all of
+        its features are requested, and the features left out are fetched in
+        batches of those ids, max_workers at a time.
         """
         # parse args
         kwargs = {"".join(k.split("_")): v for k, v in diter(kwargs)}
+        f = _check_format(f, getattr(self, "_supportedQueryFormats", None))
 
         # construct query string
         self._basequery = copy.deepcopy(_basequery)
@@ -178,11 +198,21 @@ class ESRILayer(object):
         qstring = "&".join(["{}={}".format(k, v) for k, v in diter(self._basequery)])
         self._last_query = self._baseurl + "/query?" + qstring
         # run query
-        resp = r.get(self._last_query + "&f=json")
+        resp = transport.get(self._last_query + "&f=" + f, retry_on=_failed_query)
         resp.raise_for_status()
         datadict = resp.json()
+        if _exceeded(datadict) and "features" in datadict:
+            self._paginate(datadict, max_workers, f=f)
         if raw:
             return datadict
+        if f == "geojson":
+            if "features" not in datadict:
+                raise _malformed(datadict)
+            if kwargs.get("returnGeometry", "true") == "false":
+                return pd.DataFrame.from_records(
+                    [x["properties"] for x in datadict["features"]]
+                )
+            return _from_geojson(datadict, kwargs.get("outSR"))
         if kwargs.get("returnGeometry", "true") == "false":
             return pd.DataFrame.from_records(
                 [x["attributes"] for x in datadict["features"]]
@@ -191,21 +221,7 @@ class ESRILayer(object):
         try:
             features = datadict["features"]
         except KeyError:
-            code, msg = datadict["error"]["code"], datadict["error"]["message"]
-            details = datadict["error"]["details"]
-            if details is []:
-                details = "Mapserver provided no detailed error"
-            raise KeyError(
-                (
-                    r"Response from API is malformed. You may have "
-                    r"submitted too many queries, formatted the request incorrectly, "
-                    r"or experienced significant network connectivity issues."
-                    r" Check to make sure that your inputs, like placenames, are spelled"
-                    r" correctly, and that your geographies match the level at which you"
-                    r" intend to query. The original error from the Census is:\n"
-                    r"(API ERROR {}:{}({}))".format(code, msg, details)
-                )
-            )
+            raise _malformed(datadict)
         todf = []
         for i, feature in enumerate(features):
             locfeat = gpsr.__dict__[datadict["geometryType"]](feature)
@@ -221,6 +237,133 @@ class ESRILayer(object):
         outdf.crs = crs
         return outdf
 
+    def _paginate(self, datadict, max_workers=4, f="json"):
+        """
+        complete the features of a query that exceeded the transfer limit of the
+        map server, by listing the object ids of every feature it matches and
+        fetching those not yet received in batches, max_workers at a time.
+        """
+        listing = dict(self._basequery, returnIdsOnly="true", returnGeometry="false")
+        found = self._fetch(listing)
+        field = found.get("objectIdFieldName")
+        ids = sorted(found.get("objectIds") or [])
+        features = datadict["features"]
+        if f == "geojson":
+            received = [feature.get("id") for feature in features]
+        else:
+            received = [feat.get("attributes", {}).get(field) for feat in features]
+        if None in received:
+            # without their object ids, the features already received cannot be
+            # told apart from the rest, so every feature is fetched in batches
+            features = []
+        else:
+            received = set(received)
+            ids = [i for i in ids if i not in received]
+        size = max(1, min(len(datadict["features"]), _max_ids))
+        batches = [ids[i : i + size] for i in range(0, len(ids), size)]
+        queries = [
+            dict(self._basequery, objectIds=",".join(str(i) for i in batch))
+            for batch in batches
+        ]
+        with futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            for page in pool.map(lambda query: self._fetch(query, f), queries):
+                if "features" not in page:
+                    raise _malformed(page)
+                features.extend(page["features"])
+        datadict["features"] = features
+        datadict.pop("exceededTransferLimit", None)
+        datadict.get("properties", {}).pop("exceededTransferLimit", None)
+        return datadict
+
+    def _fetch(self, query, f="json"):
+        """run a query built like _basequery, returning the parsed response"""
+        qstring = "&".join(["{}={}".format(k, v) for k, v in diter(query)])
+        url = self._baseurl + "/query?" + qstring + "&f=" + f
+        resp = transport.get(url, retry_on=_failed_query)
+        resp.raise_for_status()
+        return resp.json()
+
+
+def _check_format(f, supported=None):
+    """check the format requested for responses is read by cenpy and the server"""
+    f = f.lower()
+    if f == "pbf":
+        raise ValueError(
+            "Protocol buffer responses (f='pbf') cannot be decoded by cenpy."
+            " Use f='geojson' or f='json' instead."
+        )
+    if f not in ("json", "geojson"):
+        raise ValueError("f must be 'json' or 'geojson', not {!r}".format(f))
+    if supported is not None:
+        formats = [name.strip().lower() for name in supported.split(",")]
+        if f not in formats:
+            raise ValueError(
+                "The layer does not support f={!r}. It supports: {}".format(
+                    f, supported
+                )
+            )
+    return f
+
+
+def _exceeded(datadict):
+    """whether a response left out features, as Esri JSON or as GeoJSON says"""
+    properties = datadict.get("properties") or {}
+    return bool(
+        datadict.get("exceededTransferLimit")
+        or properties.get("exceededTransferLimit")
+    )
+
+
+def _from_geojson(datadict, out_sr=None):
+    """
+    build a GeoDataFrame from a GeoJSON response, in the spatial reference named
+    by the response, or else the one requested, or else WGS84 as GeoJSON requires
+    """
+    crs = (datadict.get("crs") or {}).get("properties", {}).get("name")
+    if crs is None:
+        crs = "epsg:{}".format(out_sr) if out_sr else "epsg:4326"
+    features = datadict["features"]
+    properties = pd.DataFrame([feature.get("properties") or {} for feature in features])
+    geometries = gpsr.parse_geojson([feature.get("geometry") for feature in features])
+    return GeoDataFrame(properties, geometry=geometries, crs=crs)
+
+
+def _malformed(datadict):
+    """build the error raised when a map server does not return features"""
+    error = datadict.get("error", {})
+    code, msg = error.get("code"), error.get("message")
+    details = error.get("details")
+    if not details:
+        details = "Mapserver provided no detailed error"
+    return KeyError(
+        (
+            r"Response from API is malformed. You may have "
+            r"submitted too many queries, formatted the request incorrectly, "
+            r"or experienced significant network connectivity issues."
+            r" Check to make sure that your inputs, like placenames, are spelled"
+            r" correctly, and that your geographies match the level at which you"
+            r" intend to query. The original error from the Census is:\n"
+            r"(API ERROR {}:{}({}))".format(code, msg, details)
+        )
+    )
+
+
+def _failed_query(resp):
+    """
+    check whether a successful response from an ESRI MapServer is malformed or
+    reports a server-side error, either of which may succeed if retried.
+    """
+    head = resp.content[:64].lstrip()
+    if not head.startswith(b"{"):
+        return True
+    if not head[1:].lstrip().startswith(b'"error"'):
+        return False
+    try:
+        code = resp.json()["error"].get("code", 500)
+    except (ValueError, KeyError, AttributeError):
+        return True
+    return code == 429 or code >= 500
+
 
 class TigerConnection(object):
     """The fundamental building block for US Census Bureau's Geographic, an ESRI MapService"""
@@ -2,7 +2,9 @@ import pandas as pd
 import os
 import warnings as warn
 import time
-from .explorer import fips_table as _ft
+from collections import deque
+from concurrent import futures
+from . import reference as _reference
 from requests import HTTPError
 
 try:
@@ -13,11 +15,18 @@ except ImportError:
         return arg
 
 
-_state_fipscodes = _ft("state")["FIPS Code"]
-_state_fipscodes = [str(f).rjust(2, "0") for f in _state_fipscodes if f < 60]
+_state_fipscodes = [f for f in _reference.states().frame.STATEFP if int(f) < 60]
 
 
-def national_to_block(cxn, *columns, wait_by_state=0, wait_by_county=0):
+def national_to_block(
+    cxn,
+    *columns,
+    wait_by_state=0,
+    wait_by_county=0,
+    max_workers=1,
+    checkpoint=None,
+    sink=None
+):
     """
     A helper function to grab all blocks by iterating over state fips codes in cenpy.explorer.fips_table. 
     This just naively calls state_to_block for each state, so will end up executing quite a few queries. 
@@ -32,22 +41,42 @@ def national_to_block(cxn, *columns, wait_by_state=0, wait_by_county=0):
                     to grab from the connection. A call may be like:
                     >>> tools.national_to_block(cxn, *cxn.varslike('H001*"))
     wait_by_state : callable or int
-                    if an integer, gives the number of seconds passed 
+                    deprecated. If an integer, gives the number of seconds passed 
                     to sys.sleep between each state query. if callable,
-                    will be called each state to get a sleep time. This
-                    means you can use random waittimes. So, to wait
-                    for an exponentially-distributed number of seconds:
-                    >>> import random
-                    >>> tools.national_to_block(cxn, 
-                                                *cxn.varslike("P001*"), 
-                                                wait_by_state = lambda : (random.expovariate(2) * 20))
+                    will be called each state to get a sleep time. 
     wait_by_county: callable or int
-                    wait time (or wait time callable) applied between each county-level query. See wait_by_state for more information. If this value tends to be large, the time it takes to conduct the query can get large quickly. 
+                    deprecated. wait time (or wait time callable) applied between each county-level query. 
+    max_workers:    int
+                    number of queries to run at once. If more than one, states
+                    and the counties within them are queried concurrently, and
+                    the waits are ignored. See gennational_to_block. (default: 1)
+    checkpoint:     str or None
+                    directory in which to keep the result of each query as it
+                    completes. If the pull fails, calling it again with the same
+                    directory resumes it, skipping the queries already done.
+                    The waits are ignored. See cenpy.jobs.ExtractionJob
+    sink:           cenpy.sink.ParquetSink or None
+                    where to write the result of each query as it completes,
+                    instead of gathering them into one dataframe, so that the
+                    pull runs in constant memory. The sink is returned. The
+                    waits are ignored.
+
+    Notes
+    -----
+    Queries are paced by the rate limiter of cenpy's transport, rather than
+    by waiting between queries. To stay within a quota of, say, 10 requests a second
+    with bursts of up to 20 requests, set the limit for your API key before querying:
+    >>> from cenpy import transport
+    >>> transport.get_transport().set_rate_limit(10, burst=20, key=cxn.apikey)
     """
-    if isinstance(wait_by_state, (int, float)):
-        waitfunc = lambda: wait_by_state
-    else:
-        waitfunc = wait_by_state
+    if sink is not None:
+        return _sunk(cxn, "block", columns, sink, checkpoint, max_workers)
+    if checkpoint is not None:
+        return _checkpointed(cxn, "block", columns, checkpoint, max_workers)
+    if max_workers > 1:
+        results = gennational_to_block(cxn, *columns, max_workers=max_workers)
+        return _sorted(pd.concat(results))
+    pause = _pacer(wait_by_state)
     outs = []
     for fp in tqdm(_state_fipscodes):
         print(fp)
@@ -58,20 +87,36 @@ def national_to_block(cxn, *columns, wait_by_state=0, wait_by_county=0):
                 "Something failed in state {}, terminating prematurely".format(fp)
             )
             raise
-        time.sleep(waitfunc())
+        pause()
     return pd.concat(outs)
 
 
-def national_to_tract(cxn, *columns, wait_by_state=0, wait_by_county=0):
+def national_to_tract(
+    cxn,
+    *columns,
+    wait_by_state=0,
+    wait_by_county=0,
+    max_workers=1,
+    checkpoint=None,
+    sink=None
+):
     """
     A helper function to grab all tracts by iterating over state fips codes in cenpy.explorer.fips_table. 
     This just naively calls state_to_tract for each state, so will end up executing quite a few queries. 
     You may be rate limited if you don't use an APIKEY
+
+    Pass max_workers to query states, and the counties within them, concurrently,
+    checkpoint to keep results on disk to resume from, and sink to write results
+    to a Parquet dataset as they arrive. See national_to_block.
     """
-    if isinstance(wait_by_state, (int, float)):
-        waitfunc = lambda: wait_by_state
-    else:
-        waitfunc = wait_by_state
+    if sink is not None:
+        return _sunk(cxn, "tract", columns, sink, checkpoint, max_workers)
+    if checkpoint is not None:
+        return _checkpointed(cxn, "tract", columns, checkpoint, max_workers)
+    if max_workers > 1:
+        results = gennational_to_tract(cxn, *columns, max_workers=max_workers)
+        return _sorted(pd.concat(results))
+    pause = _pacer(wait_by_state)
     outs = []
     for fp in _state_fipscodes:
         try:
@@ -81,20 +126,36 @@ def national_to_tract(cxn, *columns, wait_by_state=0, wait_by_county=0):
                 "Something failed in state {}, terminating prematurely".format(fp)
             )
             raise
-        time.sleep(waitfunc())
+        pause()
     return pd.concat(outs)
 
 
-def national_to_blockgroup(cxn, *columns, wait_by_state=0, wait_by_county=0):
+def national_to_blockgroup(
+    cxn,
+    *columns,
+    wait_by_state=0,
+    wait_by_county=0,
+    max_workers=1,
+    checkpoint=None,
+    sink=None
+):
     """
     A helper function to grab all blockgroups by iterating over state fips codes in cenpy.explorer.fips_table. 
     This just naively calls state_to_blockgroup for each state, so will end up executing quite a few queries. 
     You may be rate limited if you don't use an APIKEY
+
+    Pass max_workers to query states, and the counties within them, concurrently,
+    checkpoint to keep results on disk to resume from, and sink to write results
+    to a Parquet dataset as they arrive. See national_to_block.
     """
-    if isinstance(wait_by_state, (int, float)):
-        wait_by_state = lambda: wait_by_state
-    else:
-        waitfunc = wait_by_state
+    if sink is not None:
+        return _sunk(cxn, "block group", columns, sink, checkpoint, max_workers)
+    if checkpoint is not None:
+        return _checkpointed(cxn, "block group", columns, checkpoint, max_workers)
+    if max_workers > 1:
+        results = gennational_to_blockgroup(cxn, *columns, max_workers=max_workers)
+        return _sorted(pd.concat(results))
+    pause = _pacer(wait_by_state)
     outs = []
     for fp in _state_fipscodes:
         try:
@@ -104,7 +165,7 @@ def national_to_blockgroup(cxn, *columns, wait_by_state=0, wait_by_county=0):
                 "Something failed in state {}, terminating prematurely".format(fp)
             )
             raise
-        time.sleep(waitfunc(a))
+        pause()
     return pd.concat(outs)
 
 
@@ -113,14 +174,11 @@ def state_to_block(stfips, cxn, *columns, wait=0):
     Casts the generator constructed by genstate_to_block to a full dataframe. 
     For arguments, see genstate_to_block
     """
-    if isinstance(wait, (int, float)):
-        waitfunc = lambda: wait
-    else:
-        waitfunc = wait
+    pause = _pacer(wait)
     out = []
     for cblock in genstate_to_block(stfips, cxn, *columns):
         out.append(cblock)
-        time.sleep(waitfunc())
+        pause()
     return pd.concat(out)
 
 
@@ -129,14 +187,11 @@ def state_to_blockgroup(stfips, cxn, *columns, wait=0):
     Casts the generator constructed by genstate_to_blockgroup to a full dataframe. 
     For arguments, see genstate_to_blockgroup
     """
-    if isinstance(wait, (int, float)):
-        waitfunc = lambda: wait
-    else:
-        waitfunc = wait
+    pause = _pacer(wait)
     out = []
     for cblock in genstate_to_blockgroup(stfips, cxn, *columns):
         out.append(cblock)
-        time.sleep(waitfunc())
+        pause()
     return pd.concat(out)
 
 
@@ -155,21 +210,19 @@ def state_to_tract(stfips, cxn, *columns, wait=0):
                 >>> #is equivalent to:
                 >>> state_to_tract('06', cxn, *['H0010001', 'P001002'])
     wait    :   int or callable
-                a number of seconds to wait before the next county
+                deprecated. a number of seconds to wait before the next county
                 is queried. Must be an integer or a function that 
                 takes no arguments and returns a number of seconds 
-                to wait. 
+                to wait. Use the rate limiter of cenpy's transport instead
+                (see national_to_block).
                 
     For arguments, see genstate_to_tract
     """
-    if isinstance(wait, (int, float)):
-        waitfunc = lambda: wait
-    else:
-        waitfunc = wait
+    pause = _pacer(wait)
     out = []
     for cblock in genstate_to_tract(stfips, cxn, *columns):
         out.append(cblock)
-        time.sleep(waitfunc())
+        pause()
     return pd.concat(out)
 
 
@@ -187,18 +240,15 @@ def county_to_block(stfips, ctfips, cxn, *columns, wait=0):
     -------
     dataframe containing the entries of columns for each block. 
     """
-    if isinstance(wait, (int, float)):
-        waitfunc = lambda: wait
-    else:
-        waitfunc = wait
+    pause = _pacer(wait)
     out = []
     for cblock in gencounty_to_block(stfips, ctfips, cxn, *columns):
         out.append(cblock)
-        time.sleep(waitfunc())
+        pause()
     return pd.concat(out)
 
 
-def genstate_to_block(stfips, cxn, *columns):
+def genstate_to_block(stfips, cxn, *columns, concurrency=4):
     """
     Generator to handle geo-in-geo queries without the user having to worry about wrangling the counties. 
 
@@ -210,29 +260,21 @@ def genstate_to_block(stfips, cxn, *columns):
                 connection instance
     *columns:   str
                 columns that are desired by the user to grab for each block. 
+    concurrency:int
+                number of queries to run at once. (default: 4)
     Returns
     -------
     a Generator that yields dataframes.
+
+    Notes
+    -----
+    The queries are planned by cenpy.planner.Planner, so counties or tracts
+    are only listed out when the API does not accept wildcards for them.
     """
-    counties = cxn.query(["NAME"], geo_unit="county", geo_filter={"state": stfips})
-    counties = counties.county.tolist()
-    ctracts = (
-        (county, tract)
-        for county in counties
-        for tract in cxn.query(
-            ["NAME"], geo_unit="tract", geo_filter={"state": stfips, "county": county}
-        ).tract
-    )
-    for county, tract in tqdm(ctracts):
-        blocks = cxn.query(
-            ["NAME"] + list(columns),
-            geo_unit="block",
-            geo_filter={"state": stfips, "county": county, "tract": tract},
-        )
-        yield blocks
+    return _genlevel(cxn, "block", columns, concurrency, state=stfips)
 
 
-def gencounty_to_block(stfips, ctfips, cxn, *columns):
+def gencounty_to_block(stfips, ctfips, cxn, *columns, concurrency=4):
     """
     Generator to handle geo-in-geo queries without the user having to worry about wrangling the tracts
     within a county.
@@ -245,24 +287,24 @@ def gencounty_to_block(stfips, ctfips, cxn, *columns):
              fips of the county
     cxn    : connection to use
     *columns: splatted list of the columns to query, all strings
+    concurrency: int
+             number of queries to run at once. (default: 4)
 
     Returns
     -------
     a Generator that yields dataframes
     """
-    start_filter = dict(
-        state=str(stfips).rjust(2, "0"), county=str(ctfips).rjust(3, "0")
+    return _genlevel(
+        cxn,
+        "block",
+        columns,
+        concurrency,
+        state=stfips,
+        county=str(ctfips).rjust(3, "0"),
     )
-    tracts = cxn.query(["NAME"], geo_unit="tract", geo_filter=start_filter)
-    for tract in tqdm(tracts.tract):
-        start_filter.update(dict(tract=tract))
-        blocks = cxn.query(
-            ["NAME"] + list(columns), geo_unit="block", geo_filter=start_filter
-        )
-        yield blocks
 
 
-def genstate_to_blockgroup(stfips, cxn, *columns):
+def genstate_to_blockgroup(stfips, cxn, *columns, concurrency=4):
     """
     Generator to handle geo-in-geo queries without the user having to worry about wrangling the counties. 
 
@@ -274,29 +316,16 @@ def genstate_to_blockgroup(stfips, cxn, *columns):
                 connection instance
     *columns:   str
                 columns that are desired by the user to grab for each blockgroup. 
+    concurrency:int
+                number of queries to run at once. (default: 4)
     Returns
     -------
     a Generator that yields dataframes.
     """
-    counties = cxn.query(["NAME"], geo_unit="county", geo_filter={"state": stfips})
-    counties = counties.county.tolist()
-    ctracts = (
-        (county, tract)
-        for county in counties
-        for tract in cxn.query(
-            ["NAME"], geo_unit="tract", geo_filter={"state": stfips, "county": county}
-        ).tract
-    )
-    for county, tract in tqdm(ctracts):
-        blockgroups = cxn.query(
-            ["NAME"] + list(columns),
-            geo_unit="blockgroup",
-            geo_filter={"state": stfips, "county": county, "tract": tract},
-        )
-        yield blockgroups
+    return _genlevel(cxn, "block group", columns, concurrency, state=stfips)
 
 
-def genstate_to_tract(stfips, cxn, *columns):
+def genstate_to_tract(stfips, cxn, *columns, concurrency=4):
     """
     Generator to handle geo-in-geo queries without the user having to worry about wrangling the counties. 
 
@@ -308,19 +337,227 @@ def genstate_to_tract(stfips, cxn, *columns):
                 connection instance
     *columns:   str
                 columns that are desired by the user to grab for each tract. 
+    concurrency:int
+                number of queries to run at once. (default: 4)
     Returns
     -------
     a Generator that yields dataframes.
     """
-    counties = cxn.query(["NAME"], geo_unit="county", geo_filter={"state": stfips})
-    counties = counties.county.tolist()
-    for county in tqdm(counties):
-        tract = cxn.query(
-            ["NAME"] + list(columns),
-            geo_unit="tract",
-            geo_filter={"state": stfips, "county": county},
+    return _genlevel(cxn, "tract", columns, concurrency, state=stfips)
+
+
+def gennational_to_block(cxn, *columns, max_workers=8):
+    """
+    Generator of the blocks in every state, querying states and the counties
+    within them concurrently. Results are yielded as soon as each query completes,
+    so they do not arrive in order.
+
+    Parameters
+    ----------
+    cxn         :   cenpy.remote.APIConnection
+                    connection instance
+    *columns    :   str
+                    columns that are desired by the user to grab for each block.
+    max_workers :   int
+                    number of queries to run at once, across all states. Queries
+                    are paced by the rate limiter of cenpy's transport, which is
+                    shared by all of them. (default: 8)
+
+    Returns
+    -------
+    a Generator that yields dataframes.
+    """
+    return _gennational(cxn, "block", columns, max_workers)
+
+
+def gennational_to_blockgroup(cxn, *columns, max_workers=8):
+    """
+    Generator of the blockgroups in every state, querying states and the counties
+    within them concurrently. See gennational_to_block.
+    """
+    return _gennational(cxn, "block group", columns, max_workers)
+
+
+def gennational_to_tract(cxn, *columns, max_workers=8):
+    """
+    Generator of the tracts in every state, querying states concurrently.
+    See gennational_to_block.
+    """
+    return _gennational(cxn, "tract", columns, max_workers)
+
+
+def explain_plan(
+    cxn, level, *columns, stfips=None, ctfips=None, concurrency=4, latency=1.0
+):
+    """
+    Estimate the cost of fetching columns for every geography at a level with
+    the national_to_*, state_to_*, or county_to_* helpers, without running
+    any queries. Only the geographies of the connection are read, from disk when
+    they have been fetched before.
+
+    Parameters
+    ---------
+    cxn         :   cenpy.remote.APIConnection
+                    connection object against which the queries would occur
+    level       :   str
+                    "block", "block group", or "tract"
+    *columns    :   splatted list of columns to grab from the API
+    stfips      :   str or None
+                    the state to estimate, as for state_to_*. If None, every
+                    state is estimated, as for national_to_*.
+    ctfips      :   str or None
+                    the county to estimate within stfips, as for county_to_block
+    concurrency :   int
+                    number of queries run at once for each state (default: 4)
+    latency     :   float
+                    seconds expected for each request. (default: 1.0)
+
+    Returns
+    -------
+    dict with the number of requests, the number of geographies, cells, and
+    bytes expected, and the seconds expected to make the requests. See
+    cenpy.planner.estimate
+
+    Example
+    -------
+    >>> tools.explain_plan(cxn, "block", "P001001")["requests"]
+    """
+    from .planner import Planner, estimate
+
+    planner = Planner(cxn, concurrency=concurrency)
+    states = _state_fipscodes if stfips is None else [stfips]
+    counts = [0, 0, 0]
+    for state in states:
+        within = dict(state=str(state).rjust(2, "0"))
+        if ctfips is not None:
+            within["county"] = str(ctfips).rjust(3, "0")
+        counts = [sum(pair) for pair in zip(counts, planner._count(level, within))]
+    queries, discovery, geographies = counts
+    return estimate(
+        cxn,
+        ["NAME"] + list(columns),
+        queries,
+        geographies,
+        discovery=discovery,
+        apikey=cxn.apikey,
+        concurrency=concurrency,
+        latency=latency,
+    )
+
+
+def _genlevel(cxn, level, columns, concurrency, **within):
+    """
+    plan the fewest queries for columns at every geography of a level within
+    a state (or county), and generate their results as they arrive in order.
+    """
+    from .planner import Planner
+
+    within["state"] = str(within["state"]).rjust(2, "0")
+    planner = Planner(cxn, concurrency=concurrency)
+    specs = planner.specs(["NAME"] + list(columns), level, within)
+    results = cxn.iquery_many(specs, concurrency=concurrency)
+    for result in tqdm(results, total=len(specs)):
+        yield result
+
+
+def _gennational(cxn, level, columns, max_workers):
+    """
+    plan the queries for a level in each state, and run the planned queries as
+    each plan completes, all in one pool of threads. Generate the results of
+    the queries as they complete.
+    """
+    from .planner import Planner
+
+    planner = Planner(cxn, concurrency=1)
+    columns = ["NAME"] + list(columns)
+    # queries waiting to be submitted, so that at most 2 * max_workers results
+    # are held before they are yielded
+    waiting = deque()
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        plans = {
+            pool.submit(planner.specs, columns, level, dict(state=fips)): fips
+            for fips in _state_fipscodes
+        }
+        pending = set(plans)
+        try:
+            while pending or waiting:
+                queries = len(pending.difference(plans))
+                while waiting and queries < 2 * max_workers:
+                    pending.add(pool.submit(cxn.query, *waiting.popleft()))
+                    queries += 1
+                done, pending = futures.wait(
+                    pending, return_when=futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    try:
+                        result = future.result()
+                    except HTTPError:
+                        warn.warn(
+                            "Something failed in state {}, terminating"
+                            " prematurely".format(plans.get(future, "query"))
+                        )
+                        raise
+                    if future in plans:
+                        waiting.extend(result)
+                    else:
+                        yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _checkpointed(cxn, level, columns, path, max_workers):
+    """run, or resume, a national pull kept on disk in path"""
+    from .jobs import ExtractionJob
+
+    job = ExtractionJob(cxn, level, columns, path, max_workers=max_workers)
+    return job.run().read()
+
+
+def _sunk(cxn, level, columns, sink, checkpoint, max_workers):
+    """write the results of a national pull to a sink as they arrive"""
+    if checkpoint is not None:
+        raise ValueError(
+            "A pull can be checkpointed or written to a sink, but not both. The"
+            " partitions of a checkpointed pull can be written to a sink after it"
+            " completes."
         )
-        yield tract
+    if max_workers > 1:
+        return sink.write_all(_gennational(cxn, level, columns, max_workers))
+    for fips in tqdm(_state_fipscodes):
+        sink.write_all(_genlevel(cxn, level, columns, 1, state=fips))
+    return sink
+
+
+def _sorted(frame):
+    """sort the result of concurrent queries by geography, as if run in order"""
+    keys = [
+        key
+        for key in ("state", "county", "tract", "block group", "block")
+        if key in frame.columns
+    ]
+    return frame.sort_values(keys, kind="stable") if keys else frame
+
+
+def _pacer(wait):
+    """
+    Build a function that pauses between queries for `wait` seconds, where wait
+    is a number or a function returning a number. Queries are paced by the
+    rate limiter on cenpy's transport, so this only pauses when a wait is
+    explicitly requested, which is deprecated.
+    """
+    if not callable(wait):
+        if not wait:
+            return lambda: None
+        seconds = wait
+        wait = lambda: seconds
+    warn.warn(
+        "Waiting between queries is deprecated and will be removed. Set a rate"
+        " limit using cenpy.transport.get_transport().set_rate_limit() instead.",
+        DeprecationWarning,
+        stacklevel=3,
+    )
+    return lambda: time.sleep(wait())
 
 
 def set_sitekey(sitekey, overwrite=False):
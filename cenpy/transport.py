@@ -0,0 +1,710 @@
+"""
+The HTTP transport shared by every network call that cenpy makes.
+
+All requests to the Census Data API, TIGERweb, and the Census Bureau's file
+servers go through a single Transport, which holds a pooled, keep-alive
+requests.Session. Connections are reused across queries, so that bulk pulls
+of many small requests do not pay for a new TCP & TLS handshake each time.
+"""
+
+import asyncio
+import random
+import threading
+import time
+import requests as r
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from six import iteritems as diter
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    from urllib3.util.request import ACCEPT_ENCODING as _accept_encoding
+except ImportError:
+    _accept_encoding = "gzip,deflate"
+
+# the hosts cenpy talks to most, which get larger connection pools by default
+_default_pool_sizes = {"api.census.gov": 16, "tigerweb.geo.census.gov": 16}
+
+
+class RateLimiter(object):
+    """A token bucket that paces requests, shared between threads and asyncio tasks"""
+
+    def __init__(self, rate=None, burst=None):
+        """
+        Parameters
+        ----------
+        rate    :   float or None
+                    number of requests allowed per second, on average. If None,
+                    requests are not limited. (default: None)
+        burst   :   int
+                    number of requests that may be made at once before pacing
+                    begins. (default: the larger of 1 and rate)
+        """
+        _check_rate(rate)
+        self.rate = rate
+        if burst is None:
+            burst = max(1, rate if rate is not None else 1)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "RateLimiter(rate={}, burst={})".format(self.rate, self.burst)
+
+    def _reserve(self):
+        """
+        take a token from the bucket, returning the number of seconds to wait
+        until that token is available. Tokens may be reserved ahead of time, so
+        concurrent callers are spaced out rather than all waking at once.
+        """
+        if self.rate is None:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Block the calling thread until a request may be made."""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        """Wait, without blocking the event loop, until a request may be made."""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RetryPolicy(object):
+    """When, and after how long, to retry a failed request"""
+
+    def __init__(
+        self,
+        total=5,
+        backoff_factor=0.5,
+        max_backoff=60,
+        statuses=(429, 500, 502, 503, 504),
+        exceptions=(r.ConnectionError, r.Timeout),
+        respect_retry_after=True,
+        jitter=True,
+    ):
+        """
+        Parameters
+        ----------
+        total               :   int
+                                number of times to retry a request before giving up (default: 5)
+        backoff_factor      :   float
+                                seconds to wait before the first retry. The wait doubles
+                                for each retry after that. (default: 0.5)
+        max_backoff         :   float
+                                longest wait between retries, in seconds (default: 60)
+        statuses            :   tuple of int
+                                HTTP status codes that are retried
+                                (default: 429, 500, 502, 503, 504)
+        exceptions          :   tuple of Exception classes
+                                exceptions raised while making a request that are retried
+                                (default: connection errors and timeouts)
+        respect_retry_after :   bool
+                                whether to wait for as long as a host asks in its
+                                Retry-After header, when it provides one (default: True)
+        jitter              :   bool
+                                whether to wait for a random fraction of the backoff, so that
+                                concurrent requests do not retry in lockstep (default: True)
+        """
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.statuses = tuple(statuses)
+        self.exceptions = tuple(exceptions)
+        self.respect_retry_after = respect_retry_after
+        self.jitter = jitter
+
+    def __repr__(self):
+        return "RetryPolicy(total={}, backoff_factor={}, statuses={})".format(
+            self.total, self.backoff_factor, self.statuses
+        )
+
+    def backoff(self, attempt, response=None):
+        """
+        Number of seconds to wait before retrying a request that has failed `attempt` times before.
+
+        Parameters
+        ----------
+        attempt     :   int
+                        number of retries already made
+        response    :   requests.Response
+                        the failed response, if there was one, whose Retry-After
+                        header is respected.
+        """
+        if self.respect_retry_after and response is not None:
+            retry_after = _retry_after(response)
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        wait = min(self.max_backoff, self.backoff_factor * (2**attempt))
+        if self.jitter:
+            wait = random.uniform(0, wait)
+        return wait
+
+
+class CircuitOpenError(r.ConnectionError):
+    """Raised when a host has failed too often to be contacted for now"""
+
+    def __init__(self, *args, retry_in=0, **kwargs):
+        super(CircuitOpenError, self).__init__(*args, **kwargs)
+        self.retry_in = retry_in
+
+
+class CircuitBreaker(object):
+    """Stops requests to a host that keeps failing, until it has had time to recover"""
+
+    def __init__(self, host, failure_threshold=10, reset_timeout=30):
+        """
+        Parameters
+        ----------
+        host                :   str
+                                name of the host the breaker guards
+        failure_threshold   :   int
+                                number of failures in a row after which the breaker
+                                opens, stopping requests to the host (default: 10)
+        reset_timeout       :   float
+                                seconds after opening that the breaker lets a request
+                                through to see if the host has recovered (default: 30)
+        """
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened = None
+        # when the request probing a half-open breaker was let through
+        self._probing = None
+        self._lock = threading.Lock()
+        self._probed = threading.Condition(self._lock)
+
+    def __repr__(self):
+        return "CircuitBreaker({}, {})".format(self.host, self.state)
+
+    @property
+    def state(self):
+        """
+        one of "closed" (requests flow), "open" (requests stop), or
+        "half-open" (a request is let through to test whether the host has recovered)
+        """
+        if self._opened is None:
+            return "closed"
+        if time.monotonic() - self._opened < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def check(self):
+        """
+        raise a CircuitOpenError if requests to the host should not be made now.
+        When the breaker is half-open, a single request is let through to probe
+        the host, and other requests wait until the probe succeeds or fails. If
+        the probe has not finished after reset_timeout, another is let through.
+        """
+        with self._lock:
+            while self._opened is not None:
+                now = time.monotonic()
+                remaining = self.reset_timeout - (now - self._opened)
+                if remaining > 0:
+                    raise CircuitOpenError(
+                        "{} has failed {} times in a row. Requests to it are paused"
+                        " for another {:.1f} seconds.".format(
+                            self.host, self.failures, remaining
+                        ),
+                        retry_in=remaining,
+                    )
+                if self._probing is None or now - self._probing >= self.reset_timeout:
+                    self._probing = now
+                    return
+                self._probed.wait(self.reset_timeout - (now - self._probing))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened = None
+            self._probing = None
+            self._probed.notify_all()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                # (re)open the breaker, including when a half-open probe fails
+                self._opened = time.monotonic()
+            self._probing = None
+            self._probed.notify_all()
+
+
+class Transport(object):
+    """A pooled, keep-alive HTTP session with per-host pool sizes and timeouts"""
+
+    def __init__(
+        self,
+        pool_connections=10,
+        pool_maxsize=10,
+        pool_sizes=None,
+        timeout=(10, 300),
+        compress=True,
+        headers=None,
+        rate=None,
+        burst=None,
+        retry=None,
+        failure_threshold=10,
+        reset_timeout=30,
+        cache=None,
+    ):
+        """
+        Parameters
+        ----------
+        pool_connections:   int
+                            number of hosts for which connection pools are kept
+                            by the default adapter. (default: 10)
+        pool_maxsize    :   int
+                            number of connections kept open to each host that is
+                            not listed in pool_sizes. (default: 10)
+        pool_sizes      :   dict
+                            mapping from a host name, like "api.census.gov", to the
+                            number of connections to keep open to that host. By default,
+                            the Census Data API and TIGERweb keep 16 connections each.
+        timeout         :   float or tuple
+                            seconds to wait to connect to and read from a host, passed
+                            to requests. Either one number, or a (connect, read) pair.
+                            (default: (10, 300))
+        compress        :   bool
+                            whether to ask hosts to compress their responses (default: True)
+        headers         :   dict
+                            additional headers sent with every request
+        rate            :   float or None
+                            number of requests per second allowed for each API key
+                            (and for requests made without a key), unless set otherwise
+                            using set_rate_limit(). If None, requests are not limited.
+                            (default: None)
+        burst           :   int
+                            number of requests that may be made at once for each API key
+                            before pacing begins. See RateLimiter.
+        retry           :   RetryPolicy or None
+                            when to retry failed requests. If not provided, the default
+                            RetryPolicy is used. To never retry, use RetryPolicy(total=0).
+        failure_threshold:  int
+                            number of failures in a row after which requests to a host
+                            are paused. See CircuitBreaker. (default: 10)
+        reset_timeout   :   float
+                            seconds for which requests to a failing host are paused.
+                            (default: 30)
+        cache           :   cenpy.cache.ResponseCache or None
+                            where to store successful responses to GET requests, so
+                            that repeated requests are answered without the network.
+                            (default: None, which does not cache responses)
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_sizes = dict(_default_pool_sizes)
+        if pool_sizes is not None:
+            self.pool_sizes.update(pool_sizes)
+        self.timeout = timeout
+        self.compress = compress
+        self.headers = dict() if headers is None else dict(headers)
+        _check_rate(rate)
+        self.rate = rate
+        self.burst = burst
+        self.retry = RetryPolicy() if retry is None else retry
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.cache = cache
+        self._breakers = dict()
+        self._rate_limits = dict()
+        self._limiters = dict()
+        self._session = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "Transport(pool_maxsize={}, pool_sizes={}, timeout={})".format(
+            self.pool_maxsize, self.pool_sizes, self.timeout
+        )
+
+    @property
+    def session(self):
+        """the underlying requests.Session, built on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self):
+        session = r.Session()
+        session.headers["Accept-Encoding"] = (
+            _accept_encoding if self.compress else "identity"
+        )
+        session.headers.update(self.headers)
+        default = HTTPAdapter(
+            pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize
+        )
+        session.mount("http://", default)
+        session.mount("https://", default)
+        for host, size in diter(self.pool_sizes):
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            session.mount("http://{}/".format(host), adapter)
+            session.mount("https://{}/".format(host), adapter)
+        return session
+
+    def set_pool_size(self, host, size):
+        """
+        Set the number of connections kept open to a host.
+
+        Parameters
+        ----------
+        host    :   str
+                    name of the host, like "api.census.gov"
+        size    :   int
+                    number of connections to keep open
+        """
+        self.pool_sizes[host] = size
+        self.close()
+
+    def set_rate_limit(self, rate, burst=None, key=None):
+        """
+        Set the rate at which requests are made with an API key.
+
+        Parameters
+        ----------
+        rate    :   float or None
+                    number of requests allowed per second. If None, requests
+                    with this key are not limited.
+        burst   :   int
+                    number of requests that may be made at once before pacing begins.
+        key     :   str
+                    the API key to limit. If not provided, this sets the default
+                    limit, used for requests without a key and keys without a limit of their own.
+
+        Returns
+        -------
+        the RateLimiter for the key
+        """
+        _check_rate(rate)
+        with self._lock:
+            if key is None:
+                self.rate, self.burst = rate, burst
+                # keys without limits of their own pick up the new default
+                self._limiters = {
+                    k: v for k, v in diter(self._limiters) if k in self._rate_limits
+                }
+            else:
+                self._rate_limits[key] = (rate, burst)
+                self._limiters.pop(key, None)
+        return self.limiter("" if key is None else key)
+
+    def limiter(self, key=""):
+        """
+        The RateLimiter shared by all requests made with an API key.
+
+        Parameters
+        ----------
+        key     :   str
+                    the API key. Requests without a key share the limiter for "".
+        """
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            with self._lock:
+                rate, burst = self._rate_limits.get(key, (self.rate, self.burst))
+                limiter = self._limiters.setdefault(
+                    key, RateLimiter(rate=rate, burst=burst)
+                )
+        return limiter
+
+    def breaker(self, host):
+        """
+        The CircuitBreaker guarding requests to a host.
+
+        Parameters
+        ----------
+        host    :   str
+                    name of the host, like "api.census.gov"
+        """
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    host,
+                    CircuitBreaker(
+                        host,
+                        failure_threshold=self.failure_threshold,
+                        reset_timeout=self.reset_timeout,
+                    ),
+                )
+        return breaker
+
+    def request(self, method, url, params=None, retry_on=None, **kwargs):
+        """
+        Make a request through the pooled session.
+
+        Parameters
+        ----------
+        method  :   str
+                    HTTP method, like "GET"
+        url     :   str
+                    location to request
+        params  :   dict
+                    query parameters to encode into the url
+        retry_on:   callable
+                    function of a response that returns True if the response
+                    is malformed and should be retried, even though its status
+                    code indicates success.
+        **kwargs:   passed to requests.Session.request. If no timeout is
+                    provided, the transport's timeout is used.
+
+        Returns
+        -------
+        requests.Response
+
+        Notes
+        -----
+        Requests are paced by the RateLimiter for the API key sent in the
+        `key` query parameter, either in the url or in params.
+
+        Failed requests are retried according to the transport's RetryPolicy,
+        and every failure counts towards opening the CircuitBreaker for the host.
+        While a breaker is open, requests wait for it to let requests through
+        again if they have retries left, or raise a CircuitOpenError otherwise.
+        Once it is half-open, one request probes the host while the others wait.
+        If all retries fail on a retried status code, the last response is
+        returned, so that the caller can inspect or raise it.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        limiter = self.limiter(_api_key(url, params))
+        breaker = self.breaker(urlsplit(url).netloc)
+        attempt = 0
+        while True:
+            try:
+                breaker.check()
+            except CircuitOpenError as e:
+                if attempt >= self.retry.total:
+                    raise
+                time.sleep(e.retry_in)
+                attempt += 1
+                continue
+            limiter.acquire()
+            try:
+                response = self.session.request(method, url, params=params, **kwargs)
+            except self.retry.exceptions:
+                breaker.record_failure()
+                if attempt >= self.retry.total:
+                    raise
+                time.sleep(self.retry.backoff(attempt))
+                attempt += 1
+                continue
+            failed = response.status_code in self.retry.statuses
+            if not failed and retry_on is not None and response.ok:
+                failed = retry_on(response)
+            if not failed:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt >= self.retry.total:
+                return response
+            # release the connection of a streamed response before trying again
+            response.close()
+            time.sleep(self.retry.backoff(attempt, response))
+            attempt += 1
+
+    def get(self, url, params=None, **kwargs):
+        """
+        Make a GET request through the pooled session. See Transport.request
+
+        If the transport has a cache, a fresh stored response is returned
+        without making a request, and successful responses are stored. The
+        body of a streamed response (stream=True) is stored once it has been
+        read to the end, so that storing it does not read it all up front.
+        """
+        if self.cache is None:
+            return self.request("GET", url, params=params, **kwargs)
+        cached = self.cache.get(url, params)
+        if cached is not None:
+            return cached
+        response = self.request("GET", url, params=params, **kwargs)
+        retry_on = kwargs.get("retry_on")
+        if response.status_code == 200 and not (retry_on and retry_on(response)):
+            if kwargs.get("stream"):
+                _store_when_read(
+                    response,
+                    lambda content: self.cache.set(response, url, params, content),
+                )
+            else:
+                self.cache.set(response, url, params)
+        return response
+
+    def read(self, url, reader, params=None, errors=(), **kwargs):
+        """
+        Make a GET request and read its response, retrying when the body fails
+        partway through. See Transport.get
+
+        Parameters
+        ----------
+        url     :   str
+                    location to request
+        reader  :   callable
+                    function of the response that reads its body, returning the result
+        params  :   dict
+                    query parameters to encode into the url
+        errors  :   tuple of Exception classes
+                    exceptions raised by reader, besides broken connections, after
+                    which the request is made and read again, like errors parsing
+                    a body that was cut short.
+        **kwargs:   passed to Transport.get
+
+        Returns
+        -------
+        the result of reader(response)
+
+        Notes
+        -----
+        Failures while reading count towards opening the CircuitBreaker for the
+        host, and are retried according to the transport's RetryPolicy, on top of
+        the retries made for the request itself. Responses answered from the
+        cache are not read again. The response is closed once it has been read.
+        """
+        breaker = self.breaker(urlsplit(url).netloc)
+        errors = _read_errors + self.retry.exceptions + tuple(errors)
+        attempt = 0
+        while True:
+            response = self.get(url, params=params, **kwargs)
+            try:
+                return reader(response)
+            except errors:
+                if getattr(response, "from_cache", False):
+                    raise
+                breaker.record_failure()
+                if attempt >= self.retry.total:
+                    raise
+            finally:
+                response.close()
+            time.sleep(self.retry.backoff(attempt))
+            attempt += 1
+
+    def close(self):
+        """Close all pooled connections. They are reopened as needed."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+
+# raised when the connection breaks while a body is being read
+_read_errors = (r.exceptions.ChunkedEncodingError, r.ConnectionError)
+
+
+def _store_when_read(response, store):
+    """
+    tee the body of a streamed response as it is read, calling store with the
+    body once it has been read to the end. Responses that are not read to the
+    end are not stored.
+    """
+    iter_content = response.iter_content
+    read = False
+
+    def tee(chunk_size=1, decode_unicode=False):
+        nonlocal read
+        if decode_unicode or read:
+            yield from iter_content(
+                chunk_size=chunk_size, decode_unicode=decode_unicode
+            )
+            return
+        body = []
+        for chunk in iter_content(chunk_size=chunk_size):
+            body.append(chunk)
+            yield chunk
+        read = True
+        store(b"".join(body))
+
+    response.iter_content = tee
+
+
+def _check_rate(rate):
+    """raise a ValueError for a rate at which no requests could ever be made"""
+    if rate is not None and rate <= 0:
+        raise ValueError(
+            "rate must be a positive number of requests per second, or None for"
+            " no limit, not {!r}".format(rate)
+        )
+
+
+def _retry_after(response):
+    """the number of seconds a host asked to wait in its Retry-After header, if any"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, moment.timestamp() - time.time())
+
+
+def _api_key(url, params=None):
+    """find the API key sent with a request, or "" if there is none"""
+    if params is not None and "key" in params:
+        return params["key"]
+    query = urlsplit(url).query
+    if "key=" not in query:
+        return ""
+    return parse_qs(query).get("key", [""])[0]
+
+
+_transport = None
+
+
+def get_transport():
+    """
+    The Transport used by cenpy for all network calls.
+
+    Returns
+    -------
+    the shared Transport, created with default settings on first use
+    """
+    global _transport
+    if _transport is None:
+        _transport = Transport()
+    return _transport
+
+
+def set_transport(transport):
+    """
+    Replace the Transport used by cenpy for all network calls.
+
+    Parameters
+    ----------
+    transport   :   Transport
+                    the transport to use from now on.
+
+    Returns
+    -------
+    the Transport that was replaced, so that it can be restored later
+    """
+    global _transport
+    previous = get_transport()
+    _transport = transport
+    return previous
+
+
+def get(url, params=None, **kwargs):
+    """Make a GET request through the shared Transport. See Transport.request"""
+    return get_transport().get(url, params=params, **kwargs)
+
+
+def read(url, reader, params=None, **kwargs):
+    """Make a GET request and read it through the shared Transport. See Transport.read"""
+    return get_transport().read(url, reader, params=params, **kwargs)
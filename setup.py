@@ -28,10 +28,11 @@ setup(
     author="Levi John Wolf",
     author_email="levi.john.wolf@gmail.com",
     license="3-Clause BSD",
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     packages=[package],
     install_requires=reqs,
-    package_data={package: ["stfipstable.csv"]},
+    extras_require={"arrow": ["pyarrow"]},
+    package_data={package: ["stfipstable.csv", "*.parquet"]},
     zip_safe=False,
     classifiers=[
         "Development Status :: 5 - Production/Stable",
@@ -42,7 +43,6 @@ setup(
         "Topic :: Scientific/Engineering :: GIS",
         "License :: OSI Approved :: BSD License",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",